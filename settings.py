@@ -127,9 +127,9 @@ INSTALLED_APPS = (
     'django.contrib.humanize',
 )
 
-# A sample logging configuration. The only tangible logging
-# performed by this configuration is to send an email to
-# the site admins on every HTTP 500 error.
+# A sample logging configuration. It sends an email to the site admins on
+# every HTTP 500 error and writes the progress and the reports of the
+# ingestion (updates, management commands and the worker) to stderr.
 # See http://docs.djangoproject.com/en/dev/topics/logging for
 # more details on how to customize your logging configuration.
 LOGGING = {
@@ -139,8 +139,16 @@ LOGGING = {
         'mail_admins': {
             'level': 'ERROR',
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler'
         }
     },
+    'root': {
+        'handlers': ['console'],
+        'level': 'INFO',
+    },
     'loggers': {
         'django.request': {
             'handlers': ['mail_admins'],
@@ -149,3 +157,43 @@ LOGGING = {
         },
     }
 }
+
+# Number of revisions buffered by the ingestion before they are written to
+# the database in a single transaction.
+SVNSTATS_BATCH_REVS = 100
+
+# Maximum number of path -> id entries kept in memory by the ingestion.
+SVNSTATS_PATH_CACHE_SIZE = 100000
+
+# Number of threads querying the repository (path types, binary checks and
+# diffs) during ingestion. 0 processes the revisions one after another.
+SVNSTATS_INGEST_WORKERS = 4
+
+# Lifetime (seconds) of the lease a worker holds on a project while updating
+# it. Leases are renewed while the update runs; a crashed worker frees the
+# project when its lease expires.
+SVNSTATS_LEASE_SECONDS = 600
+
+# Number of projects the ingestion worker updates at the same time.
+SVNSTATS_WORKER_CONCURRENCY = 1
+
+# Maximum number of pysvn clients (connections) used by one project update.
+# Needs one client more than SVNSTATS_INGEST_WORKERS for the log fetch and one
+# for the updating thread. With less than 3 the revisions are processed one by one.
+SVNSTATS_CLIENT_POOL_SIZE = 6
+
+# Files larger than this (bytes) are not diffed or counted during ingestion.
+# They are stored as skipped and can be counted later with the recountskipped
+# command. A project can override it, 0 is no limit.
+SVNSTATS_MAX_FILE_SIZE = 4*1024*1024
+
+# Record call counts, bytes and time of the repository calls and of the
+# ingestion phases. Every update stores its numbers as an IngestRun and prints
+# a summary. Off by default, it costs nothing when disabled.
+SVNSTATS_PROFILE = False
+
+# The dashboard pages are cached under the version of the stored statistics,
+# which moves whenever a project update completes. Cached pages of old versions
+# expire after this time (seconds). Configure a shared cache (CACHES) to serve
+# all the web processes from one copy.
+SVNSTATS_DASHBOARD_CACHE_SECONDS = 24*3600
@@ -1,14 +1,21 @@
-from models import Project, SVNLog, SVNAuthor
+from models import Project, SVNLog, SVNAuthor, IngestJob, IngestRun, IngestRunStat
 from django.contrib import admin
+from jobs import enqueue
 
 class ProjectAdmin(admin.ModelAdmin):
-    list_display = ['name', 'desc', 'repository', 'updatedate']
+    list_display = ['name', 'desc', 'repository', 'updatedate', 'isUpdating']
     actions = ['update']
 
     def update(self, request, queryset):
         for project in queryset:
-            if not project.updating:
-                project.update()
+            enqueue(project)
+        self.message_user(request, 'Queued update of %d project(s)' % len(queryset))
+
+    def save_model(self, request, obj, form, change):
+        obj.save()
+        #the stored revisions are recounted with the new excludes by the next update.
+        if( change and 'excludes' in form.changed_data):
+            enqueue(obj)
 
 class SVNLogAdmin(admin.ModelAdmin):
     list_display = ['revno', 'author', 'commitdate']
@@ -16,7 +23,21 @@ class SVNLogAdmin(admin.ModelAdmin):
 class SVNAuthorAdmin(admin.ModelAdmin):
     list_display = ['author', 'display']
 
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ['project', 'state', 'priority', 'created', 'started', 'finished']
+    list_filter = ['state']
+
+class IngestRunStatInline(admin.TabularInline):
+    model = IngestRunStat
+    extra = 0
+
+class IngestRunAdmin(admin.ModelAdmin):
+    list_display = ['project', 'started', 'finished', 'fromrev', 'torev', 'ok']
+    list_filter = ['project']
+    inlines = [IngestRunStatInline]
+
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(SVNLog, SVNLogAdmin)
 admin.site.register(SVNAuthor, SVNAuthorAdmin)
-
+admin.site.register(IngestJob, IngestJobAdmin)
+admin.site.register(IngestRun, IngestRunAdmin)
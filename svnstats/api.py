@@ -0,0 +1,171 @@
+'''
+api.py
+
+JSON time series of the lines and commits of a project or of an author, bucketed by
+day, week (starting on monday) or month, and the churn of a directory of a project and
+of its subdirectories. The series are summed from the daily author totals
+(AuthorDayRollup), the churn from the directory churn (DirChurnRollup), never from the
+detail rows. The responses carry an ETag and Last-Modified of the last completed
+ingestion, hence polling clients get a 304 until the next update, and the buckets are
+streamed while the rows are read.
+
+    /api/projects/<id>/series/?bucket=week&start=2012-01-01&end=2012-07-01
+    /api/authors/<author>/series/?bucket=month&project=<id>
+    /api/projects/<id>/churn/?path=/trunk/src&start=2012-01-01&end=2012-04-01
+
+'start' is inclusive and 'end' exclusive. By default the series end today (included)
+and start a year earlier, the churn starts a quarter earlier.
+'''
+
+import datetime
+import hashlib
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.utils import simplejson
+from django.views.decorators.http import condition, require_GET
+from django.db.models import Sum
+
+from models import Project, SVNAuthor, AuthorDayRollup
+import churn
+import dashboard
+
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_DAYS = 365
+#default range of the directory churn, about a quarter.
+CHURN_DAYS = 91
+
+def bucketStart(day, bucket):
+    '''
+    first day of the bucket of 'day'.
+    '''
+    if( bucket == 'week'):
+        return(day - datetime.timedelta(days=day.weekday()))
+    if( bucket == 'month'):
+        return(day.replace(day=1))
+    return(day)
+
+def parseDate(value):
+    return(datetime.datetime.strptime(value, '%Y-%m-%d').date())
+
+def getDates(request, days=DEFAULT_DAYS):
+    '''
+    (start, end) of the request, by default the 'days' days upto today. Raises
+    ValueError for invalid dates.
+    '''
+    end = datetime.date.today() + datetime.timedelta(days=1)
+    if( request.GET.get('end')):
+        end = parseDate(request.GET['end'])
+    start = end - datetime.timedelta(days=days)
+    if( request.GET.get('start')):
+        start = parseDate(request.GET['start'])
+    if( start >= end):
+        raise ValueError('start must be before end')
+    return(start, end)
+
+def getRange(request):
+    '''
+    (bucket, start, end) of the request. Raises ValueError for invalid parameters.
+    '''
+    bucket = request.GET.get('bucket', 'day')
+    if( bucket not in BUCKETS):
+        raise ValueError('bucket must be one of %s' % ', '.join(BUCKETS))
+    start, end = getDates(request)
+    return(bucket, start, end)
+
+def iterBuckets(rows, bucket):
+    '''
+    sum the rows (day, lines added, lines deleted, commits), ordered by day, into buckets.
+    '''
+    current = None
+    for day, linesadded, linesdeleted, commits in rows:
+        start = bucketStart(day, bucket)
+        if( current is not None and current['start'] != start):
+            yield current
+            current = None
+        if( current is None):
+            current = dict(start=start, linesadded=0, linesdeleted=0, commits=0)
+        current['linesadded'] = current['linesadded'] + (linesadded or 0)
+        current['linesdeleted'] = current['linesdeleted'] + (linesdeleted or 0)
+        current['commits'] = current['commits'] + (commits or 0)
+    if( current is not None):
+        yield current
+
+def streamSeries(header, rows, bucket):
+    '''
+    yield the JSON document: the header fields and the 'series' list, one bucket at a time.
+    '''
+    dumps = simplejson.dumps
+    yield dumps(header)[:-1] + ', "series": ['
+    separator = ''
+    for item in iterBuckets(rows, bucket):
+        item['start'] = item['start'].isoformat()
+        yield separator + dumps(item)
+        separator = ', '
+    yield ']}'
+
+def getRows(rollups, start, end):
+    '''
+    iterate over (day, lines added, lines deleted, commits) of the days start <= day < end.
+    '''
+    rollups = rollups.filter(day__gte=start, day__lt=end).values('day')
+    rollups = rollups.annotate(sumadded=Sum('linesadded'), sumdeleted=Sum('linesdeleted'), sumcommits=Sum('commits'))
+    for row in rollups.order_by('day').iterator():
+        yield (row['day'], row['sumadded'], row['sumdeleted'], row['sumcommits'])
+
+def seriesResponse(header, rollups, request):
+    try:
+        bucket, start, end = getRange(request)
+    except ValueError, e:
+        return(HttpResponseBadRequest(str(e)))
+    header.update(bucket=bucket, start=start.isoformat(), end=end.isoformat())
+    return(HttpResponse(streamSeries(header, getRows(rollups, start, end), bucket), mimetype='application/json'))
+
+def seriesEtag(request, *args, **kwargs):
+    '''
+    the data version and the query, changes when an ingestion completes. The default
+    range ends today, hence the day is part of it.
+    '''
+    return(hashlib.sha1('%s|%s|%s|%s' % (dashboard.getVersion(), datetime.date.today(), request.path,
+                                         request.GET.urlencode())).hexdigest())
+
+def seriesLastModified(request, *args, **kwargs):
+    '''
+    UTC time of the last change, the condition decorator formats it as HTTP-date.
+    '''
+    return(dashboard.getLastModified())
+
+@require_GET
+@condition(etag_func=seriesEtag, last_modified_func=seriesLastModified)
+def projectSeries(request, projectid):
+    project = get_object_or_404(Project, pk=projectid)
+    return(seriesResponse(dict(project=project.name), AuthorDayRollup.objects.filter(project=project), request))
+
+@require_GET
+@condition(etag_func=seriesEtag, last_modified_func=seriesLastModified)
+def authorSeries(request, author):
+    rollups = AuthorDayRollup.objects.filter(author=author)
+    header = dict(author=author, display=None)
+    displays = SVNAuthor.objects.filter(author=author).values_list('display', flat=True)
+    if( len(displays) > 0):
+        header['display'] = displays[0]
+    if( 'project' in request.GET):
+        try:
+            project = Project.objects.get(pk=int(request.GET['project']))
+        except (ValueError, Project.DoesNotExist):
+            return(HttpResponseBadRequest('unknown project'))
+        rollups = rollups.filter(project=project)
+        header['project'] = project.name
+    return(seriesResponse(header, rollups, request))
+
+@require_GET
+@condition(etag_func=seriesEtag, last_modified_func=seriesLastModified)
+def projectChurn(request, projectid):
+    project = get_object_or_404(Project, pk=projectid)
+    try:
+        start, end = getDates(request, CHURN_DAYS)
+    except ValueError, e:
+        return(HttpResponseBadRequest(str(e)))
+    total, children = churn.getChurn(project, request.GET.get('path'), start, end)
+    data = dict(project=project.name, start=start.isoformat(), end=end.isoformat(), total=total, children=children)
+    return(HttpResponse(simplejson.dumps(data), mimetype='application/json'))
@@ -0,0 +1,108 @@
+'''
+diffcount.py
+
+Benchmark of the streaming diff line counter (svnlogclient.getDiffLineCountDict)
+against the original line by line implementation. Generates a synthetic revision
+diff, checks that both counters return identical counts and prints the timings.
+
+    python -m svnstats.benchmarks.diffcount [--files N] [--lines N] [--repeat N]
+'''
+
+import logging
+import random
+import time
+from optparse import OptionParser
+from StringIO import StringIO
+
+from svnstats.svnclient.svnlogclient import getDiffLineCountDict, makeunicode
+
+def legacyDiffLineCountDict(diff_log):
+    '''
+    line by line diff counter used before the streaming counter. Kept as reference
+    for the benchmark.
+    '''
+    diff_log = makeunicode(diff_log)
+    diffio = StringIO(diff_log)
+    addlnCount=0
+    dellnCount=0
+    curfile=None
+    diffCountDict = dict()
+    newfilediffstart = 'Index: '
+    newfilepropdiffstart = 'Property changes on: '
+    for diffline in diffio:
+        diffline = diffline.rstrip()
+        if(diffline.find(newfilediffstart)==0):
+            if(curfile != None):
+                diffCountDict[curfile] = (addlnCount, dellnCount)
+            addlnCount = 0
+            dellnCount = 0
+            logging.debug(diffline)
+            curfile = u'/'+diffline[len(newfilediffstart):]
+        elif(diffline.find(newfilepropdiffstart)==0):
+            if(curfile != None):
+                diffCountDict[curfile] = (addlnCount, dellnCount)
+            curfile = u'/'+diffline[len(newfilepropdiffstart):]
+            if( curfile not in diffCountDict):
+                diffCountDict[curfile] = (0, 0)
+        elif(diffline.find('---')==0 or diffline.find('+++')==0 or diffline.find('@@')==0 or diffline.find('===')==0):
+            continue
+        elif(diffline.find('-')==0):
+            dellnCount = dellnCount+1
+        elif(diffline.find('+')==0):
+             addlnCount = addlnCount+1
+    if( curfile != None):
+        diffCountDict[curfile] = (addlnCount, dellnCount)
+    return(diffCountDict)
+
+CONTENT_LINES = ['int main(int argc, char** argv)', '{', '}', '    return 0;', '-- sql comment',
+                 '++i;', '', '    /* \xc3\xa9t\xc3\xa9 */', 'Index: not a header', '\t']
+
+def makeDiff(files, lines, seed=1):
+    '''
+    generate a revision diff with 'files' file sections of about 'lines' lines each.
+    '''
+    rnd = random.Random(seed)
+    out = []
+    for fileno in range(files):
+        path = 'trunk/src/module%d/file%d.c' % (fileno % 17, fileno)
+        out.append('Index: %s\n' % path)
+        out.append('=' * 67 + '\n')
+        out.append('--- %s\t(revision 10)\n' % path)
+        out.append('+++ %s\t(revision 11)\n' % path)
+        out.append('@@ -1,%d +1,%d @@\n' % (lines, lines))
+        for lineno in range(lines):
+            out.append(rnd.choice(' +-') + rnd.choice(CONTENT_LINES) + rnd.choice(['\n', '\r\n']))
+        if( fileno % 5 == 0):
+            out.append('\nProperty changes on: %s\n' % path)
+            out.append('_' * 67 + '\n')
+            out.append('Added: svn:eol-style\n## -0,0 +1 ##\n+native\n')
+    return(''.join(out))
+
+def timeit(func, data, repeat):
+    best = None
+    for idx in range(repeat):
+        start = time.time()
+        result = func(data)
+        elapsed = time.time() - start
+        if( best is None or elapsed < best):
+            best = elapsed
+    return(best, result)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--files', type='int', default=2000)
+    parser.add_option('--lines', type='int', default=200)
+    parser.add_option('--repeat', type='int', default=3)
+    options, args = parser.parse_args()
+
+    diff = makeDiff(options.files, options.lines)
+    print 'diff size : %.1f MB' % (len(diff)/(1024.0*1024.0))
+    legacytime, legacy = timeit(legacyDiffLineCountDict, diff, options.repeat)
+    streamtime, streamed = timeit(getDiffLineCountDict, diff, options.repeat)
+    assert(legacy == streamed), 'line counts differ'
+    print 'line by line : %.3f s' % legacytime
+    print 'streaming    : %.3f s' % streamtime
+    print 'speedup      : %.1fx' % (legacytime/streamtime)
+
+if __name__ == '__main__':
+    main()
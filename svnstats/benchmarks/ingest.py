@@ -0,0 +1,317 @@
+'''
+ingest.py
+
+Benchmark of the project ingestion (Project.update) over generated local file://
+repositories. The repository history is generated from a seed as a dump stream and
+loaded with 'svnadmin load', hence the same options always give the same repository.
+Measures a full ingestion and an incremental one (the last revisions added to an
+already ingested repository) and reports revisions/sec, repository calls (from the
+ingestion profiler) and the peak RSS of each of them, sampled while it runs. Results are written as JSON and can be compared with
+an earlier run. Needs 'svnadmin' on the path; run through the management command
+
+    python manage.py benchingest [--revisions N] [--files N] [--output result.json]
+                                 [--compare earlier.json]
+'''
+
+import datetime
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from svnstats.benchmarks.diffcount import CONTENT_LINES
+
+class RepoShape:
+    '''
+    shape of the generated history. Every revision changes 'files' files with about
+    'lines' lines each; every 'branchevery' revisions trunk is copied to a branch,
+    every 'binaryevery'th added file is binary and every 'deleteevery'th change is a delete.
+    '''
+    def __init__(self, revisions=200, files=10, lines=100, branchevery=50, binaryevery=10,
+                 deleteevery=20, modules=10, seed=1):
+        self.revisions = revisions
+        self.files = files
+        self.lines = lines
+        self.branchevery = branchevery
+        self.binaryevery = binaryevery
+        self.deleteevery = deleteevery
+        self.modules = modules
+        self.seed = seed
+
+    def asdict(self):
+        return(dict(self.__dict__))
+
+def _props(props):
+    out = []
+    for key, value in sorted(props.items()):
+        out.append('K %d\n%s\nV %d\n%s\n' % (len(key), key, len(value), value))
+    out.append('PROPS-END\n')
+    return(''.join(out))
+
+def dumpNode(path, kind, action, text=None, props=None, copyfrom=None):
+    headers = ['Node-path: %s\n' % path]
+    if( kind is not None):
+        headers.append('Node-kind: %s\n' % kind)
+    headers.append('Node-action: %s\n' % action)
+    if( copyfrom is not None):
+        headers.append('Node-copyfrom-rev: %d\nNode-copyfrom-path: %s\n' % (copyfrom[1], copyfrom[0]))
+    content = ''
+    if( props is not None):
+        propblock = _props(props)
+        headers.append('Prop-content-length: %d\n' % len(propblock))
+        content = content + propblock
+    if( text is not None):
+        headers.append('Text-content-length: %d\n' % len(text))
+        content = content + text
+    if( props is not None or text is not None):
+        headers.append('Content-length: %d\n' % len(content))
+    return(''.join(headers) + '\n' + content + '\n\n')
+
+def dumpRevision(revno, author, date, message):
+    propblock = _props({'svn:author':author, 'svn:date':date.strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                        'svn:log':message})
+    return('Revision-number: %d\nProp-content-length: %d\nContent-length: %d\n\n%s\n' % \
+                (revno, len(propblock), len(propblock), propblock))
+
+def _text(rnd, lines):
+    count = max(1, int(rnd.gauss(lines, lines/4.0)))
+    return(''.join([rnd.choice(CONTENT_LINES) + '\n' for idx in range(count)]))
+
+def _modify(rnd, text):
+    lines = text.splitlines(True)
+    for idx in range(rnd.randint(1, 10)):
+        pos = rnd.randint(0, len(lines))
+        if( rnd.random() < 0.5 and pos < len(lines)):
+            del lines[pos]
+        else:
+            lines.insert(pos, rnd.choice(CONTENT_LINES) + '\n')
+    return(''.join(lines))
+
+def generateRevisions(shape):
+    '''
+    yield (revno, dump records of the revision). Same shape, same history.
+    '''
+    rnd = random.Random(shape.seed)
+    authors = ['alice', 'bob', 'carol', 'dave', 'erin']
+    start = datetime.datetime(2011, 1, 1)
+    files = dict()
+    fileno = 0
+    branches = 0
+    for revno in range(1, shape.revisions+1):
+        records = [dumpRevision(revno, rnd.choice(authors), start + datetime.timedelta(hours=revno),
+                                 'revision %d' % revno)]
+        if( revno == 1):
+            for path in ['trunk', 'branches', 'trunk/src']:
+                records.append(dumpNode(path, 'dir', 'add', props={}))
+            for module in range(shape.modules):
+                records.append(dumpNode('trunk/src/mod%d' % module, 'dir', 'add', props={}))
+        elif( shape.branchevery and revno % shape.branchevery == 0):
+            branches = branches+1
+            records.append(dumpNode('branches/b%d' % branches, 'dir', 'add', copyfrom=('trunk', revno-1)))
+            yield revno, records
+            continue
+
+        for idx in range(shape.files):
+            existing = sorted(files.keys())
+            if( len(existing) > shape.files and shape.deleteevery and rnd.randint(1, shape.deleteevery) == 1):
+                path = rnd.choice(existing)
+                del files[path]
+                records.append(dumpNode(path, 'file', 'delete'))
+            elif( len(existing) > shape.files and rnd.random() < 0.7):
+                path = rnd.choice(existing)
+                if( files[path] is None):
+                    continue
+                files[path] = _modify(rnd, files[path])
+                records.append(dumpNode(path, 'file', 'change', text=files[path]))
+            else:
+                fileno = fileno+1
+                module = 'trunk/src/mod%d' % (fileno % shape.modules)
+                if( shape.binaryevery and fileno % shape.binaryevery == 0):
+                    data = ''.join([chr(rnd.randint(0, 255)) for idx in range(shape.lines*20)])
+                    #alternate between binary detection by extension and by svn:mime-type
+                    if( fileno % 2 == 0):
+                        path = '%s/image%d.png' % (module, fileno)
+                        props = {}
+                    else:
+                        path = '%s/data%d.dat' % (module, fileno)
+                        props = {'svn:mime-type':'application/octet-stream'}
+                    files[path] = None
+                    records.append(dumpNode(path, 'file', 'add', text=data, props=props))
+                else:
+                    path = '%s/file%d.c' % (module, fileno)
+                    files[path] = _text(rnd, shape.lines)
+                    records.append(dumpNode(path, 'file', 'add', text=files[path], props={}))
+        yield revno, records
+
+def writeDump(shape, out, startrev=1, endrev=None):
+    '''
+    write the revisions startrev..endrev of the generated history as a dump stream.
+    '''
+    if( endrev is None):
+        endrev = shape.revisions
+    out.write('SVN-fs-dump-format-version: 2\n\n')
+    for revno, records in generateRevisions(shape):
+        if( revno > endrev):
+            break
+        if( revno >= startrev):
+            for record in records:
+                out.write(record)
+
+def loadDump(path, dump):
+    '''
+    create the repository 'path' if required and load the dump stream (a file object)
+    into it. Returns the file:// url of the repository.
+    '''
+    if( not os.path.exists(path)):
+        subprocess.check_call(['svnadmin', 'create', path])
+    subprocess.check_call(['svnadmin', 'load', '-q', path], stdin=dump)
+    return('file://' + os.path.abspath(path))
+
+def loadRepository(path, shape, startrev=1, endrev=None):
+    '''
+    create the repository 'path' if required and load the given revision range into it.
+    '''
+    dump = tempfile.TemporaryFile()
+    try:
+        writeDump(shape, dump, startrev, endrev)
+        dump.seek(0)
+        return(loadDump(path, dump))
+    finally:
+        dump.close()
+
+def peakRss():
+    '''
+    peak resident set size of the process in KB (Linux reports KB, Mac OS bytes).
+    '''
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def currentRss():
+    '''
+    resident set size of the process in KB, None if /proc is not available.
+    '''
+    try:
+        statm = open('/proc/self/statm')
+    except IOError:
+        return(None)
+    try:
+        pages = int(statm.read().split()[1])
+    finally:
+        statm.close()
+    return(pages * resource.getpagesize() / 1024)
+
+class RssSampler:
+    '''
+    peak resident set size while a phase runs, sampled by a thread every 'interval'
+    seconds. getrusage only reports the peak of the whole process, which every later
+    phase would inherit from the full ingestion. Without /proc the process peak is
+    reported.
+    '''
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start = currentRss()
+        self.peak = self.start
+        if( self.start is not None):
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if( self.thread is not None):
+            self.stopped.set()
+            self.thread.join()
+            self._sample()
+        else:
+            self.start = 0
+            self.peak = peakRss()
+        return(False)
+
+    def _sample(self):
+        self.peak = max(self.peak, currentRss())
+
+    def _run(self):
+        while( not self.stopped.wait(self.interval)):
+            self._sample()
+
+def ingest(project):
+    '''
+    update the project once and return the measurements. The repository calls are
+    taken from the IngestRun recorded by the profiler.
+    '''
+    from svnstats.models import SVNLog, IngestRun
+
+    before = SVNLog.objects.filter(project=project).count()
+    start = time.time()
+    with RssSampler() as rss:
+        project.update()
+    elapsed = time.time() - start
+    revisions = SVNLog.objects.filter(project=project).count() - before
+    run = IngestRun.objects.filter(project=project).order_by('-id')[0]
+    stats = dict([(stat.name, dict(calls=stat.calls, bytes=stat.bytes, seconds=stat.seconds))
+                        for stat in run.ingestrunstat_set.all()])
+    rpcs = sum([stat['calls'] for name, stat in stats.items() if name.startswith('svn.')])
+    return(dict(revisions=revisions, seconds=elapsed, revspersec=revisions/max(elapsed, 1e-6),
+                rpcs=rpcs, stats=stats, peakrss=rss.peak, startrss=rss.start))
+
+def runBenchmark(shape, incremental, workdir):
+    '''
+    full ingestion of the complete history, then ingestion of the last 'incremental'
+    revisions into a second project which already has the earlier revisions.
+    '''
+    import svnstats.pathcache
+    from svnstats.models import Project
+
+    def newProject(name, url):
+        project = Project(name=name, desc='benchmark', repository=url, username='', password='',
+                          updatedate=datetime.datetime.now())
+        project.save()
+        #every ingestion starts with an empty path cache, as in a new process.
+        svnstats.pathcache._pathcache = None
+        return(project)
+
+    result = dict(shape=shape.asdict(), incremental=incremental)
+    url = loadRepository(os.path.join(workdir, 'full'), shape)
+    result['full'] = ingest(newProject('bench-full', url))
+
+    split = max(1, shape.revisions - incremental)
+    path = os.path.join(workdir, 'incremental')
+    url = loadRepository(path, shape, 1, split)
+    project = newProject('bench-incremental', url)
+    project.update()
+    loadRepository(path, shape, split+1)
+    svnstats.pathcache._pathcache = None
+    result['incremental'] = ingest(project)
+    return(result)
+
+def compare(old, new):
+    '''
+    lines comparing two benchmark results.
+    '''
+    lines = []
+    for phase in ('full', 'incremental'):
+        if( phase not in old or phase not in new):
+            continue
+        for key in ('revspersec', 'rpcs', 'peakrss'):
+            before = old[phase][key]
+            after = new[phase][key]
+            change = 0.0
+            if( before):
+                change = (after - before) * 100.0 / before
+            lines.append('%-12s %-10s %12.1f -> %12.1f (%+.1f%%)' % (phase, key, before, after, change))
+    return(lines)
+
+def makeWorkdir():
+    return(tempfile.mkdtemp(prefix='svnstatsbench'))
+
+def removeWorkdir(workdir):
+    shutil.rmtree(workdir, True)
@@ -0,0 +1,193 @@
+'''
+churn.py
+
+Churn of every directory (DirChurnRollup): lines added and deleted and commits per
+project, directory, author and day. A change counts for its directory and for every
+directory above it upto the repository root, hence the churn of a subtree is read
+from the rows of its top directory and the churn of its subdirectories from the rows
+with that directory as parent, without any path prefix scan. Excluded paths are not
+counted. SVNLogWriter adds the churn of a revision batch in the transaction which
+stores the batch, rollups.rebuildDays and rollups.rebuild rebuild it.
+'''
+
+from django.db.models import F, Sum, Count
+
+from models import SVNLogDetail, DirChurnRollup, hashPath
+from pathcache import chunks
+
+#counters of a churn row, in the order of a totals entry.
+COUNTERS = ('linesadded', 'linesdeleted', 'commits')
+ROOT = u'/'
+
+def getParent(dirpath):
+    '''
+    parent directory, None for the root.
+    '''
+    if( dirpath == ROOT):
+        return(None)
+    parent = dirpath.rsplit(u'/', 1)[0]
+    return(parent or ROOT)
+
+def getDirs(path, pathtype):
+    '''
+    the directories a change of 'path' counts for: the root, every directory on the way
+    to the path and the path itself if it is a directory.
+    '''
+    components = [component for component in path.split(u'/') if component]
+    if( pathtype != 'D'):
+        components = components[:-1]
+    dirs = [ROOT]
+    for idx in range(len(components)):
+        dirs.append(u'/' + u'/'.join(components[:idx+1]))
+    return(dirs)
+
+def addRevision(totals, author, commitdate, changes):
+    '''
+    add the churn of one revision to 'totals', a dictionary (dirpath, author, day) ->
+    list of COUNTERS. 'changes' are (path, pathtype, entrytype, lines added, lines deleted).
+    '''
+    day = commitdate.date()
+    touched = set()
+    for path, pathtype, entrytype, linesadded, linesdeleted in changes:
+        if( entrytype == 'X'):
+            continue
+        for dirpath in getDirs(path, pathtype):
+            key = (dirpath, author, day)
+            counts = totals.get(key)
+            if( counts is None):
+                counts = [0] * len(COUNTERS)
+                totals[key] = counts
+            counts[0] = counts[0] + (linesadded or 0)
+            counts[1] = counts[1] + (linesdeleted or 0)
+            if( dirpath not in touched):
+                counts[2] = counts[2]+1
+                touched.add(dirpath)
+
+def _newRollup(project, dirpath, author, day, counts):
+    parent = getParent(dirpath)
+    rollup = DirChurnRollup(project=project, dirpath=dirpath, dirhash=hashPath(dirpath),
+                            parenthash=parent is not None and hashPath(parent) or '',
+                            depth=len(getDirs(dirpath, 'D'))-1, author=author, day=day)
+    for name, value in zip(COUNTERS, counts):
+        setattr(rollup, name, value)
+    return(rollup)
+
+def addTotals(project, totals):
+    '''
+    add 'totals' to the stored churn of the project. The existing rows of the batch are
+    found with one query per chunk of directories; they are updated one by one, the
+    others are inserted together. Caller is responsible for transaction handling.
+    '''
+    from logwriter import bulkInsert
+
+    if( len(totals) == 0):
+        return
+    days = [day for dirpath, author, day in totals.keys()]
+    hashes = dict([(hashPath(dirpath), dirpath) for dirpath, author, day in totals.keys()])
+    existing = dict()
+    for chunk in chunks(hashes.keys()):
+        rows = DirChurnRollup.objects.filter(project=project, dirhash__in=chunk, day__gte=min(days), day__lte=max(days))
+        for rowid, dirhash, author, day in rows.values_list('id', 'dirhash', 'author', 'day'):
+            existing[(hashes[dirhash], author, day)] = rowid
+    created = []
+    for key, counts in totals.items():
+        rowid = existing.get(key)
+        if( rowid is None):
+            created.append(_newRollup(project, key[0], key[1], key[2], counts))
+        else:
+            increments = dict([(name, F(name)+value) for name, value in zip(COUNTERS, counts)])
+            DirChurnRollup.objects.filter(id=rowid).update(**increments)
+    bulkInsert(DirChurnRollup, created)
+
+def computeTotals(logs):
+    '''
+    churn of the revisions of the SVNLog queryset 'logs', from the stored rows.
+    '''
+    totals = dict()
+    details = SVNLogDetail.objects.filter(svnlog__in=logs).order_by('svnlog')
+    rows = details.values_list('svnlog', 'svnlog__author', 'svnlog__commitdate', 'changedpath__path', 'pathtype',
+                               'entrytype', 'linesadded', 'linesdeleted')
+    logid = None
+    changes = []
+    for row in rows.iterator():
+        if( row[0] != logid):
+            if( logid is not None):
+                addRevision(totals, author, commitdate, changes)
+            logid, author, commitdate = row[0], row[1], row[2]
+            changes = []
+        changes.append(row[3:])
+    if( logid is not None):
+        addRevision(totals, author, commitdate, changes)
+    return(totals)
+
+def rebuildDays(project, logs, days):
+    '''
+    replace the churn of the given days with the churn of 'logs', the stored revisions
+    of these days. Caller is responsible for transaction handling.
+    '''
+    from logwriter import bulkInsert
+
+    days = set(days)
+    totals = computeTotals(logs)
+    for chunk in chunks(sorted(days)):
+        DirChurnRollup.objects.filter(project=project, day__in=chunk).delete()
+    bulkInsert(DirChurnRollup, [_newRollup(project, dirpath, author, day, counts)
+                                    for (dirpath, author, day), counts in totals.items() if day in days])
+
+def rebuild(project, logs):
+    '''
+    replace all the churn of the project with the churn of 'logs', all its revisions.
+    '''
+    from logwriter import bulkInsert
+
+    totals = computeTotals(logs)
+    DirChurnRollup.objects.filter(project=project).delete()
+    bulkInsert(DirChurnRollup, [_newRollup(project, dirpath, author, day, counts)
+                                    for (dirpath, author, day), counts in totals.items()])
+
+def verify(project, logs):
+    '''
+    list of (dirpath, author, day, stored counters, computed counters) of the differences
+    between the stored churn and the churn of 'logs', all the revisions of the project.
+    '''
+    stored = dict()
+    rows = DirChurnRollup.objects.filter(project=project).values_list('dirpath', 'author', 'day', *COUNTERS)
+    for row in rows.iterator():
+        stored[row[:3]] = list(row[3:])
+    computed = computeTotals(logs)
+    differences = []
+    for key in sorted(set(stored.keys()) | set(computed.keys())):
+        if( stored.get(key) != computed.get(key)):
+            differences.append(key + (stored.get(key), computed.get(key)))
+    return(differences)
+
+def normalizeDir(dirpath):
+    dirpath = u'/' + (dirpath or u'').strip(u'/')
+    return(dirpath)
+
+def _summarize(rows):
+    return(rows.annotate(sumadded=Sum('linesadded'), sumdeleted=Sum('linesdeleted'), sumcommits=Sum('commits'),
+                         authors=Count('author', distinct=True)))
+
+def _asChurn(row, dirpath):
+    return(dict(path=dirpath, linesadded=row['sumadded'] or 0, linesdeleted=row['sumdeleted'] or 0,
+                commits=row['sumcommits'] or 0, authors=row['authors'] or 0))
+
+def getChurn(project, dirpath, start, end):
+    '''
+    churn of the subtree 'dirpath' on the days start <= day < end and of its
+    subdirectories, most lines changed first: (subtree churn, list of churn). A churn is
+    a dictionary of path, linesadded, linesdeleted, commits and authors.
+    '''
+    dirpath = normalizeDir(dirpath)
+    rows = DirChurnRollup.objects.filter(project=project, day__gte=start, day__lt=end)
+    total = _summarize(rows.filter(dirhash=hashPath(dirpath)).values('dirhash'))
+    total = list(total)
+    if( len(total) > 0):
+        total = _asChurn(total[0], dirpath)
+    else:
+        total = dict(path=dirpath, linesadded=0, linesdeleted=0, commits=0, authors=0)
+    children = [_asChurn(row, row['dirpath'])
+                    for row in _summarize(rows.filter(parenthash=hashPath(dirpath)).values('dirhash', 'dirpath'))]
+    children.sort(key=lambda churn: (-(churn['linesadded']+churn['linesdeleted']), -churn['commits'], churn['path']))
+    return(total, children)
@@ -0,0 +1,87 @@
+'''
+dashboard.py
+
+Versioned caching of the dashboard. The statistics change only when an ingestion
+stores revisions (the watermarks Project.lastrev move) or recounts stored ones (the
+project summaries change), and the names change when a project or an author is edited
+(DashboardEdits). The data version is derived from these, hence a change invalidates
+the cached pages of all the web processes without any TTL: requests simply look for
+keys of the new version, while updates which store nothing keep the pages. Old versions
+are never read again and expire from the cache.
+'''
+
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Count, Sum
+
+from models import Project, DashboardEdits
+
+#the cached entries of old versions are evicted after this time.
+DEFAULT_CACHE_SECONDS = 24*3600
+
+def getCacheSeconds():
+    return(getattr(settings, 'SVNSTATS_DASHBOARD_CACHE_SECONDS', DEFAULT_CACHE_SECONDS))
+
+def getEdits():
+    '''
+    (number of edits, time of the last edit) of the projects and authors.
+    '''
+    rows = list(DashboardEdits.objects.values_list('edits', 'modified')[:1])
+    if( len(rows) == 0):
+        return(0, None)
+    return(rows[0])
+
+def getVersion():
+    '''
+    version of the stored statistics: changes when revisions are stored or recounted,
+    and when a project or an author is added, edited or removed. One aggregate over
+    the projects and their summaries and one single row read.
+    '''
+    state = Project.objects.aggregate(count=Count('id'), lastid=Max('id'), lastrev=Sum('lastrev'),
+                                      revisions=Sum('projectsummary__revisions'),
+                                      linesadded=Sum('projectsummary__linesadded'),
+                                      linesdeleted=Sum('projectsummary__linesdeleted'))
+    return('%s-%s-%s-%s-%s-%s-%s' % (state['count'], state['lastid'], state['lastrev'], state['revisions'],
+                                     state['linesadded'], state['linesdeleted'], getEdits()[0]))
+
+def toUtc(value):
+    '''
+    naive UTC time of a naive local time (settings.TIME_ZONE). The HTTP dates are
+    formatted from the UTC time.
+    '''
+    return(datetime.datetime.utcfromtimestamp(time.mktime(value.timetuple())))
+
+def getLastModified():
+    '''
+    UTC time of the last change of the stored statistics or of the names, None without
+    projects.
+    '''
+    updated = Project.objects.aggregate(updated=Max('updatedate'))['updated']
+    edited = getEdits()[1]
+    if( updated is None or (edited is not None and edited > updated)):
+        updated = edited
+    if( updated is None):
+        return(None)
+    return(toUtc(updated))
+
+def cacheKey(name, version, *args):
+    '''
+    cache key of the entry 'name' of the given data version. Memcached keys must not
+    contain spaces, hence the version and the arguments are hashed.
+    '''
+    digest = hashlib.sha1('|'.join([str(version)] + [str(arg) for arg in args])).hexdigest()
+    return('svnstats.%s.%s' % (name, digest))
+
+def getCached(key, compute):
+    '''
+    return the cached value of 'key', calling compute() on a miss.
+    '''
+    value = cache.get(key)
+    if( value is None):
+        value = compute()
+        cache.set(key, value, getCacheSeconds())
+    return(value)
@@ -0,0 +1,161 @@
+'''
+jobs.py
+
+Background execution of project updates. The admin action and the 'enqueueupdate'
+command only create IngestJob rows, the 'ingestworker' command picks them up in
+priority order and runs up to 'concurrency' updates at the same time. A project is
+updated by at most one worker at a time, see Project.acquireLease.
+'''
+
+import datetime
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+import traceback
+
+from django.db import connection
+
+from models import Project, IngestJob, getLeaseOwner
+
+def enqueue(project, priority=0):
+    '''
+    queue an update of the project. If an update is already queued, only its priority
+    is raised. Returns the job.
+    '''
+    queued = IngestJob.objects.filter(project=project, state='Q')
+    if( len(queued) > 0):
+        job = queued[0]
+        if( priority > job.priority):
+            IngestJob.objects.filter(pk=job.pk).update(priority=priority)
+            job.priority = priority
+        return(job)
+    job = IngestJob(project=project, priority=priority)
+    job.save()
+    return(job)
+
+def claimNextJob(owner):
+    '''
+    take the queued job with the highest priority. The state change is a conditional
+    UPDATE, hence a job is never claimed by two workers.
+    '''
+    for job in IngestJob.objects.filter(state='Q').order_by('-priority', 'created')[:10]:
+        now = datetime.datetime.now()
+        count = IngestJob.objects.filter(pk=job.pk, state='Q').update(state='R', owner=owner, started=now)
+        if( count == 1):
+            job.state = 'R'
+            job.owner = owner
+            job.started = now
+            return(job)
+    return(None)
+
+def recoverJobs():
+    '''
+    fail the 'running' jobs whose worker died. Those jobs have lost their project lease.
+    '''
+    now = datetime.datetime.now()
+    for job in IngestJob.objects.filter(state='R').select_related('project'):
+        project = job.project
+        if( project.leaseowner != job.owner or project.leaseexpires is None or project.leaseexpires < now):
+            #the worker may not have acquired the lease yet. Give it a minute.
+            if( job.started is not None and now-job.started < datetime.timedelta(minutes=1)):
+                continue
+            IngestJob.objects.filter(pk=job.pk, state='R').update(state='F', finished=now,
+                                                                 error='worker lost the project lease')
+
+def runJob(job):
+    '''
+    execute one claimed job and record the result.
+    '''
+    state = 'D'
+    error = None
+    try:
+        if( not job.project.update(job.owner)):
+            state = 'F'
+            error = 'project is being updated by another worker'
+    except Exception:
+        logging.exception("Error in updating project %s" % job.project)
+        state = 'F'
+        error = traceback.format_exc()
+    IngestJob.objects.filter(pk=job.pk).update(state=state, finished=datetime.datetime.now(), error=error)
+    return(state == 'D')
+
+class JobRunner:
+    '''
+    polls the job queue and runs the jobs on up to 'concurrency' threads.
+    '''
+    def __init__(self, concurrency=1, poll=10):
+        self.concurrency = max(1, concurrency)
+        self.poll = poll
+        self.running = []
+
+    def run(self, once=False):
+        '''
+        run jobs until interrupted. If 'once' is True, return when the queue is empty.
+        '''
+        recoverJobs()
+        while True:
+            self.running = [thread for thread in self.running if thread.isAlive()]
+            started = False
+            if( len(self.running) < self.concurrency):
+                #lease owner is the name of the thread which runs the update.
+                thread = threading.Thread(target=self._work)
+                job = claimNextJob(getLeaseOwner() + ':' + thread.getName())
+                if( job is not None):
+                    thread.job = job
+                    thread.start()
+                    self.running.append(thread)
+                    started = True
+            if( not started):
+                if( once and len(self.running) == 0 and not IngestJob.objects.filter(state='Q').exists()):
+                    break
+                time.sleep(self.poll)
+
+    def _work(self):
+        job = threading.currentThread().job
+        try:
+            logging.info("Updating project %s" % job.project)
+            runJob(job)
+        finally:
+            #every thread has its own database connection.
+            connection.close()
+
+def _updateProject(projectid, since, until):
+    '''
+    entry point of the child process of updateInProcesses.
+    '''
+    project = Project.objects.get(pk=projectid)
+    ok = False
+    try:
+        ok = project.update(since=since, until=until)
+    except Exception:
+        logging.exception("Error in updating project %s" % project)
+    connection.close()
+    sys.exit(0 if ok else 1)
+
+def updateInProcesses(projects, jobs=1, since=None, until=None, poll=0.5):
+    '''
+    update every project in its own process, at most 'jobs' processes at a time.
+    Returns the list of projects whose update failed.
+    '''
+    pending = list(projects)
+    running = []
+    failed = []
+    while( len(pending) > 0 or len(running) > 0):
+        while( len(pending) > 0 and len(running) < max(1, jobs)):
+            project = pending.pop(0)
+            #the child must not share the database connection of the parent.
+            connection.close()
+            process = multiprocessing.Process(target=_updateProject, args=(project.pk, since, until),
+                                              name='update %s' % project.name)
+            process.start()
+            running.append((project, process))
+        time.sleep(poll)
+        for project, process in list(running):
+            if( not process.is_alive()):
+                process.join()
+                running.remove((project, process))
+                if( process.exitcode != 0):
+                    failed.append(project)
+    return(failed)
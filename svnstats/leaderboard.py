@@ -0,0 +1,93 @@
+'''
+leaderboard.py
+
+Author rankings of several time windows (e.g. the last 7, 30, 90 and 365 days) from
+the daily author totals. All the windows are summed in one grouped query over the
+days of the widest window, one conditional sum per window and counter; ranking and
+percentages are computed in memory. Hence a page costs the same number of queries
+whatever the number of windows.
+'''
+
+import datetime
+
+from django.db import connection
+
+from models import AuthorDayRollup, SVNAuthor
+
+DEFAULT_WINDOWS = (7, 30, 90, 365)
+COUNTERS = ('linesadded', 'linesdeleted', 'commits')
+
+class Window:
+    '''
+    the days start <= day < end, named 'name' in the results.
+    '''
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return('Window(%r, %s, %s)' % (self.name, self.start, self.end))
+
+def lastDays(days, today=None):
+    '''
+    window of the 'days' days before today. Today is not counted, its revisions are
+    still coming in.
+    '''
+    if( today is None):
+        today = datetime.date.today()
+    return(Window(days, today - datetime.timedelta(days=days), today))
+
+def getQuery(windows, project=None):
+    '''
+    (sql, params) of the leaderboard rows: one row per author active in any of the
+    windows with author, display name and the COUNTERS of every window.
+    '''
+    qn = connection.ops.quote_name
+    todb = connection.ops.value_to_db_date
+    columns = []
+    params = []
+    for window in windows:
+        for counter in COUNTERS:
+            columns.append('SUM(CASE WHEN r.%s >= %%s AND r.%s < %%s THEN r.%s ELSE 0 END)' % \
+                                (qn('day'), qn('day'), qn(counter)))
+            params.extend([todb(window.start), todb(window.end)])
+    where = 'r.%s >= %%s AND r.%s < %%s' % (qn('day'), qn('day'))
+    params.extend([todb(min([window.start for window in windows])), todb(max([window.end for window in windows]))])
+    if( project is not None):
+        where = where + ' AND r.%s = %%s' % qn('project_id')
+        params.append(project.pk)
+    sql = 'SELECT r.%s, a.%s, %s FROM %s r LEFT OUTER JOIN %s a ON a.%s = r.%s WHERE %s GROUP BY r.%s, a.%s' % \
+            (qn('author'), qn('display'), ', '.join(columns), qn(AuthorDayRollup._meta.db_table),
+             qn(SVNAuthor._meta.db_table), qn('author'), qn('author'), where, qn('author'), qn('display'))
+    return(sql, params)
+
+def getRows(windows, project=None):
+    cursor = connection.cursor()
+    cursor.execute(*getQuery(windows, project))
+    return(cursor.fetchall())
+
+def getLeaderboards(windows, project=None, count=10):
+    '''
+    dictionary window name -> the 'count' authors with the most lines added in the
+    window (of the project, or of all projects). An author is a dictionary of author,
+    display, linesadded, linesdeleted, commits and percent (lines added in percent of
+    the first author).
+    '''
+    boards = dict([(window.name, []) for window in windows])
+    if( len(windows) == 0):
+        return(boards)
+    for row in getRows(windows, project):
+        author, display = row[0], row[1]
+        for idx, window in enumerate(windows):
+            linesadded, linesdeleted, commits = [int(value or 0) for value in row[2+idx*3:5+idx*3]]
+            if( commits > 0):
+                boards[window.name].append(dict(author=author, display=display, linesadded=linesadded,
+                                                linesdeleted=linesdeleted, commits=commits, percent=0))
+    for name, coders in boards.items():
+        coders.sort(key=lambda coder: (-coder['linesadded'], -coder['linesdeleted'], coder['author']))
+        del coders[count:]
+        if( len(coders) > 0 and coders[0]['linesadded'] > 0):
+            for coder in coders:
+                coder['percent'] = coder['linesadded']*100/coders[0]['linesadded']
+    return(boards)
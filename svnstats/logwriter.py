@@ -0,0 +1,191 @@
+'''
+logwriter.py
+
+Batched write path for the svn log tables. Project.ConvertRevs used to save
+every SVNLog and SVNLogDetail row on its own, and every save was a separate
+autocommit transaction. SVNLogWriter buffers the rows of several revisions and
+writes them with multi-row inserts inside a single transaction, together with the
+daily author totals, the project summary and the directory churn (see rollups.py
+and churn.py).
+'''
+
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import AutoField
+
+from models import Project, SVNLog, SVNLogDetail
+import rollups
+import churn
+from svnclient.profiler import NULL_PROFILER
+
+DEFAULT_BATCH_REVS = 100
+
+def getBatchSize():
+    '''
+    number of revisions buffered before they are written to the database.
+    '''
+    return(getattr(settings, 'SVNSTATS_BATCH_REVS', DEFAULT_BATCH_REVS))
+
+def bulkInsert(model, rows):
+    '''
+    insert the given model instances with a single executemany call. Primary keys
+    of the instances are NOT updated. Caller is responsible for transaction handling.
+    '''
+    if( len(rows) == 0):
+        return
+    qn = connection.ops.quote_name
+    fields = [field for field in model._meta.local_fields if not isinstance(field, AutoField)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(model._meta.db_table),
+                ', '.join([qn(field.column) for field in fields]),
+                ', '.join(['%s'] * len(fields)))
+    params = [[field.get_db_prep_save(field.pre_save(row, True), connection=connection) for field in fields]
+                for row in rows]
+    cursor = connection.cursor()
+    cursor.executemany(sql, params)
+    transaction.set_dirty()
+
+class SVNLogWriter:
+    '''
+    buffers log and detail rows of a project and flushes them every 'batchsize' revisions.
+    Every flush also moves the project watermark (Project.lastrev) in the same transaction,
+    so a batch is either completely stored and counted as done, or not stored at all.
+    '''
+    def __init__(self, project, batchsize=None, pathcache=None, profiler=None):
+        if( batchsize is None):
+            batchsize = getBatchSize()
+        if( pathcache is None):
+            from pathcache import getPathCache
+            pathcache = getPathCache()
+        if( profiler is None):
+            profiler = NULL_PROFILER
+        self.project = project
+        self.pathcache = pathcache
+        self.profiler = profiler
+        self.batchsize = max(1, batchsize)
+        self.pending = []
+        self.lastrevno = None
+        self.watermark = None
+
+    def addRevision(self, revlog):
+        '''
+        collect the log row and the detail rows of one revision. Line counts (and hence
+        the svn calls) are evaluated here, the database is touched only on flush.
+        '''
+        #invalid revisions are not stored, but they are processed. Move the watermark past them.
+        self.lastrevno = revlog.revno
+        if( not revlog.isvalid()):
+            return
+        addedfiles, changedfiles, deletedfiles = revlog.changedFileCount()
+        svnlog = SVNLog(project = self.project,
+            revno = revlog.revno,
+            commitdate = revlog.date,
+            author = revlog.author,
+            msg = revlog.message,
+            addedfiles = addedfiles,
+            changedfiles = changedfiles,
+            deletedfiles = deletedfiles)
+
+        changes = []
+        with self.profiler.phase('collect revision'):
+            for change in revlog.getDiffLineCount(True):
+                copyfrompath, copyfromrev = change.copyfrom()
+                changes.append(dict(filename = change.filepath_unicode(),
+                                    changetype = change.change_type(),
+                                    linesadded = change.lc_added(),
+                                    linesdeleted = change.lc_deleted(),
+                                    copyfrompath = copyfrompath,
+                                    copyfromrev = copyfromrev,
+                                    pathtype = change.pathtype(),
+                                    entrytype = change.entrytype()))
+        self.pending.append((svnlog, changes))
+        if( len(self.pending) >= self.batchsize):
+            self.flush()
+
+    def flush(self):
+        '''
+        write all buffered revisions and the new watermark in one transaction.
+        '''
+        if( self.lastrevno is None or self.lastrevno == self.watermark):
+            return
+        #ids of the paths created by the transaction, cached only once it committed.
+        created = dict()
+        with self.profiler.phase('db write'):
+            with transaction.commit_on_success():
+                totals, dirtotals = self._write(self.pending, created)
+                with self.profiler.phase('db rollups'):
+                    rollups.addSummary(self.project, [svnlog for svnlog, changes in self.pending],
+                                       totals, self.lastrevno)
+                    rollups.addTotals(self.project, totals)
+                    churn.addTotals(self.project, dirtotals)
+                Project.objects.filter(pk=self.project.pk).update(lastrev=self.lastrevno)
+        self.pathcache.publish(created)
+        if( len(self.pending) > 0):
+            logging.info("Saved revisions %d - %d of %s" % (self.pending[0][0].revno, self.pending[-1][0].revno,
+                                                           self.project.name))
+        self.watermark = self.lastrevno
+        self.project.lastrev = self.lastrevno
+        self.pending = []
+
+    def close(self, lastrevno=None):
+        '''
+        flush the remaining revisions. 'lastrevno' is the last revision of the processed
+        range, it can be higher than the last revision seen by the writer.
+        '''
+        if( lastrevno is not None and (self.lastrevno is None or lastrevno > self.lastrevno)):
+            self.lastrevno = lastrevno
+        self.flush()
+
+    def _write(self, pending, created):
+        '''
+        insert the rows of the revisions and return their daily author totals and their
+        directory churn. The ids of the created paths are added to 'created'.
+        '''
+        totals = dict()
+        dirtotals = dict()
+        if( len(pending) == 0):
+            return(totals, dirtotals)
+        bulkInsert(SVNLog, [svnlog for svnlog, changes in pending])
+        #executemany doesnot return the ids of the inserted rows. Read them back in one query.
+        #Nothing above the watermark is stored, hence the revision range holds only this batch.
+        #A list of revisions would exceed the variable limit of sqlite for large batches.
+        logs = SVNLog.objects.filter(project=self.project, revno__gte=pending[0][0].revno,
+                                     revno__lte=pending[-1][0].revno)
+        logids = dict(logs.values_list('revno', 'id'))
+
+        paths = []
+        for svnlog, changes in pending:
+            for change in changes:
+                paths.append(change['filename'])
+                if change['copyfrompath'] is not None:
+                    paths.append(change['copyfrompath'])
+        with self.profiler.phase('db resolve paths'):
+            pathids = self.pathcache.resolve(paths, created)
+
+        details = []
+        for svnlog, changes in pending:
+            for change in changes:
+                detail = SVNLogDetail(svnlog_id = logids[svnlog.revno],
+                            changedpath_id = pathids[change['filename']],
+                            pathtype = change['pathtype'],
+                            changetype = change['changetype'],
+                            linesadded = change['linesadded'],
+                            linesdeleted = change['linesdeleted'],
+                            entrytype = change['entrytype'])
+                #recored copyfrom information if exists
+                if change['copyfrompath'] is not None:
+                    detail.copyfrompath = pathids[change['copyfrompath']]
+                    detail.copyfromrev = change['copyfromrev']
+                details.append(detail)
+        bulkInsert(SVNLogDetail, details)
+
+        for svnlog, changes in pending:
+            rollups.addRevision(totals, svnlog.author, svnlog.commitdate,
+                                sum([change['linesadded'] for change in changes]),
+                                sum([change['linesdeleted'] for change in changes]),
+                                svnlog.addedfiles, svnlog.changedfiles, svnlog.deletedfiles)
+            churn.addRevision(dirtotals, svnlog.author, svnlog.commitdate,
+                              [(change['filename'], change['pathtype'], change['entrytype'],
+                                change['linesadded'], change['linesdeleted']) for change in changes])
+        return(totals, dirtotals)
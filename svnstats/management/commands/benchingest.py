@@ -0,0 +1,75 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import simplejson
+
+from svnstats.benchmarks import ingest
+
+class Command(BaseCommand):
+    help = 'Benchmark the ingestion over a generated local repository. Runs in a test database.'
+    option_list = BaseCommand.option_list + (
+        make_option('--revisions', type='int', dest='revisions', default=200,
+            help='Number of revisions of the generated repository.'),
+        make_option('--files', type='int', dest='files', default=10,
+            help='Changed files per revision.'),
+        make_option('--lines', type='int', dest='lines', default=100,
+            help='Average lines per file.'),
+        make_option('--branch-every', type='int', dest='branchevery', default=50,
+            help='Copy trunk to a branch every N revisions (0: never).'),
+        make_option('--binary-every', type='int', dest='binaryevery', default=10,
+            help='Every Nth added file is binary (0: never).'),
+        make_option('--delete-every', type='int', dest='deleteevery', default=20,
+            help='About every Nth change is a delete (0: never).'),
+        make_option('--seed', type='int', dest='seed', default=1,
+            help='Seed of the generated history.'),
+        make_option('--incremental', type='int', dest='incremental', default=20,
+            help='Revisions ingested by the incremental run.'),
+        make_option('--workers', type='int', dest='workers', default=None,
+            help='Ingest workers (default SVNSTATS_INGEST_WORKERS).'),
+        make_option('--output', dest='output', default=None,
+            help='Write the results to this JSON file.'),
+        make_option('--compare', dest='compare', default=None,
+            help='Compare the results with an earlier JSON file.'),
+    )
+
+    def handle(self, *args, **options):
+        shape = ingest.RepoShape(revisions=options['revisions'], files=options['files'],
+                    lines=options['lines'], branchevery=options['branchevery'],
+                    binaryevery=options['binaryevery'], deleteevery=options['deleteevery'],
+                    seed=options['seed'])
+        #the repository calls are counted by the ingestion profiler.
+        settings.SVNSTATS_PROFILE = True
+        if options['workers'] is not None:
+            settings.SVNSTATS_INGEST_WORKERS = options['workers']
+            #one client for each worker, the log fetch and the updating thread.
+            settings.SVNSTATS_CLIENT_POOL_SIZE = options['workers']+2
+
+        workdir = ingest.makeWorkdir()
+        olddbname = connection.creation.create_test_db(verbosity=0)
+        try:
+            result = ingest.runBenchmark(shape, options['incremental'], workdir)
+        finally:
+            connection.creation.destroy_test_db(olddbname, verbosity=0)
+            ingest.removeWorkdir(workdir)
+        result['workers'] = getattr(settings, 'SVNSTATS_INGEST_WORKERS', 4)
+
+        for phase in ('full', 'incremental'):
+            stats = result[phase]
+            self.stdout.write('%-12s %6d revisions %8.2f s %8.1f revs/s %8d rpcs %8d KB peak rss (%d KB at start)\n' % \
+                (phase, stats['revisions'], stats['seconds'], stats['revspersec'], stats['rpcs'], stats['peakrss'],
+                 stats['startrss']))
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                simplejson.dump(result, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+        if options['compare']:
+            try:
+                earlier = simplejson.load(open(options['compare']))
+            except (IOError, ValueError), e:
+                raise CommandError('Cannot read %s: %s' % (options['compare'], e))
+            for line in ingest.compare(earlier, result):
+                self.stdout.write(line + '\n')
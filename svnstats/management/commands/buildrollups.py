@@ -0,0 +1,54 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project, SVNLog
+from svnstats import rollups, churn
+
+class Command(BaseCommand):
+    args = '<project name> [<project name> ...]'
+    help = 'Build the daily author totals, the directory churn and the summaries of projects from their stored revisions, or check them with --verify.'
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='All the projects.'),
+        make_option('--verify', action='store_true', dest='verify', default=False,
+            help='Only compare the stored totals with the stored revisions. Exits with an error on differences.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            projects = list(Project.objects.all())
+        elif args:
+            projects = []
+            for name in args:
+                try:
+                    projects.append(Project.objects.get(name=name))
+                except Project.DoesNotExist:
+                    raise CommandError('Project "%s" does not exist' % name)
+        else:
+            raise CommandError('Give project names or --all')
+
+        failed = []
+        for project in projects:
+            if options['verify']:
+                differences = rollups.verify(project)
+                for author, day, stored, computed in differences:
+                    self.stdout.write('%s: %s %s stored %s, computed %s\n' % (project.name, author, day, stored, computed))
+                dirs = churn.verify(project, SVNLog.objects.filter(project=project))
+                for dirpath, author, day, stored, computed in dirs:
+                    self.stdout.write('%s: churn %s %s %s stored %s, computed %s\n' % \
+                                        (project.name, dirpath, author, day, stored, computed))
+                summary = rollups.verifySummary(project)
+                for counter, stored, computed in summary:
+                    self.stdout.write('%s: summary %s stored %s, computed %s\n' % (project.name, counter, stored, computed))
+                differences = differences + dirs + summary
+                if differences:
+                    failed.append(project)
+                else:
+                    self.stdout.write('%s: ok\n' % project.name)
+                continue
+            if not project.rebuildRollups():
+                raise CommandError('Project %s is being updated by another worker' % project.name)
+
+        if failed:
+            raise CommandError('Totals differ for: %s' % ', '.join([project.name for project in failed]))
@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project
+from svnstats.jobs import enqueue
+
+class Command(BaseCommand):
+    args = '<project name> [<project name> ...]'
+    help = 'Queue updates of the given projects for the ingestion worker.'
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='Queue updates of all the projects.'),
+        make_option('--priority', type='int', dest='priority', default=0,
+            help='Job priority. Jobs with higher priority run first.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            projects = list(Project.objects.all())
+        elif args:
+            projects = []
+            for name in args:
+                try:
+                    projects.append(Project.objects.get(name=name))
+                except Project.DoesNotExist:
+                    raise CommandError('Project "%s" does not exist' % name)
+        else:
+            raise CommandError('Give project names or --all')
+
+        for project in projects:
+            job = enqueue(project, options['priority'])
+            self.stdout.write('Queued update of %s (job %d)\n' % (project.name, job.id))
@@ -0,0 +1,39 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project
+
+class Command(BaseCommand):
+    args = '<project name> <dump file>'
+    help = 'Ingest a project from a svnadmin/svnrdump dump file (- reads the dump from stdin).'
+    option_list = BaseCommand.option_list + (
+        make_option('--path', dest='path', default=None,
+            help='Path of the project url relative to the repository root (e.g. /trunk). '
+                 'The repository is asked if not given.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Give the project name and the dump file')
+        name, filename = args
+        try:
+            project = Project.objects.get(name=name)
+        except Project.DoesNotExist:
+            raise CommandError('Project "%s" does not exist' % name)
+
+        if filename == '-':
+            dumpfile = sys.stdin
+        else:
+            try:
+                dumpfile = open(filename, 'rb')
+            except IOError, e:
+                raise CommandError('Cannot open %s: %s' % (filename, e))
+        try:
+            if not project.importDump(dumpfile, options['path']):
+                raise CommandError('Project %s is being updated by another worker' % name)
+        finally:
+            if dumpfile is not sys.stdin:
+                dumpfile.close()
+        self.stdout.write('Imported %s upto revision %s\n' % (project.name, project.lastrev))
@@ -0,0 +1,56 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project
+from svnstats.jobs import updateInProcesses
+
+class Command(BaseCommand):
+    args = '<project name> [<project name> ...]'
+    help = 'Update the given projects now, each one in its own process. Exits with an error if an update fails.'
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='Update all the projects.'),
+        make_option('--jobs', type='int', dest='jobs', default=1,
+            help='Number of projects updated in parallel.'),
+        make_option('--since', type='int', dest='since', default=None,
+            help='First revision to read (only for projects without stored revisions).'),
+        make_option('--until', type='int', dest='until', default=None,
+            help='Last revision to read.'),
+        make_option('--dry-run', action='store_true', dest='dryrun', default=False,
+            help='Print the revision range and the estimated work, update nothing.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            projects = list(Project.objects.all())
+        elif args:
+            projects = []
+            for name in args:
+                try:
+                    projects.append(Project.objects.get(name=name))
+                except Project.DoesNotExist:
+                    raise CommandError('Project "%s" does not exist' % name)
+        else:
+            raise CommandError('Give project names or --all')
+
+        if options['dryrun']:
+            failed = []
+            for project in projects:
+                try:
+                    estimate = project.estimateUpdate(options['since'], options['until'])
+                except Exception, e:
+                    self.stderr.write('%s: %s\n' % (project.name, e))
+                    failed.append(project)
+                    continue
+                if estimate['startrev'] > estimate['endrev']:
+                    self.stdout.write('%s: up to date (revision %d)\n' % (project.name, estimate['endrev']))
+                else:
+                    self.stdout.write('%s: revisions %d - %d, about %d revisions with %d changed paths\n' % \
+                        (project.name, estimate['startrev'], estimate['endrev'], estimate['revisions'],
+                         estimate['changedpaths']))
+        else:
+            failed = updateInProcesses(projects, options['jobs'], options['since'], options['until'])
+
+        if failed:
+            raise CommandError('Update failed for: %s' % ', '.join([project.name for project in failed]))
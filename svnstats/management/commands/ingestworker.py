@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from svnstats.jobs import JobRunner
+
+class Command(BaseCommand):
+    help = 'Run the queued project updates.'
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency', type='int', dest='concurrency',
+            default=getattr(settings, 'SVNSTATS_WORKER_CONCURRENCY', 1),
+            help='Maximum number of projects updated at the same time.'),
+        make_option('--poll', type='int', dest='poll', default=10,
+            help='Seconds to wait before checking the queue again.'),
+        make_option('--once', action='store_true', dest='once', default=False,
+            help='Exit when the queue is empty.'),
+    )
+
+    def handle(self, *args, **options):
+        runner = JobRunner(options['concurrency'], options['poll'])
+        runner.run(options['once'])
@@ -0,0 +1,24 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project
+
+class Command(BaseCommand):
+    args = '<project name> [<project name> ...]'
+    help = 'Count the lines of the files which were skipped because of their size.'
+    option_list = BaseCommand.option_list + (
+        make_option('--max-size', type='int', dest='maxsize', default=0,
+            help='Size limit in bytes for the recount. Default is no limit.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Give project names')
+        for name in args:
+            try:
+                project = Project.objects.get(name=name)
+            except Project.DoesNotExist:
+                raise CommandError('Project "%s" does not exist' % name)
+            if not project.recountSkipped(options['maxsize']):
+                raise CommandError('Project %s is being updated by another worker' % name)
@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from svnstats.models import Project
+from svnstats import schema
+
+class Command(BaseCommand):
+    help = 'Add the path hashes and the indexes of the hot queries to an existing database, then check the query plans.'
+    option_list = BaseCommand.option_list + (
+        make_option('--check', action='store_true', dest='check', default=False,
+            help='Only check the query plans. Exits with an error if a query scans a large table.'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            try:
+                schema.upgrade()
+            except ValueError, e:
+                raise CommandError(str(e))
+
+        projects = Project.objects.order_by('id')[:1]
+        if projects:
+            project = projects[0]
+        else:
+            project = Project(pk=0)
+        failed = []
+        for name, lines, scans in schema.checkPlans(project):
+            self.stdout.write('%s%s\n' % (name, scans and ' - FULL SCAN of %s' % ', '.join(scans) or ''))
+            for line in lines:
+                self.stdout.write('    %s\n' % line)
+            if scans:
+                failed.append(name)
+        if failed:
+            raise CommandError('Not served by an index: %s' % ', '.join(failed))
@@ -1,10 +1,17 @@
-from django.db import models
-from django.db.models import Max, Min, Count, Avg
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Max, Min, Count, Avg, Q, F, signals
 from django.utils.translation import ugettext_lazy as _
 import datetime
+import hashlib
+import logging
+import os, socket, threading
 
 from svnclient.svnlogclient import SVNLogClient
-from svnclient.svnlogiter import SVNRevLogIter
+from svnclient.svnlogiter import SVNRevLogIter, SVNRevLog
+from svnclient.svnpipeline import SVNRevLogPipeline
+from svnclient.pathfilter import PathFilter
+from svnclient.profiler import Profiler, NULL_PROFILER
 
 BINARYFILEXT = [ 'doc', 'xls', 'ppt', 'docx', 'xlsx', 'pptx', 'dot', 'dotx', 'ods', 'odm', 'odt', 'ott', 'pdf',
                  'o', 'a', 'obj', 'lib', 'dll', 'so', 'exe',
@@ -15,6 +22,40 @@ BINARYFILEXT = [ 'doc', 'xls', 'ppt', 'docx', 'xlsx', 'pptx', 'dot', 'dotx', 'od
                  ]
 
 
+DEFAULT_LEASE_SECONDS = 600
+
+def getLeaseSeconds():
+    '''
+    lifetime of a project update lease. Running updates renew it with heartbeats,
+    a crashed update frees the project once the lease expires.
+    '''
+    return(getattr(settings, 'SVNSTATS_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+
+def getLeaseOwner():
+    '''
+    unique name of the current thread used as lease owner.
+    '''
+    return('%s:%d:%s' % (socket.gethostname(), os.getpid(), threading.currentThread().getName()))
+
+def getClientPoolSize():
+    '''
+    number of pysvn clients of a project update. The log fetch thread, the ingest
+    workers and the calling thread each use one client.
+    '''
+    workers = getattr(settings, 'SVNSTATS_INGEST_WORKERS', 4)
+    return(getattr(settings, 'SVNSTATS_CLIENT_POOL_SIZE', workers+2))
+
+def getProfiler():
+    '''
+    Profiler for one ingestion run if settings.SVNSTATS_PROFILE is set, otherwise the
+    profiler which records nothing.
+    '''
+    if( getattr(settings, 'SVNSTATS_PROFILE', False)):
+        return(Profiler())
+    return(NULL_PROFILER)
+
+class LeaseLost(Exception):
+    pass
 
 # Create your models here.
 class Project(models.Model):
@@ -25,111 +66,497 @@ class Project(models.Model):
     password = models.CharField(_('password'), max_length=50)
     excludes = models.CharField(_('excluded paths'), max_length=500, null=True, blank=True)
     updatedate = models.DateTimeField(_('update time'))
-    updating = models.BooleanField(_('updating'), default=False)
+    leaseowner = models.CharField(_('lease owner'), max_length=100, null=True, blank=True)
+    leaseexpires = models.DateTimeField(_('lease expires'), null=True, blank=True)
+    lastrev = models.IntegerField(_('last stored revision'), null=True, blank=True, editable=False)
+    maxfilesize = models.IntegerField(_('max file size'), null=True, blank=True)
+    excludesapplied = models.CharField(_('applied excluded paths'), max_length=500, null=True, blank=True, editable=False)
 
     def __unicode__(self):
         return self.name
 
-    def update(self):
+    def isUpdating(self):
         '''
-        update project statistics
+        project is being updated if some worker holds an unexpired lease on it.
         '''
-        svnclient = SVNLogClient(self.repository, BINARYFILEXT, username=self.username, password=self.password)
+        return(self.leaseexpires is not None and self.leaseexpires > datetime.datetime.now())
+    isUpdating.boolean = True
+    isUpdating.short_description = _('updating')
+
+    def acquireLease(self, owner):
+        '''
+        try to take the update lease of the project. Returns False if the project is
+        leased by some other owner. Lease is taken with a single conditional UPDATE,
+        hence two workers cannot both get it.
+        '''
+        now = datetime.datetime.now()
+        expires = now + datetime.timedelta(seconds=getLeaseSeconds())
+        free = Q(leaseexpires__isnull=True) | Q(leaseexpires__lt=now) | Q(leaseowner=owner)
+        count = Project.objects.filter(pk=self.pk).filter(free).update(leaseowner=owner, leaseexpires=expires)
+        if( count == 1):
+            self.leaseowner = owner
+            self.leaseexpires = expires
+            self.lastheartbeat = now
+        return(count == 1)
+
+    def renewLease(self):
+        '''
+        extend the lease held by this object. Raises LeaseLost if the lease expired and
+        was taken by some other owner in between.
+        '''
+        now = datetime.datetime.now()
+        expires = now + datetime.timedelta(seconds=getLeaseSeconds())
+        count = Project.objects.filter(pk=self.pk, leaseowner=self.leaseowner).update(leaseexpires=expires)
+        if( count != 1):
+            raise LeaseLost('lease of project %s is lost' % self.name)
+        self.leaseexpires = expires
+        self.lastheartbeat = now
+
+    def heartbeat(self):
+        '''
+        renew the lease if a fifth of the lease time has passed since the last renewal.
+        Cheap enough to be called for every revision.
+        '''
+        if( self.leaseowner is None):
+            return
+        interval = datetime.timedelta(seconds=getLeaseSeconds()/5)
+        lastheartbeat = getattr(self, 'lastheartbeat', None)
+        if( lastheartbeat is None or datetime.datetime.now()-lastheartbeat > interval):
+            self.renewLease()
+
+    def releaseLease(self):
+        Project.objects.filter(pk=self.pk, leaseowner=self.leaseowner).update(leaseowner=None, leaseexpires=None)
+        self.leaseowner = None
+        self.leaseexpires = None
+
+    def markUpdated(self):
+        '''
+        record that the stored statistics of the project changed. The update time is the
+        Last-Modified time of the dashboard data (see dashboard.py), hence updates which
+        store nothing do not call it.
+        '''
+        #update only the date. save() would overwrite the lease columns.
+        self.updatedate = datetime.datetime.now()
+        Project.objects.filter(pk=self.pk).update(updatedate=self.updatedate)
+
+    def update(self, owner=None, since=None, until=None):
+        '''
+        update project statistics. Returns False if the project is already being
+        updated by some other worker. 'since' and 'until' limit the revisions read,
+        see getUpdateRange.
+        '''
+        if( owner is None):
+            owner = getLeaseOwner()
+        if( not self.acquireLease(owner)):
+            logging.info("Project %s is already being updated" % self.name)
+            return(False)
+
+        profiler = getProfiler()
+        svnclient = SVNLogClient(self.repository, BINARYFILEXT, username=self.username, password=self.password,
+                                 poolsize=getClientPoolSize(), profiler=profiler)
+        started = datetime.datetime.now()
+        laststoredrev = None
+        ok = False
         #import pdb; pdb.set_trace()
         try:
             laststoredrev = self.getLastStoredRev()
-            rootUrl = svnclient.getRootUrl()
-            (startrevno, endrevno) = svnclient.findStartEndRev(None, None)
-            startrevno = max(startrevno, laststoredrev+1)
-            
-            self.updating = True
-            self.updatedate = datetime.datetime.now()
-            self.save()
+            changed = self.repairPartialRevisions(laststoredrev)
+            svnclient.excludes = PathFilter(self.excludes)
+            svnclient.maxfilesize = self.getMaxFileSize()
+            #the update range looks up the repository root url, the recounts of
+            #applyExcludes need it.
+            (startrevno, endrevno) = self.getUpdateRange(svnclient, since, until)
+            if( self.applyExcludes(svnclient)):
+                changed = True
+
             if startrevno <= endrevno:
+                #path types of earlier revisions save the 'info' calls for those paths.
+                if( laststoredrev > 0):
+                    svnclient.nodekinds.loader = self.getStoredKind
                 self.ConvertRevs(svnclient, startrevno, endrevno)
-            self.updatedate = datetime.datetime.now()
-            self.updating = False
-            self.save()
-            
-        except Exception as e:
-            print 'Exception updating project'
-            print e
+                changed = True
+            if( changed):
+                self.markUpdated()
+            ok = True
+        finally:
+            if( profiler.enabled):
+                IngestRun.record(self, profiler, started, laststoredrev, ok)
+            self.releaseLease()
+        return(True)
+
+    def getUpdateRange(self, svnclient, since=None, until=None):
+        '''
+        return the (start, end) revisions of the next update: from the stored watermark
+        (or revision 'since') upto the head revision (or revision 'until'). Revisions before
+        'since' are skipped for good, hence 'since' is only accepted if it does not leave
+        a gap after the stored revisions.
+        '''
+        laststoredrev = self.getLastStoredRev()
+        rootUrl = svnclient.getRootUrl()
+        (startrevno, endrevno) = svnclient.findStartEndRev(None, None)
+        startrevno = max(startrevno, laststoredrev+1)
+        if( since is not None and since > startrevno):
+            if( laststoredrev > 0):
+                raise ValueError('revisions %d - %d of project %s would not be stored' % \
+                                    (startrevno, since-1, self.name))
+            startrevno = since
+        if( until is not None):
+            endrevno = min(endrevno, until)
+        return(startrevno, endrevno)
 
-    def ConvertRevs(self, svnclient, startrevno, endrevno):
+    def estimateUpdate(self, since=None, until=None, sample=100):
         '''
-        read svn repository, parse and save log details
+        estimate the work of the next update without running it. Reads the log of the
+        first 'sample' revisions of the range and extrapolates the revision and changed
+        path counts to the whole range. Returns a dictionary.
         '''
-        svnloglist = SVNRevLogIter(svnclient, startrevno, endrevno)
-        revcount = 0
-        lastrevno = 0
+        svnclient = SVNLogClient(self.repository, BINARYFILEXT, username=self.username, password=self.password)
+        (startrevno, endrevno) = self.getUpdateRange(svnclient, since, until)
+        estimate = dict(startrev=startrevno, endrev=endrevno, revisions=0, changedpaths=0)
+        if( startrevno > endrevno):
+            return(estimate)
+        logs = svnclient.getLogs(startrevno, endrevno, cachesize=sample, detailedLog=True)
+        if( len(logs) == 0):
+            return(estimate)
+        changedpaths = sum([len(revlog.changed_paths) for revlog in logs])
+        if( len(logs) < sample):
+            #the sample is the complete range
+            estimate.update(revisions=len(logs), changedpaths=changedpaths)
+        else:
+            #log of a sub path url contains only the revisions touching it.
+            span = logs[-1].revision.number - startrevno + 1
+            scale = float(endrevno - startrevno + 1)/span
+            estimate.update(revisions=int(len(logs)*scale), changedpaths=int(changedpaths*scale))
+        return(estimate)
+
+    def importDump(self, dumpfile, relpath=None, owner=None, batchsize=None):
+        '''
+        ingest the project from a 'svnadmin dump' or 'svnrdump dump' stream instead of
+        querying the repository. The dump has to start at revision 0; revisions upto the
+        stored watermark only update the state of the dump, their lines are not counted and
+        they are not stored. 'relpath' is the path of the project
+        url relative to the repository root, the repository is asked if it is not given.
+        Returns False if the project is already being updated.
+        '''
+        from logwriter import SVNLogWriter
+        from svnclient.svndump import SVNDumpRevLogIter
+
+        if( owner is None):
+            owner = getLeaseOwner()
+        if( not self.acquireLease(owner)):
+            logging.info("Project %s is already being updated" % self.name)
+            return(False)
+        profiler = getProfiler()
+        started = datetime.datetime.now()
+        laststoredrev = None
+        ok = False
+        try:
+            svnclient = SVNLogClient(self.repository, BINARYFILEXT, username=self.username, password=self.password,
+                                     profiler=profiler)
+            svnclient.excludes = PathFilter(self.excludes)
+            svnclient.maxfilesize = self.getMaxFileSize()
+            if( relpath is None):
+                relpath = svnclient.getRepoRelPath()
+            laststoredrev = self.getLastStoredRev()
+            changed = self.repairPartialRevisions(laststoredrev)
+            if( self.applyExcludes(svnclient)):
+                changed = True
+            writer = SVNLogWriter(self, batchsize, profiler=profiler)
+            lastrevno = None
+            for revlog in SVNDumpRevLogIter(dumpfile, relpath, BINARYFILEXT, excludes=svnclient.excludes,
+                                            maxfilesize=svnclient.maxfilesize, startrev=laststoredrev+1):
+                lastrevno = revlog.revno
+                if( revlog.revno > laststoredrev):
+                    writer.addRevision(revlog)
+                self.heartbeat()
+            if( lastrevno is not None and lastrevno > laststoredrev):
+                writer.close(lastrevno)
+                changed = True
+            if( changed):
+                self.markUpdated()
+            ok = True
+        finally:
+            if( profiler.enabled):
+                IngestRun.record(self, profiler, started, laststoredrev, ok)
+            self.releaseLease()
+        return(True)
+
+    def ConvertRevs(self, svnclient, startrevno, endrevno, batchsize=None, workers=None):
+        '''
+        read svn repository, parse and save log details. Rows are written in batches
+        of 'batchsize' revisions (default settings.SVNSTATS_BATCH_REVS), one transaction
+        per batch. The repository is queried by 'workers' threads (default
+        settings.SVNSTATS_INGEST_WORKERS), 0 runs everything on the calling thread.
+        '''
+        from logwriter import SVNLogWriter
+
+        if( workers is None):
+            workers = getattr(settings, 'SVNSTATS_INGEST_WORKERS', 4)
+        if( workers > 0 and svnclient.pool.size < 3):
+            logging.warning("Client pool of %d clients is too small for the ingest workers, "
+                            "the revisions are processed one by one" % svnclient.pool.size)
+            workers = 0
+        if( workers > 0):
+            svnloglist = SVNRevLogPipeline(svnclient, startrevno, endrevno, workers)
+        else:
+            svnloglist = SVNRevLogIter(svnclient, startrevno, endrevno)
+        writer = SVNLogWriter(self, batchsize, profiler=svnclient.profiler)
 
         #import pdb; pdb.set_trace()
         for revlog in svnloglist: #iterate the log and insert into database
-            addedfiles, changedfiles, deletedfiles = revlog.changedFileCount()
-            if revlog.isvalid():
-                svnlog = SVNLog(project = self, 
-                    revno = revlog.revno, 
-                    commitdate = revlog.date,
-                    author = revlog.author,
-                    msg = revlog.message,
-                    addedfiles = addedfiles,
-                    changedfiles = changedfiles,
-                    deletedfiles = deletedfiles)
-                svnlog.save()
-                print 'saved revision: %d ' % revlog.revno
-                #next, digg out details
-                for change in revlog.getDiffLineCount(True):
-                    filename = change.filepath_unicode()
-                    changetype = change.change_type()
-                    linesadded = change.lc_added()
-                    linesdeleted = change.lc_deleted()
-                    copyfrompath, copyfromrev = change.copyfrom()
-                    entry_type = 'R'
-                    pathtype = change.pathtype()
-                    path, created = SVNPath.objects.get_or_create(path=filename)
-
-                    detail = SVNLogDetail(svnlog = svnlog,
-                                changedpath = path,
-                                pathtype = pathtype,
-                                changetype = changetype,
-                                linesadded = linesadded,
-                                linesdeleted = linesdeleted,
-                                entrytype = entry_type)
-                    #recored copyfrom information if exists
-                    if copyfrompath is not None:
-                        copyfrom, created = SVNPath.objects.get_or_create(path=copyfrompath)
-                        detail.copyfrompath = copyfrom.id
-                        detail.copyfromrev = copyfromrev
-
-                    detail.save()
-
-                                
+            writer.addRevision(revlog)
+            self.heartbeat()
+        #revisions upto endrevno which are not in the log don't touch the repository path.
+        writer.close(endrevno)
+        logging.info(svnloglist.report())
+        logging.info(svnclient.nodekinds.report())
+        logging.info(svnclient.binaryfiles.report())
     
     def getLastStoredRev(self):
         '''
-        return the max revision number for the project
+        return the revision number upto which the project is completely stored (the
+        watermark). Revisions are committed in batches together with the watermark,
+        hence everything below it is complete and nothing above it is stored.
         '''
-        try:
-            revno = SVNLog.objects.filter(project=self).aggregate(Max('revno'))['revno__max']
-            if revno is None:
+        lastrev = Project.objects.filter(pk=self.pk).values_list('lastrev', flat=True)[0]
+        if( lastrev is None):
+            #database from a version without watermark. The last revision may have
+            #been saved only partially, hence it is ingested again.
+            try:
+                revno = SVNLog.objects.filter(project=self).aggregate(Max('revno'))['revno__max']
+                if revno is None:
+                    revno = 0
+            except:
                 revno = 0
-        except:
-            revno = 0
+            lastrev = max(0, revno-1)
+        self.lastrev = lastrev
+        return lastrev
+
+    def applyExcludes(self, svnclient):
+        '''
+        bring the stored revisions in line with the current excludes, if they changed since
+        the revisions were stored. Newly excluded paths only lose their line counts. Newly
+        included paths are counted again from the log of their revisions, no other revision
+        is read from the repository. 'svnclient.excludes' must be the filter of self.excludes.
+        Returns False if the excludes did not change.
+        '''
+        from pathcache import getPathCache
+
+        if( (self.excludes or '') == (self.excludesapplied or '')):
+            return(False)
+        excludes = svnclient.excludes
+        excluded = []
+        included = dict()
+        changed = set()
+        details = SVNLogDetail.objects.filter(svnlog__project=self, entrytype__in=('R', 'X'))
+        for detailid, entrytype, path, logid, revno in details.values_list('id', 'entrytype',
+                                        'changedpath__path', 'svnlog', 'svnlog__revno').iterator():
+            isexcluded = bool(excludes) and excludes.matches(path)
+            if( entrytype == 'R' and isexcluded):
+                excluded.append(detailid)
+                changed.add(logid)
+            elif( entrytype == 'X' and not isexcluded):
+                included.setdefault(revno, dict())[path.rstrip('/')] = detailid
+                changed.add(logid)
+        logging.info("Applying excludes of %s: %d paths excluded, %d paths included" % \
+                    (self.name, len(excluded), sum([len(paths) for paths in included.values()])))
+
+        created = dict()
+        with transaction.commit_on_success():
+            self._applyExcludes(svnclient, excluded, included, changed, created)
+        getPathCache().publish(created)
+        self.excludesapplied = self.excludes
+        return(True)
+
+    def _applyExcludes(self, svnclient, excluded, included, changed, created):
+        from pathcache import chunks
+
+        import rollups
+
+        for chunk in chunks(excluded):
+            SVNLogDetail.objects.filter(id__in=chunk).update(entrytype='X', linesadded=0, linesdeleted=0)
+        self.recountDetails(svnclient, included, created)
+        self.updateFileCounts(changed)
+        rollups.rebuildDays(self, rollups.getDaysOfLogs(changed))
+        Project.objects.filter(pk=self.pk).update(excludesapplied=self.excludes)
+
+    def recountDetails(self, svnclient, details, created):
+        '''
+        count the given detail rows again from the repository. 'details' is a dictionary
+        revno -> { path : detail id }. Only these revisions are read. The ids of the created
+        paths are added to 'created', to be published to the path cache after the commit.
+        '''
+        from pathcache import getPathCache
+
+        if( len(details) == 0):
+            return
+        #the changed paths of the log are checked against the repository root url.
+        svnclient.getRootUrl()
+        for revno, paths in sorted(details.items()):
+            #the kinds and binary states learned from one revision may not hold for the
+            #next one, the revisions in between are not read.
+            svnclient.clearCaches()
+            revlog = SVNRevLog(svnclient, revno)
+            for change in revlog.getDiffLineCount(True):
+                detailid = paths.get(change.filepath().rstrip('/'))
+                if( detailid is None):
+                    continue
+                pathid = getPathCache().get(change.filepath_unicode(), created)
+                SVNLogDetail.objects.filter(id=detailid).update(entrytype=change.entrytype(), changedpath=pathid,
+                            pathtype=change.pathtype(), linesadded=change.lc_added(),
+                            linesdeleted=change.lc_deleted())
+            self.heartbeat()
+        svnclient.clearCaches()
+
+    def getMaxFileSize(self):
+        '''
+        files larger than this (bytes) are stored without line counts. 0 is no limit.
+        '''
+        if( self.maxfilesize is not None):
+            return(self.maxfilesize)
+        return(getattr(settings, 'SVNSTATS_MAX_FILE_SIZE', 0))
+
+    def recountSkipped(self, maxfilesize=0, owner=None):
+        '''
+        count the lines of the files which were skipped because of their size, with the
+        size limit 'maxfilesize' (0 is no limit). Returns False if the project is being updated.
+        '''
+        from pathcache import getPathCache
+        import rollups
+
+        if( owner is None):
+            owner = getLeaseOwner()
+        if( not self.acquireLease(owner)):
+            logging.info("Project %s is already being updated" % self.name)
+            return(False)
+        try:
+            svnclient = SVNLogClient(self.repository, BINARYFILEXT, username=self.username, password=self.password)
+            svnclient.excludes = PathFilter(self.excludes)
+            svnclient.maxfilesize = maxfilesize
+            skipped = dict()
+            details = SVNLogDetail.objects.filter(svnlog__project=self, entrytype='S')
+            for detailid, path, revno in details.values_list('id', 'changedpath__path', 'svnlog__revno').iterator():
+                skipped.setdefault(revno, dict())[path.rstrip('/')] = detailid
+            logging.info("Recounting %d skipped files of %s" % (sum([len(paths) for paths in skipped.values()]), self.name))
+            created = dict()
+            with transaction.commit_on_success():
+                self.recountDetails(svnclient, skipped, created)
+                rollups.rebuildDays(self, rollups.getDaysOfRevisions(self, skipped.keys()))
+            getPathCache().publish(created)
+            self.markUpdated()
+        finally:
+            self.releaseLease()
+        return(True)
+
+    def rebuildRollups(self, owner=None):
+        '''
+        replace the daily author totals of the project with the totals of its stored
+        revisions. Returns False if the project is being updated.
+        '''
+        import rollups
+
+        if( owner is None):
+            owner = getLeaseOwner()
+        if( not self.acquireLease(owner)):
+            logging.info("Project %s is already being updated" % self.name)
+            return(False)
+        try:
+            with transaction.commit_on_success():
+                days = rollups.rebuild(self)
+            self.markUpdated()
+            logging.info("Rebuilt %d author days of %s" % (days, self.name))
+        finally:
+            self.releaseLease()
+        return(True)
+
+    def updateFileCounts(self, logids):
+        '''
+        recount the added, changed and deleted files of the given revisions from their
+        detail rows. Excluded paths are not counted.
+        '''
+        from pathcache import chunks
+        for chunk in chunks(list(logids)):
+            counts = dict([(logid, dict()) for logid in chunk])
+            details = SVNLogDetail.objects.filter(svnlog__in=chunk, pathtype='F').exclude(entrytype='X')
+            for row in details.values('svnlog', 'changetype').annotate(count=Count('id')):
+                counts[row['svnlog']][row['changetype']] = row['count']
+            for logid, count in counts.items():
+                SVNLog.objects.filter(id=logid).update(addedfiles=count.get('A', 0),
+                            changedfiles=count.get('M', 0)+count.get('R', 0), deletedfiles=count.get('D', 0))
 
-        return revno
+    def getStoredKind(self, path, revno):
+        '''
+        (revision, node kind) of the last stored change of the path upto revision 'revno'.
+        None if the path is not stored, if its kind was only guessed (excluded paths) or
+        if a parent directory was added or replaced after that change. Called by the
+        ingestion threads for the paths whose kind is not known yet.
+        '''
+        path = path.rstrip(u'/')
+        details = SVNLogDetail.objects.filter(svnlog__project=self, svnlog__revno__lte=revno,
+                                              changedpath__pathhash__in=[hashPath(path), hashPath(path + u'/')])
+        rows = list(details.order_by('-svnlog__revno').values_list('svnlog__revno', 'pathtype', 'entrytype')[:1])
+        if( len(rows) == 0 or rows[0][2] == 'X'):
+            return(None)
+        storedrev, pathtype, entrytype = rows[0]
+        parents = []
+        idx = path.rfind(u'/')
+        while( idx > 0):
+            path = path[:idx]
+            parents.append(hashPath(path + u'/'))
+            idx = path.rfind(u'/')
+        if( len(parents) > 0):
+            replaced = SVNLogDetail.objects.filter(svnlog__project=self, svnlog__revno__gt=storedrev,
+                                svnlog__revno__lte=revno, changedpath__pathhash__in=parents, changetype__in=('A', 'R'))
+            if( replaced.exists()):
+                return(None)
+        return(storedrev, pathtype)
+
+    def repairPartialRevisions(self, lastrev):
+        '''
+        remove the rows of revisions above the watermark. They can only be left over by
+        an interrupted ingestion. Returns True if rows were removed.
+        '''
+        import rollups
+
+        partial = SVNLog.objects.filter(project=self, revno__gt=lastrev)
+        if( partial.exists()):
+            logging.warning("Removing partially stored revisions of %s after %d" % (self.name, lastrev))
+            days = rollups.getDays(partial)
+            with transaction.commit_on_success():
+                SVNLogDetail.objects.filter(svnlog__in=partial).delete()
+                partial.delete()
+                rollups.rebuildDays(self, days)
+            return(True)
+        return(False)
 
 class SVNLog(models.Model):
     project = models.ForeignKey(Project)
     revno = models.IntegerField(_('revision number'))
-    commitdate = models.DateTimeField(_('commit date'))
-    author = models.CharField(_('author'), max_length=50)
+    commitdate = models.DateTimeField(_('commit date'), db_index=True)
+    author = models.CharField(_('author'), max_length=50, db_index=True)
     msg = models.TextField(_('commit comment'))
     addedfiles = models.IntegerField(_('added files'))
     changedfiles = models.IntegerField(_('changed files'))
     deletedfiles = models.IntegerField(_('deleted files'))
 
+    class Meta:
+        unique_together = ('project', 'revno')
+
+def hashPath(path):
+    '''
+    fixed width key of a path, the text column itself cannot be indexed everywhere.
+    '''
+    if( isinstance(path, unicode)):
+        path = path.encode('utf-8')
+    return(hashlib.sha1(path).hexdigest())
+
 class SVNPath(models.Model):
     path = models.TextField(_('path'))
+    pathhash = models.CharField(_('path hash'), max_length=40, unique=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.pathhash = hashPath(self.path)
+        super(SVNPath, self).save(*args, **kwargs)
 
 class SVNLogDetail(models.Model):
     svnlog = models.ForeignKey(SVNLog)
@@ -149,3 +576,130 @@ class SVNAuthor(models.Model):
     def __unicode__(self):
         return self.author
 
+
+class AuthorDayRollup(models.Model):
+    '''
+    totals of the revisions of one author in a project on one day, see rollups.py.
+    '''
+    project = models.ForeignKey(Project)
+    author = models.CharField(_('author'), max_length=50, db_index=True)
+    day = models.DateField(_('day'), db_index=True)
+    linesadded = models.IntegerField(_('lines added'), default=0)
+    linesdeleted = models.IntegerField(_('lines deleted'), default=0)
+    commits = models.IntegerField(_('commits'), default=0)
+    addedfiles = models.IntegerField(_('added files'), default=0)
+    changedfiles = models.IntegerField(_('changed files'), default=0)
+    deletedfiles = models.IntegerField(_('deleted files'), default=0)
+
+    class Meta:
+        unique_together = ('project', 'author', 'day')
+
+class DirChurnRollup(models.Model):
+    '''
+    churn of one directory (and everything below it) by one author in a project on one
+    day, see churn.py.
+    '''
+    project = models.ForeignKey(Project)
+    dirpath = models.TextField(_('directory'))
+    dirhash = models.CharField(_('directory hash'), max_length=40, db_index=True)
+    parenthash = models.CharField(_('parent hash'), max_length=40, db_index=True)
+    depth = models.IntegerField(_('depth'))
+    author = models.CharField(_('author'), max_length=50)
+    day = models.DateField(_('day'), db_index=True)
+    linesadded = models.IntegerField(_('lines added'), default=0)
+    linesdeleted = models.IntegerField(_('lines deleted'), default=0)
+    commits = models.IntegerField(_('commits'), default=0)
+
+    class Meta:
+        unique_together = ('project', 'dirhash', 'author', 'day')
+
+class ProjectSummary(models.Model):
+    '''
+    totals of all the stored revisions of a project, see rollups.py.
+    '''
+    project = models.OneToOneField(Project)
+    contributors = models.IntegerField(_('contributors'), default=0)
+    revisions = models.IntegerField(_('revisions'), default=0)
+    linesadded = models.BigIntegerField(_('lines added'), default=0)
+    linesdeleted = models.BigIntegerField(_('lines deleted'), default=0)
+    firstcommit = models.DateTimeField(_('first commit'), null=True, blank=True)
+    lastcommit = models.DateTimeField(_('last commit'), null=True, blank=True)
+    headrev = models.IntegerField(_('head revision'), null=True, blank=True)
+
+    def __unicode__(self):
+        return unicode(self.project)
+
+class IngestJob(models.Model):
+    STATES = (
+        ('Q', _('queued')),
+        ('R', _('running')),
+        ('D', _('done')),
+        ('F', _('failed')),
+    )
+    project = models.ForeignKey(Project)
+    priority = models.IntegerField(_('priority'), default=0)
+    state = models.CharField(_('state'), max_length=1, choices=STATES, default='Q')
+    owner = models.CharField(_('owner'), max_length=100, null=True, blank=True)
+    created = models.DateTimeField(_('created'), default=datetime.datetime.now)
+    started = models.DateTimeField(_('started'), null=True, blank=True)
+    finished = models.DateTimeField(_('finished'), null=True, blank=True)
+    error = models.TextField(_('error'), null=True, blank=True)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.project, self.get_state_display())
+
+class IngestRun(models.Model):
+    '''
+    one profiled ingestion of a project (see settings.SVNSTATS_PROFILE).
+    '''
+    project = models.ForeignKey(Project)
+    started = models.DateTimeField(_('started'))
+    finished = models.DateTimeField(_('finished'))
+    fromrev = models.IntegerField(_('from revision'), null=True, blank=True)
+    torev = models.IntegerField(_('to revision'), null=True, blank=True)
+    ok = models.BooleanField(_('completed'), default=False)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.project, self.started)
+
+    @staticmethod
+    def record(project, profiler, started, fromrev, ok):
+        '''
+        store the statistics of the profiler and log the summary. Errors are only logged,
+        they must not hide the result of the ingestion.
+        '''
+        logging.info(profiler.report())
+        try:
+            run = IngestRun(project=project, started=started, finished=datetime.datetime.now(),
+                            fromrev=fromrev, torev=project.lastrev, ok=ok)
+            run.save()
+            for name, (calls, nbytes, seconds) in profiler.stats.items():
+                IngestRunStat(run=run, name=name, calls=calls, bytes=nbytes, seconds=seconds).save()
+        except Exception:
+            logging.exception("Error in saving the ingestion profile of %s" % project)
+
+class IngestRunStat(models.Model):
+    run = models.ForeignKey(IngestRun)
+    name = models.CharField(_('name'), max_length=50)
+    calls = models.IntegerField(_('calls'))
+    bytes = models.BigIntegerField(_('bytes'))
+    seconds = models.FloatField(_('seconds'))
+
+class DashboardEdits(models.Model):
+    '''
+    number of edits of the projects and authors, a single row. The names shown by the
+    dashboard change without an ingestion, hence the edits are part of the version of
+    the cached pages (see dashboard.py).
+    '''
+    edits = models.IntegerField(_('edits'), default=0)
+    modified = models.DateTimeField(_('modified'), null=True, blank=True)
+
+def noteDashboardEdit(sender, **kwargs):
+    now = datetime.datetime.now()
+    if( DashboardEdits.objects.update(edits=F('edits')+1, modified=now) == 0):
+        DashboardEdits.objects.create(edits=1, modified=now)
+
+signals.post_save.connect(noteDashboardEdit, sender=Project)
+signals.post_delete.connect(noteDashboardEdit, sender=Project)
+signals.post_save.connect(noteDashboardEdit, sender=SVNAuthor)
+signals.post_delete.connect(noteDashboardEdit, sender=SVNAuthor)
@@ -0,0 +1,163 @@
+'''
+pathcache.py
+
+path -> SVNPath id interning. SVNPath rows are never updated once created, hence the
+ids can be cached for the lifetime of the process. Lookups of cached paths do not touch
+the database; the misses of a whole revision batch are resolved with one query on the
+unique path hash and created with one bulk insert.
+
+The cache is shared by the ingestions of all the threads. The ids of the paths created
+by a transaction are kept by the caller until the transaction commits (see publish),
+so other ingestions never see the ids of a transaction which can still be rolled back.
+'''
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+
+from models import SVNPath, hashPath
+
+DEFAULT_CACHE_SIZE = 100000
+#keep the 'IN' lists below the sqlite limit of 999 parameters.
+QUERY_CHUNK = 500
+
+def chunks(items, size=QUERY_CHUNK):
+    for idx in range(0, len(items), size):
+        yield items[idx:idx+size]
+
+class SVNPathCache:
+    '''
+    bounded LRU cache of path -> SVNPath id.
+    '''
+    def __init__(self, maxsize=None):
+        if( maxsize is None):
+            maxsize = getattr(settings, 'SVNSTATS_PATH_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        self.maxsize = max(1, maxsize)
+        self.ids = OrderedDict()
+        self.lock = threading.RLock()
+        self.warmed = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return(len(self.ids))
+
+    def warm(self):
+        '''
+        fill the cache with the most recently created paths.
+        '''
+        rows = list(SVNPath.objects.order_by('-id').values_list('path', 'id')[:self.maxsize])
+        with self.lock:
+            #insert oldest first so that the newest paths are the last to be evicted.
+            for path, pathid in reversed(rows):
+                self._put(path, pathid)
+            self.warmed = True
+
+    def _put(self, path, pathid):
+        if( path in self.ids):
+            del self.ids[path]
+        self.ids[path] = pathid
+        while( len(self.ids) > self.maxsize):
+            self.ids.popitem(last=False)
+
+    def clear(self):
+        '''
+        drop all the cached ids.
+        '''
+        with self.lock:
+            self.ids.clear()
+            self.warmed = False
+
+    def publish(self, created):
+        '''
+        cache the ids of the paths created by resolve once their transaction committed.
+        The ids of a rolled back transaction are just dropped.
+        '''
+        with self.lock:
+            for path, pathid in created.items():
+                self._put(path, pathid)
+
+    def get(self, path, created):
+        '''
+        return the id of one path, creating the SVNPath row if required (see resolve).
+        '''
+        return(self.resolve([path], created)[path])
+
+    def resolve(self, paths, created):
+        '''
+        return a dictionary path -> id for all the given paths. Paths not known to the
+        database are inserted; their ids are added to the dictionary 'created' of the
+        transaction instead of the cache, which is updated by publish after the commit.
+        '''
+        if( not self.warmed):
+            self.warm()
+        resolved = dict()
+        missing = []
+        with self.lock:
+            for path in paths:
+                if( path in resolved):
+                    continue
+                pathid = created.get(path)
+                if( pathid is None):
+                    pathid = self.ids.get(path)
+                    if( pathid is not None):
+                        #move the path to the 'recently used' end of the cache.
+                        self._put(path, pathid)
+                if( pathid is None):
+                    resolved[path] = None
+                    missing.append(path)
+                else:
+                    resolved[path] = pathid
+                    self.hits = self.hits+1
+            self.misses = self.misses+len(missing)
+
+        if( len(missing) > 0):
+            found = self._lookup(missing)
+            inserted = [path for path in missing if path not in found]
+            if( len(inserted) > 0):
+                from logwriter import bulkInsert
+                sid = transaction.savepoint()
+                try:
+                    bulkInsert(SVNPath, [SVNPath(path=path, pathhash=hashPath(path)) for path in inserted])
+                    transaction.savepoint_commit(sid)
+                except IntegrityError:
+                    #an ingestion of some other project stored some of the paths meanwhile.
+                    #Savepoints do nothing on sqlite, the rows inserted before the error can
+                    #still be in the transaction. Hence all the paths of the first insert are
+                    #handled as created and cached only after the commit.
+                    transaction.savepoint_rollback(sid)
+                    found.update(self._lookup(inserted))
+                    retried = [path for path in inserted if path not in found]
+                    bulkInsert(SVNPath, [SVNPath(path=path, pathhash=hashPath(path)) for path in retried])
+                found.update(self._lookup(inserted))
+            inserted = set(inserted)
+            with self.lock:
+                for path in missing:
+                    if( path in inserted):
+                        created[path] = found[path]
+                    else:
+                        self._put(path, found[path])
+                    resolved[path] = found[path]
+
+        return(resolved)
+
+    def _lookup(self, paths):
+        found = dict()
+        for chunk in chunks(paths):
+            hashes = dict([(hashPath(path), path) for path in chunk])
+            for pathhash, pathid in SVNPath.objects.filter(pathhash__in=hashes.keys()).values_list('pathhash', 'id'):
+                found[hashes[pathhash]] = pathid
+        return(found)
+
+_pathcache = None
+
+def getPathCache():
+    '''
+    process wide path cache shared by all the ingestions.
+    '''
+    global _pathcache
+    if( _pathcache is None):
+        _pathcache = SVNPathCache()
+    return(_pathcache)
@@ -0,0 +1,198 @@
+'''
+rollups.py
+
+Daily totals per project and author (AuthorDayRollup) and the totals of every project
+(ProjectSummary). The dashboard sums the rollups of its time window instead of
+aggregating every detail row of the history, and reads the summaries instead of
+counting the revisions of every project. SVNLogWriter adds the totals of a revision
+batch in the transaction which stores the batch; changes to already stored revisions
+(excludes, recounts, repairs) rebuild the days they touch and the summary.
+'''
+
+import datetime
+
+from django.db.models import F, Sum, Min, Max
+
+from models import Project, SVNLog, AuthorDayRollup, ProjectSummary
+from pathcache import chunks
+import churn
+
+#counters of a rollup, in the order of a totals entry.
+COUNTERS = ('linesadded', 'linesdeleted', 'commits', 'addedfiles', 'changedfiles', 'deletedfiles')
+
+def addRevision(totals, author, commitdate, linesadded, linesdeleted, addedfiles, changedfiles, deletedfiles):
+    '''
+    add one revision to 'totals', a dictionary (author, day) -> list of COUNTERS.
+    '''
+    key = (author, commitdate.date())
+    counts = totals.get(key)
+    if( counts is None):
+        counts = [0] * len(COUNTERS)
+        totals[key] = counts
+    for idx, value in enumerate((linesadded, linesdeleted, 1, addedfiles, changedfiles, deletedfiles)):
+        counts[idx] = counts[idx] + (value or 0)
+
+def _newRollup(project, author, day, counts):
+    rollup = AuthorDayRollup(project=project, author=author, day=day)
+    for name, value in zip(COUNTERS, counts):
+        setattr(rollup, name, value)
+    return(rollup)
+
+def addTotals(project, totals):
+    '''
+    add 'totals' to the stored rollups of the project: one update per (author, day),
+    the missing rows are inserted together. Caller is responsible for transaction handling.
+    '''
+    from logwriter import bulkInsert
+
+    created = []
+    for (author, day), counts in totals.items():
+        increments = dict([(name, F(name)+value) for name, value in zip(COUNTERS, counts)])
+        if( AuthorDayRollup.objects.filter(project=project, author=author, day=day).update(**increments) == 0):
+            created.append(_newRollup(project, author, day, counts))
+    bulkInsert(AuthorDayRollup, created)
+
+def getSummary(project):
+    try:
+        return(ProjectSummary.objects.get(project=project))
+    except ProjectSummary.DoesNotExist:
+        return(ProjectSummary(project=project))
+
+def addSummary(project, svnlogs, totals, headrev):
+    '''
+    add the revisions 'svnlogs' with their 'totals' to the summary of the project. Has to
+    be called before their totals are added to the rollups, authors without rollups
+    are the new contributors. The project lease keeps other writers away.
+    '''
+    summary = getSummary(project)
+    authors = set([author for author, day in totals.keys()])
+    if( len(authors) > 0):
+        known = AuthorDayRollup.objects.filter(project=project, author__in=list(authors))
+        summary.contributors = summary.contributors + len(authors - set(known.values_list('author', flat=True).distinct()))
+    for svnlog in svnlogs:
+        if( summary.firstcommit is None or svnlog.commitdate < summary.firstcommit):
+            summary.firstcommit = svnlog.commitdate
+        if( summary.lastcommit is None or svnlog.commitdate > summary.lastcommit):
+            summary.lastcommit = svnlog.commitdate
+    summary.revisions = summary.revisions + len(svnlogs)
+    summary.linesadded = summary.linesadded + sum([counts[0] for counts in totals.values()])
+    summary.linesdeleted = summary.linesdeleted + sum([counts[1] for counts in totals.values()])
+    summary.headrev = headrev
+    summary.save()
+
+def computeSummary(project):
+    '''
+    summary of the project computed from its rollups and the dates of its revisions.
+    '''
+    summary = getSummary(project)
+    days = AuthorDayRollup.objects.filter(project=project)
+    counts = days.aggregate(revisions=Sum('commits'), linesadded=Sum('linesadded'), linesdeleted=Sum('linesdeleted'))
+    dates = SVNLog.objects.filter(project=project).aggregate(first=Min('commitdate'), last=Max('commitdate'))
+    summary.contributors = days.values('author').distinct().count()
+    summary.revisions = counts['revisions'] or 0
+    summary.linesadded = counts['linesadded'] or 0
+    summary.linesdeleted = counts['linesdeleted'] or 0
+    summary.firstcommit = dates['first']
+    summary.lastcommit = dates['last']
+    summary.headrev = Project.objects.filter(pk=project.pk).values_list('lastrev', flat=True)[0]
+    return(summary)
+
+def rebuildSummary(project):
+    computeSummary(project).save()
+
+def verifySummary(project):
+    '''
+    list of (counter, stored value, computed value) of the differences of the stored
+    summary of the project.
+    '''
+    stored = getSummary(project)
+    computed = computeSummary(project)
+    differences = []
+    for field in ProjectSummary._meta.local_fields:
+        if( field.primary_key or field.name == 'project'):
+            continue
+        if( getattr(stored, field.name) != getattr(computed, field.name)):
+            differences.append((field.name, getattr(stored, field.name), getattr(computed, field.name)))
+    return(differences)
+
+def computeTotals(logs):
+    '''
+    totals of the revisions of the SVNLog queryset 'logs', from the stored rows.
+    '''
+    totals = dict()
+    rows = logs.values('id', 'author', 'commitdate', 'addedfiles', 'changedfiles', 'deletedfiles')
+    rows = rows.annotate(sumadded=Sum('svnlogdetail__linesadded'), sumdeleted=Sum('svnlogdetail__linesdeleted'))
+    for row in rows.iterator():
+        addRevision(totals, row['author'], row['commitdate'], row['sumadded'], row['sumdeleted'],
+                    row['addedfiles'], row['changedfiles'], row['deletedfiles'])
+    return(totals)
+
+def getStoredTotals(project):
+    rows = AuthorDayRollup.objects.filter(project=project).values_list('author', 'day', *COUNTERS)
+    return(dict([((row[0], row[1]), list(row[2:])) for row in rows.iterator()]))
+
+def getDays(logs):
+    '''
+    the days of the revisions of the SVNLog queryset 'logs'.
+    '''
+    return(set([commitdate.date() for commitdate in logs.values_list('commitdate', flat=True).iterator()]))
+
+def getDaysOfLogs(logids):
+    days = set()
+    for chunk in chunks(list(logids)):
+        days.update(getDays(SVNLog.objects.filter(id__in=chunk)))
+    return(days)
+
+def getDaysOfRevisions(project, revnos):
+    days = set()
+    for chunk in chunks(list(revnos)):
+        days.update(getDays(SVNLog.objects.filter(project=project, revno__in=chunk)))
+    return(days)
+
+def rebuildDays(project, days):
+    '''
+    compute the rollups and the directory churn of the given days and the summary again
+    from the stored revisions. Caller is responsible for transaction handling.
+    '''
+    from logwriter import bulkInsert
+
+    for chunk in chunks(sorted(days)):
+        start = datetime.datetime.combine(chunk[0], datetime.time())
+        end = datetime.datetime.combine(chunk[-1] + datetime.timedelta(days=1), datetime.time())
+        chunkdays = set(chunk)
+        logs = SVNLog.objects.filter(project=project, commitdate__gte=start, commitdate__lt=end)
+        totals = computeTotals(logs)
+        AuthorDayRollup.objects.filter(project=project, day__in=chunk).delete()
+        bulkInsert(AuthorDayRollup, [_newRollup(project, author, day, counts)
+                                        for (author, day), counts in totals.items() if day in chunkdays])
+        churn.rebuildDays(project, logs, chunkdays)
+    rebuildSummary(project)
+
+def rebuild(project):
+    '''
+    replace all the rollups, the directory churn and the summary of the project with the
+    totals of its stored revisions. Caller is responsible for transaction handling.
+    '''
+    from logwriter import bulkInsert
+
+    totals = computeTotals(SVNLog.objects.filter(project=project))
+    AuthorDayRollup.objects.filter(project=project).delete()
+    bulkInsert(AuthorDayRollup, [_newRollup(project, author, day, counts)
+                                    for (author, day), counts in totals.items()])
+    churn.rebuild(project, SVNLog.objects.filter(project=project))
+    rebuildSummary(project)
+    return(len(totals))
+
+def verify(project):
+    '''
+    compare the stored rollups of the project with the totals of its stored revisions.
+    Returns a list of (author, day, stored counters, computed counters) of the differences,
+    missing rows have None counters.
+    '''
+    stored = getStoredTotals(project)
+    computed = computeTotals(SVNLog.objects.filter(project=project))
+    differences = []
+    for key in sorted(set(stored.keys()) | set(computed.keys())):
+        if( stored.get(key) != computed.get(key)):
+            differences.append((key[0], key[1], stored.get(key), computed.get(key)))
+    return(differences)
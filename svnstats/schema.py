@@ -0,0 +1,216 @@
+'''
+schema.py
+
+Upgrade of databases created before the hot queries were indexed, and a check of the
+query plans of those queries. syncdb creates the indexes of new tables, but never
+changes existing ones. The upgrade
+
+ - adds SVNPath.pathhash, fills it and merges the duplicate paths which ingestions
+   without the unique hash could create (details are moved to the oldest row),
+ - creates the unique (project, revno) index of SVNLog, the unique index of
+   SVNPath.pathhash and the indexes of the db_index fields.
+
+Every step can be run again. Use it through the management command
+
+    python manage.py upgradeschema [--check]
+'''
+
+import datetime
+import re
+
+from django.core.management.color import no_style
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Count, Min
+
+from models import Project, SVNLog, SVNPath, SVNLogDetail, AuthorDayRollup, DirChurnRollup, ProjectSummary, hashPath
+from pathcache import chunks
+from leaderboard import getQuery, lastDays, DEFAULT_WINDOWS
+
+#(model, field) of the plain indexes, created with the statements of syncdb.
+INDEXED_FIELDS = ((SVNLog, 'commitdate'), (SVNLog, 'author'), (AuthorDayRollup, 'author'), (AuthorDayRollup, 'day'))
+#(index name, model, columns) of the unique indexes.
+UNIQUE_INDEXES = (('svnstats_svnlog_project_revno', SVNLog, ('project_id', 'revno')),
+                  ('svnstats_svnpath_pathhash', SVNPath, ('pathhash',)))
+#tables which grow with the history. A full scan of one of them fails the plan check.
+LARGE_TABLES = (SVNLog._meta.db_table, SVNLogDetail._meta.db_table, SVNPath._meta.db_table,
+                AuthorDayRollup._meta.db_table, DirChurnRollup._meta.db_table)
+
+def getEngine():
+    return(connection.settings_dict['ENGINE'].split('.')[-1])
+
+def getColumns(model):
+    cursor = connection.cursor()
+    return([row[0] for row in connection.introspection.get_table_description(cursor, model._meta.db_table)])
+
+def execute(sql, params=()):
+    '''
+    run one DDL statement in its own transaction. Returns False if the database refused
+    it, e.g. because the column or index already exists.
+    '''
+    try:
+        with transaction.commit_on_success():
+            connection.cursor().execute(sql, params)
+            transaction.set_dirty()
+    except DatabaseError, e:
+        print 'skipped: %s (%s)' % (sql, e)
+        return(False)
+    return(True)
+
+def addPathHash():
+    '''
+    add the pathhash column of SVNPath if it is missing. It is nullable until every row
+    is hashed, the unique index comes later.
+    '''
+    if( 'pathhash' in getColumns(SVNPath)):
+        return(False)
+    qn = connection.ops.quote_name
+    return(execute('ALTER TABLE %s ADD COLUMN %s varchar(40) NULL' % \
+                        (qn(SVNPath._meta.db_table), qn('pathhash'))))
+
+def fillPathHashes():
+    '''
+    hash the paths without hash, one transaction per chunk. Returns the number of paths.
+    '''
+    count = 0
+    while( True):
+        rows = list(SVNPath.objects.filter(pathhash__isnull=True).values_list('id', 'path')[:5000])
+        if( len(rows) == 0):
+            return(count)
+        with transaction.commit_on_success():
+            for pathid, path in rows:
+                SVNPath.objects.filter(id=pathid).update(pathhash=hashPath(path))
+        count = count+len(rows)
+        print 'hashed %d paths' % count
+
+def mergeDuplicatePaths():
+    '''
+    point the details of duplicate paths to the oldest row of the path and delete the
+    other rows. Returns the number of deleted rows.
+    '''
+    merged = 0
+    duplicates = SVNPath.objects.values('pathhash').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for row in list(duplicates):
+        with transaction.commit_on_success():
+            ids = list(SVNPath.objects.filter(pathhash=row['pathhash']).exclude(id=row['keep']).values_list('id', flat=True))
+            for chunk in chunks(ids):
+                SVNLogDetail.objects.filter(changedpath__in=chunk).update(changedpath=row['keep'])
+                SVNLogDetail.objects.filter(copyfrompath__in=chunk).update(copyfrompath=row['keep'])
+                SVNPath.objects.filter(id__in=chunk).delete()
+        merged = merged+len(ids)
+    return(merged)
+
+def getDuplicateRevisions():
+    '''
+    (project id, revno) stored more than once. They prevent the unique index.
+    '''
+    duplicates = SVNLog.objects.values('project', 'revno').annotate(count=Count('id')).filter(count__gt=1)
+    return([(row['project'], row['revno']) for row in duplicates])
+
+def createIndexes():
+    '''
+    create the missing indexes. Existing indexes are reported and skipped.
+    '''
+    qn = connection.ops.quote_name
+    for name, model, columns in UNIQUE_INDEXES:
+        execute('CREATE UNIQUE INDEX %s ON %s (%s)' % (qn(name), qn(model._meta.db_table),
+                    ', '.join([qn(column) for column in columns])))
+    for model, fieldname in INDEXED_FIELDS:
+        for sql in connection.creation.sql_indexes_for_field(model, model._meta.get_field(fieldname), no_style()):
+            execute(sql)
+
+def upgrade():
+    '''
+    run all the steps. Raises ValueError if revisions are stored twice.
+    '''
+    if( addPathHash()):
+        print 'added column pathhash'
+    print 'hashed %d paths' % fillPathHashes()
+    print 'merged %d duplicate paths' % mergeDuplicatePaths()
+    duplicates = getDuplicateRevisions()
+    if( len(duplicates) > 0):
+        raise ValueError('revisions stored more than once (project id, revno): %s' % \
+                            ', '.join(['(%d, %d)' % duplicate for duplicate in duplicates[:20]]))
+    createIndexes()
+
+def getHotQueries(project):
+    '''
+    (name, queryset or (sql, params)) of the queries run by the dashboard and by every
+    ingestion, with sample arguments. getLastStoredRev reads the watermark by primary key
+    and falls back to the highest revno, which the same index serves as the ordered
+    query below.
+    '''
+    today = datetime.date.today()
+    queries = [
+        ('home: projects', ProjectSummary.objects.values_list('project', 'contributors')),
+        ('home: leaderboards', getQuery([lastDays(7, today), lastDays(30, today)])),
+        ('project: leaderboards', getQuery([lastDays(days, today) for days in DEFAULT_WINDOWS], project)),
+        ('home: recent commits', SVNLog.objects.values('author', 'msg', 'commitdate', 'project__name').order_by('-commitdate')[:6]),
+        ('getLastStoredRev: watermark', Project.objects.filter(pk=project.pk).values_list('lastrev', flat=True)),
+        ('getLastStoredRev: last revision', SVNLog.objects.filter(project=project).order_by('-revno').values_list('revno', flat=True)[:1]),
+        ('ConvertRevs: partial revisions', SVNLog.objects.filter(project=project, revno__gt=100)),
+        ('ConvertRevs: revision ids', SVNLog.objects.filter(project=project, revno__gte=1, revno__lte=100).values_list('revno', 'id')),
+        ('ConvertRevs: path ids', SVNPath.objects.filter(pathhash__in=[hashPath(u'/trunk'), hashPath(u'/branches')]).values_list('pathhash', 'id')),
+        ('api: project series', AuthorDayRollup.objects.filter(project=project, day__gte=today-datetime.timedelta(days=365)).values('day')),
+        ('api: author series', AuthorDayRollup.objects.filter(author='author', day__gte=today-datetime.timedelta(days=365)).values('day')),
+        ('churn: subtree', DirChurnRollup.objects.filter(project=project, dirhash=hashPath(u'/trunk'),
+                                day__gte=today-datetime.timedelta(days=91)).values('dirhash').annotate(count=Count('id'))),
+        ('churn: subdirectories', DirChurnRollup.objects.filter(project=project, parenthash=hashPath(u'/trunk'),
+                                day__gte=today-datetime.timedelta(days=91)).values('dirhash', 'dirpath').annotate(count=Count('id'))),
+        ('ConvertRevs: directory churn', DirChurnRollup.objects.filter(project=project, dirhash__in=[hashPath(u'/trunk')],
+                                day__gte=today-datetime.timedelta(days=1), day__lte=today)),
+        ('ConvertRevs: author totals', AuthorDayRollup.objects.filter(project=project, author='author', day=today)),
+    ]
+    return(queries)
+
+SQLITE_SCAN_RE = re.compile('^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+POSTGRES_SCAN_RE = re.compile('Seq Scan on (\w+)')
+
+def explain(sql, params):
+    '''
+    return (plan lines, tables read with a full scan) of the query.
+    '''
+    engine = getEngine()
+    cursor = connection.cursor()
+    scans = []
+    lines = []
+    if( engine == 'sqlite3'):
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        for row in cursor.fetchall():
+            detail = row[-1]
+            lines.append(detail)
+            match = SQLITE_SCAN_RE.match(detail)
+            if( match):
+                scans.append(match.group(1))
+    elif( engine == 'mysql'):
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in cursor.description]
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            lines.append('%(table)s: %(type)s %(key)s' % row)
+            if( row['type'] == 'ALL'):
+                scans.append(row['table'])
+    else:
+        cursor.execute('EXPLAIN ' + sql, params)
+        for row in cursor.fetchall():
+            lines.append(row[0])
+            match = POSTGRES_SCAN_RE.search(row[0])
+            if( match):
+                scans.append(match.group(1))
+    return(lines, scans)
+
+def checkPlans(project):
+    '''
+    explain the hot queries. Returns a list of (name, plan lines, full scans of large
+    tables); the query is not served by an index if the last one is not empty. The
+    planners of mysql and postgresql scan small tables anyway, hence check a database
+    with representative data.
+    '''
+    results = []
+    for name, query in getHotQueries(project):
+        if( isinstance(query, tuple)):
+            sql, params = query
+        else:
+            sql, params = query.query.get_compiler(connection=connection).as_sql()
+        lines, scans = explain(sql, params)
+        results.append((name, lines, [table for table in scans if table in LARGE_TABLES]))
+    return(results)
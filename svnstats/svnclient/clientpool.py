@@ -0,0 +1,66 @@
+'''
+clientpool.py
+
+pysvn.Client objects cannot be used from more than one thread at a time. SVNClientPool
+keeps a bounded set of configured clients and binds one of them to every thread which
+uses the pool, so that a thread reuses the same client (and its authentication and
+configuration state) for all its calls.
+'''
+
+import threading
+
+DEFAULT_POOL_SIZE = 6
+
+class SVNClientPool:
+    '''
+    'factory' creates a new, authenticated client. At most 'size' clients are created,
+    threads asking for a client when all of them are in use wait for a release.
+    '''
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE):
+        self.factory = factory
+        self.size = max(1, size)
+        self.clients = []
+        self.idle = []
+        self.cond = threading.Condition()
+        self.local = threading.local()
+
+    def get(self):
+        '''
+        return the client bound to the calling thread, take one from the pool if required.
+        '''
+        client = getattr(self.local, 'client', None)
+        if( client is None):
+            client = self.acquire()
+            self.local.client = client
+        return(client)
+
+    def release(self):
+        '''
+        return the client of the calling thread to the pool. Threads which used the pool
+        have to call it before they finish.
+        '''
+        client = getattr(self.local, 'client', None)
+        if( client is not None):
+            self.local.client = None
+            self.cond.acquire()
+            try:
+                self.idle.append(client)
+                self.cond.notify()
+            finally:
+                self.cond.release()
+
+    def acquire(self):
+        self.cond.acquire()
+        try:
+            while( len(self.idle) == 0 and len(self.clients) >= self.size):
+                self.cond.wait()
+            if( len(self.idle) > 0):
+                return(self.idle.pop())
+            client = self.factory()
+            self.clients.append(client)
+            return(client)
+        finally:
+            self.cond.release()
+
+    def inuse(self):
+        return(len(self.clients) - len(self.idle))
@@ -0,0 +1,158 @@
+'''
+nodecache.py
+
+Caches of per path information collected during the ingestion, used to avoid
+repository calls for information which is already known from earlier revisions.
+'''
+
+import logging
+import threading
+
+class PathCache:
+    '''
+    path -> value cache keyed by revision, with counters of the lookups and of the
+    lookups which had to fall back to a repository call. Paths are stored without
+    trailing '/'. Every path keeps the (revision, value) pairs learned so far; a value
+    holds from its revision on, until the path or one of its parents is replaced
+    (see 'change'). The revisions are processed by several threads and not
+    necessarily in order, hence a value learned in a later revision is never used for
+    an earlier one. 'loader' (path, revision) -> (revision, value) or None is asked for
+    the paths which are not known.
+    '''
+    name = 'path'
+    fallbackname = 'repository'
+
+    def __init__(self):
+        self.values = dict()
+        self.changes = dict()
+        self.lock = threading.Lock()
+        self.loader = None
+        self.lookups = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return(len(self.values))
+
+    def get(self, path, revno):
+        '''
+        value of the path in revision 'revno', None if it is not known.
+        '''
+        if( path is None):
+            return(None)
+        path = path.rstrip('/')
+        with self.lock:
+            value = self._find(path, revno)
+        if( value is None and self.loader is not None):
+            loaded = self.loader(path, revno)
+            if( loaded is not None):
+                with self.lock:
+                    self._set(path, loaded[1], loaded[0])
+                    value = self._find(path, revno)
+        return(value)
+
+    def set(self, path, value, revno):
+        '''
+        record the value of the path in revision 'revno'.
+        '''
+        with self.lock:
+            self._set(path.rstrip('/'), value, revno)
+
+    def change(self, path, revno, subtree=True):
+        '''
+        the value of the path, and with 'subtree' of everything below it, may change in
+        revision 'revno', e.g. because the path is replaced. Has to be called in revision
+        order, before any path of revision 'revno' or a later one is looked up.
+        '''
+        with self.lock:
+            self.changes.setdefault(path.rstrip('/'), []).append((revno, subtree))
+
+    def _find(self, path, revno):
+        for entryrev, value in reversed(self.values.get(path, [])):
+            if( entryrev <= revno):
+                if( self._changed(path, entryrev, revno)):
+                    return(None)
+                return(value)
+        return(None)
+
+    def _changed(self, path, start, end):
+        '''
+        check if the path or one of its parents changed after revision 'start' upto
+        revision 'end'.
+        '''
+        subtreeonly = False
+        while( path):
+            for revno, subtree in self.changes.get(path, []):
+                if( start < revno <= end and (subtree or not subtreeonly)):
+                    return(True)
+            path = path[:path.rfind('/')]
+            subtreeonly = True
+        return(False)
+
+    def _set(self, path, value, revno):
+        entries = self.values.setdefault(path, [])
+        idx = len(entries)
+        while( idx > 0 and entries[idx-1][0] > revno):
+            idx = idx-1
+        if( idx > 0 and entries[idx-1][0] == revno):
+            entries[idx-1] = (revno, value)
+        elif( idx == 0 or entries[idx-1][1] != value or self._changed(path, entries[idx-1][0], revno)):
+            entries.insert(idx, (revno, value))
+
+    def report(self):
+        '''
+        log and return the summary of the repository fallback rate.
+        '''
+        rate = 0.0
+        if( self.lookups > 0):
+            rate = self.fallbacks*100.0/self.lookups
+        summary = '%s: %d paths resolved, %d %s calls (%.1f%%)' % (self.name, self.lookups, self.fallbacks,
+                                                                    self.fallbackname, rate)
+        logging.info(summary)
+        return(summary)
+
+class NodeKindCache(PathCache):
+    '''
+    path -> node kind ('F' file or 'D' directory) of the paths seen so far. All parents
+    of a known path are directories, hence they are cached too.
+    '''
+    name = 'node kind'
+    fallbackname = 'info2'
+
+    def set(self, path, kind, revno):
+        assert(kind == 'F' or kind == 'D')
+        path = path.rstrip('/')
+        with self.lock:
+            self._set(path, kind, revno)
+            idx = path.rfind('/')
+            while( idx > 0):
+                path = path[:idx]
+                if( self._find(path, revno) == 'D'):
+                    #parents of this path are already stored
+                    break
+                self._set(path, 'D', revno)
+                idx = path.rfind('/')
+
+class BinaryFileCache(PathCache):
+    '''
+    path -> True/False if the file has a binary svn:mime-type. Updated from the diff
+    output: svn marks the binary files in the diff. A svn:mime-type change, seen in the
+    log (see svnlogiter.noteChanges) or in a diff, ends the earlier value of the path.
+    '''
+    name = 'binary file'
+    fallbackname = 'proplist'
+
+    def update(self, counter, pathmap, revno):
+        '''
+        learn the binary status of the files in the diff of revision 'revno'. 'counter'
+        is the DiffLineCounter of the diff, 'pathmap' converts the diff file names to log
+        paths.
+        '''
+        for filename in counter.counts:
+            path = pathmap(filename)
+            if( filename in counter.mimetypefiles):
+                self.change(path, revno, False)
+            if( filename in counter.binaryfiles):
+                self.set(path, True, revno)
+            elif( filename in counter.textfiles):
+                #svn shows the line diff only for the files it considers as text.
+                self.set(path, False, revno)
@@ -0,0 +1,62 @@
+'''
+pathfilter.py
+
+Matcher for the excluded paths of a project. The exclude list is a string of entries
+separated by commas, semicolons or white space. An entry is either a path prefix
+relative to the repository root (e.g. /trunk/vendor excludes the directory and
+everything below it) or a glob pattern matched against the full path (e.g. *.min.js,
+/tags/*). Prefixes are kept in a trie of path components, hence a path is matched in
+time proportional to its depth and not to the number of excludes.
+'''
+
+import fnmatch
+import re
+
+SEPARATOR_RE = re.compile('[,;\s]+')
+GLOB_CHARS = ('*', '?', '[')
+#trie key marking the end of an excluded prefix. Path components are never empty.
+_END = ''
+
+class PathFilter:
+    def __init__(self, excludes=None):
+        self.trie = dict()
+        self.globs = []
+        self.entries = []
+        if( excludes):
+            for entry in SEPARATOR_RE.split(excludes):
+                if( entry):
+                    self.add(entry)
+
+    def add(self, entry):
+        self.entries.append(entry)
+        for char in GLOB_CHARS:
+            if( char in entry):
+                self.globs.append(entry)
+                return
+        node = self.trie
+        for component in entry.strip('/').split('/'):
+            if( component):
+                node = node.setdefault(component, dict())
+        node[_END] = True
+
+    def __nonzero__(self):
+        return(len(self.entries) > 0)
+
+    def matches(self, path):
+        '''
+        True if the path is excluded.
+        '''
+        node = self.trie
+        if( _END in node):
+            return(True)
+        for component in path.strip('/').split('/'):
+            node = node.get(component)
+            if( node is None):
+                break
+            if( _END in node):
+                return(True)
+        path = path.rstrip('/')
+        for glob in self.globs:
+            if( fnmatch.fnmatchcase(path, glob)):
+                return(True)
+        return(False)
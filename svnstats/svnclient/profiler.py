@@ -0,0 +1,115 @@
+'''
+profiler.py
+
+Call counts, bytes and cumulative time of the repository calls and of the ingestion
+phases. SVNLogClient wraps its pysvn clients in a ProfiledClient if it is given a
+Profiler. Without a profiler, NULL_PROFILER is used: its phases do nothing and the
+pysvn clients are not wrapped at all.
+'''
+
+import os
+import threading
+import time
+
+#pysvn calls which go to the repository.
+PROFILED_CALLS = ('log', 'info2', 'proplist', 'diff', 'cat', 'export', 'list')
+
+class _NullPhase:
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exctype, excvalue, tb):
+        return(False)
+
+_NULL_PHASE = _NullPhase()
+
+class NullProfiler:
+    enabled = False
+
+    def phase(self, name):
+        return(_NULL_PHASE)
+
+    def record(self, name, seconds, nbytes=0):
+        pass
+
+    def report(self):
+        return('')
+
+NULL_PROFILER = NullProfiler()
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return(self)
+
+    def __exit__(self, exctype, excvalue, tb):
+        self.profiler.record(self.name, time.time()-self.start)
+        return(False)
+
+class Profiler:
+    '''
+    thread safe collection of name -> [calls, bytes, seconds].
+    '''
+    enabled = True
+
+    def __init__(self):
+        self.stats = dict()
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        '''
+        context manager recording the time of the enclosed block under 'name'.
+        '''
+        return(_Phase(self, name))
+
+    def record(self, name, seconds, nbytes=0):
+        self.lock.acquire()
+        try:
+            stat = self.stats.get(name)
+            if( stat is None):
+                stat = [0, 0, 0.0]
+                self.stats[name] = stat
+            stat[0] = stat[0]+1
+            stat[1] = stat[1]+nbytes
+            stat[2] = stat[2]+seconds
+        finally:
+            self.lock.release()
+
+    def report(self):
+        lines = ['%-24s %8s %14s %10s' % ('', 'calls', 'bytes', 'seconds')]
+        for name, (calls, nbytes, seconds) in sorted(self.stats.items(), key=lambda item: -item[1][2]):
+            lines.append('%-24s %8d %14d %10.2f' % (name, calls, nbytes, seconds))
+        return('\n'.join(lines))
+
+class ProfiledClient(object):
+    '''
+    proxy of a pysvn.Client recording the repository calls as 'svn.<call>'. The bytes
+    are the size of the returned diff or contents, or of the exported file.
+    '''
+    def __init__(self, client, profiler):
+        object.__setattr__(self, 'client', client)
+        object.__setattr__(self, 'profiler', profiler)
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if( name not in PROFILED_CALLS):
+            return(attr)
+        profiler = self.profiler
+        def call(*args, **kwargs):
+            start = time.time()
+            result = attr(*args, **kwargs)
+            nbytes = 0
+            if( isinstance(result, basestring)):
+                nbytes = len(result)
+            elif( name == 'export' and len(args) > 1 and os.path.isfile(args[1])):
+                nbytes = os.path.getsize(args[1])
+            profiler.record('svn.' + name, time.time()-start, nbytes)
+            return(result)
+        return(call)
+
+    def __setattr__(self, name, value):
+        setattr(self.client, name, value)
@@ -0,0 +1,689 @@
+'''
+svndump.py
+
+Read the history of a repository from a 'svnadmin dump' or 'svnrdump dump' stream
+instead of querying the repository path by path. The dump is read once, sequentially.
+The file contents are kept in a content store on disk, so that copies, deltas
+(dump format version 3 / --deltas) and line counts can be resolved locally.
+
+SVNDumpRevLogIter yields DumpRevLog objects which offer the same interface as
+SVNRevLog for the ingestion (revno, date, author, message, changedFileCount and
+getDiffLineCount), and compute the line counts the same way as SVNRevLog does.
+Line counts of modified files are computed with difflib, which can differ from the
+svn diff on ambiguous hunks.
+'''
+
+import difflib
+import hashlib
+import marshal
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zlib
+
+from svnlogclient import makeunicode, normurlpath, countLines
+
+SVNDATE_RE = re.compile('(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)')
+
+class SVNDumpError(Exception):
+    pass
+
+def parseSvnDate(datestr):
+    '''
+    convert the svn:date property (e.g. 2011-10-19T03:04:05.123456Z) to a datetime in
+    UTC, without microseconds like convert2datetime.
+    '''
+    import datetime
+    match = SVNDATE_RE.match(datestr)
+    if( match is None):
+        return(None)
+    return(datetime.datetime(*[int(part) for part in match.groups()]))
+
+def isTextMimeType(fmimetype):
+    '''
+    same rule as SVNLogClient: text/* and two image types are text, everything else is binary.
+    '''
+    return(fmimetype.startswith('text/') or fmimetype == 'image/x-xbitmap' or fmimetype == 'image/x-xpixmap')
+
+def _readVarint(data, pos):
+    value = 0
+    while True:
+        byte = ord(data[pos])
+        pos = pos+1
+        value = (value << 7) | (byte & 0x7f)
+        if( byte & 0x80 == 0):
+            return(value, pos)
+
+def _decompressSection(data, version):
+    if( version == 0):
+        return(data)
+    origlen, pos = _readVarint(data, 0)
+    data = data[pos:]
+    if( len(data) == origlen):
+        #section is stored uncompressed as compression didnot reduce its size.
+        return(data)
+    return(zlib.decompress(data))
+
+def applySvnDiff(source, delta):
+    '''
+    apply a svndiff (version 0 or 1) delta to the source text and return the target text.
+    '''
+    if( delta[:3] != 'SVN'):
+        raise SVNDumpError('invalid svndiff header')
+    version = ord(delta[3])
+    if( version not in (0, 1)):
+        raise SVNDumpError('svndiff version %d is not supported' % version)
+    target = []
+    pos = 4
+    while( pos < len(delta)):
+        sviewoffset, pos = _readVarint(delta, pos)
+        sviewlen, pos = _readVarint(delta, pos)
+        tviewlen, pos = _readVarint(delta, pos)
+        inslen, pos = _readVarint(delta, pos)
+        newlen, pos = _readVarint(delta, pos)
+        instructions = _decompressSection(delta[pos:pos+inslen], version)
+        pos = pos+inslen
+        newdata = _decompressSection(delta[pos:pos+newlen], version)
+        pos = pos+newlen
+
+        sview = source[sviewoffset:sviewoffset+sviewlen]
+        tview = []
+        newpos = 0
+        ipos = 0
+        while( ipos < len(instructions)):
+            byte = ord(instructions[ipos])
+            ipos = ipos+1
+            opcode = byte >> 6
+            length = byte & 0x3f
+            if( length == 0):
+                length, ipos = _readVarint(instructions, ipos)
+            if( opcode == 0):
+                offset, ipos = _readVarint(instructions, ipos)
+                tview.append(sview[offset:offset+length])
+            elif( opcode == 1):
+                offset, ipos = _readVarint(instructions, ipos)
+                window = ''.join(tview)
+                tview = [window]
+                #target copies can overlap with the data being produced (run length encoding)
+                while( length > 0):
+                    chunk = window[offset:offset+length]
+                    window = window + chunk
+                    offset = offset+len(chunk)
+                    length = length-len(chunk)
+                tview = [window]
+            elif( opcode == 2):
+                tview.append(newdata[newpos:newpos+length])
+                newpos = newpos+length
+            else:
+                raise SVNDumpError('invalid svndiff instruction')
+        window = ''.join(tview)
+        if( len(window) != tviewlen):
+            raise SVNDumpError('svndiff window length mismatch')
+        target.append(window)
+    return(''.join(target))
+
+def parseProps(data):
+    '''
+    parse a property block. Returns (props, deleted) where 'deleted' is the list of
+    property names deleted in a property delta.
+    '''
+    props = dict()
+    deleted = []
+    pos = 0
+    while( pos < len(data)):
+        lineend = data.index('\n', pos)
+        line = data[pos:lineend]
+        pos = lineend+1
+        if( line == 'PROPS-END'):
+            break
+        kind, length = line.split(' ')
+        length = int(length)
+        key = data[pos:pos+length]
+        pos = pos+length+1
+        if( kind == 'D'):
+            deleted.append(key)
+            continue
+        lineend = data.index('\n', pos)
+        length = int(data[pos:lineend].split(' ')[1])
+        pos = lineend+1
+        props[key] = data[pos:pos+length]
+        pos = pos+length+1
+    return(props, deleted)
+
+class SVNDumpReader:
+    '''
+    low level reader of the dump stream. Yields (headers, props, text) records. 'props' is
+    None if the record has no property block, 'text' is None if it has no text block.
+    '''
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def _readHeaders(self):
+        headers = dict()
+        line = self.fileobj.readline()
+        #records are separated by one or more empty lines
+        while( line == '\n'):
+            line = self.fileobj.readline()
+        while( line not in ('', '\n')):
+            key, value = line.rstrip('\n').split(': ', 1)
+            headers[key] = value
+            line = self.fileobj.readline()
+        return(headers)
+
+    def _read(self, length):
+        data = self.fileobj.read(length)
+        if( len(data) != length):
+            raise SVNDumpError('unexpected end of dump stream')
+        return(data)
+
+    def __iter__(self):
+        while True:
+            headers = self._readHeaders()
+            if( len(headers) == 0):
+                break
+            proplen = int(headers.get('Prop-content-length', -1))
+            textlen = int(headers.get('Text-content-length', -1))
+            props = None
+            text = None
+            if( proplen >= 0):
+                props = self._read(proplen)
+            if( textlen >= 0):
+                text = self._read(textlen)
+            contentlen = int(headers.get('Content-length', 0))
+            rest = contentlen - max(proplen, 0) - max(textlen, 0)
+            if( rest > 0):
+                self._read(rest)
+            yield headers, props, text
+
+class ContentStore:
+    '''
+    content addressed store of the file texts on disk.
+    '''
+    def __init__(self, path=None):
+        self.ownpath = path is None
+        if( path is None):
+            path = tempfile.mkdtemp(prefix='svndump')
+        self.path = path
+
+    def put(self, text):
+        key = hashlib.sha1(text).hexdigest()
+        filename = os.path.join(self.path, key)
+        if( not os.path.exists(filename)):
+            contents = open(filename, 'wb')
+            try:
+                contents.write(text)
+            finally:
+                contents.close()
+        return(key)
+
+    def get(self, key):
+        if( key is None):
+            return('')
+        contents = open(os.path.join(self.path, key), 'rb')
+        try:
+            return(contents.read())
+        finally:
+            contents.close()
+
+    def size(self, key):
+        if( key is None):
+            return(0)
+        return(os.path.getsize(os.path.join(self.path, key)))
+
+    def open(self, key):
+        return(open(os.path.join(self.path, key), 'rb'))
+
+    def close(self):
+        if( self.ownpath):
+            shutil.rmtree(self.path, True)
+
+class NodeState:
+    def __init__(self, kind, textkey=None, props=None):
+        self.kind = kind
+        self.textkey = textkey
+        if( props is None):
+            props = dict()
+        self.props = props
+
+    def isBinary(self):
+        mimetype = self.props.get('svn:mime-type')
+        return(mimetype is not None and not isTextMimeType(mimetype))
+
+class DumpRepository:
+    '''
+    versioned tree of the repository read so far, a deleted path has state None. Only
+    the current state of the paths is kept in memory. Later revisions can copy from any
+    earlier revision, hence the replaced states are moved to an sqlite file on disk and
+    read from there for the copies and the previous revision of the changed paths.
+    '''
+    def __init__(self, path=None):
+        self.ownpath = path is None
+        if( path is None):
+            fd, path = tempfile.mkstemp(prefix='svndump', suffix='.db')
+            os.close(fd)
+        self.path = path
+        self.states = dict()
+        self.children = dict()
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE IF NOT EXISTS history (path TEXT, revno INTEGER, kind TEXT, textkey TEXT, props BLOB)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS history_path ON history (path, revno)')
+
+    def stateAt(self, path, revno):
+        current = self.states.get(path)
+        if( current is None):
+            return(None)
+        if( current[0] <= revno):
+            return(current[1])
+        row = self.db.execute('SELECT kind, textkey, props FROM history WHERE path = ? AND revno <= ? ' \
+                              'ORDER BY revno DESC LIMIT 1', (path, revno)).fetchone()
+        if( row is None or row[0] is None):
+            return(None)
+        textkey = row[1]
+        if( textkey is not None):
+            textkey = str(textkey)
+        return(NodeState(str(row[0]), textkey, marshal.loads(str(row[2]))))
+
+    def current(self, path):
+        current = self.states.get(path)
+        if( current is None):
+            return(None)
+        return(current[1])
+
+    def setState(self, path, revno, state):
+        current = self.states.get(path)
+        if( current is None):
+            parent = path[:path.rfind('/')]
+            self.children.setdefault(parent, set()).add(path)
+        elif( current[0] != revno):
+            oldrev, oldstate = current
+            if( oldstate is None):
+                self.db.execute('INSERT INTO history VALUES (?, ?, NULL, NULL, NULL)', (path, oldrev))
+            else:
+                self.db.execute('INSERT INTO history VALUES (?, ?, ?, ?, ?)', (path, oldrev, oldstate.kind,
+                                oldstate.textkey, buffer(marshal.dumps(oldstate.props))))
+        self.states[path] = (revno, state)
+
+    def subtree(self, path, revno=None):
+        '''
+        iterate over (path, state) of all the paths below 'path' existing in revision 'revno'
+        (latest revision if revno is None).
+        '''
+        pending = list(self.children.get(path, ()))
+        while( len(pending) > 0):
+            child = pending.pop()
+            if( revno is None):
+                state = self.current(child)
+            else:
+                state = self.stateAt(child, revno)
+            if( state is not None):
+                yield child, state
+                if( state.kind == 'D'):
+                    pending.extend(self.children.get(child, ()))
+
+    def delete(self, path, revno):
+        for child, state in list(self.subtree(path)):
+            self.setState(child, revno, None)
+        self.setState(path, revno, None)
+
+    def copy(self, srcpath, srcrev, path, revno):
+        for child, state in list(self.subtree(srcpath, srcrev)):
+            self.setState(path + child[len(srcpath):], revno, state)
+
+    def close(self):
+        self.db.close()
+        if( self.ownpath and os.path.exists(self.path)):
+            os.remove(self.path)
+
+class DumpChange:
+    '''
+    one changed path of a revision, the counterpart of a changed_paths entry of the svn log.
+    '''
+    def __init__(self, path, action, kind, before):
+        self.path = path
+        self.action = action
+        self.kind = kind
+        self.before = before
+        self.after = None
+        self.copyfrom_path = None
+        self.copyfrom_revision = None
+        self.lc_added = 0
+        self.lc_deleted = 0
+        self.excluded = False
+        self.oversized = False
+
+    def is_copied(self):
+        return(self.copyfrom_path is not None and len(self.copyfrom_path) > 0 and self.copyfrom_revision is not None)
+
+class DumpChangeEntry:
+    '''
+    same interface as SVNChangeEntry for the values used by the ingestion.
+    '''
+    def __init__(self, change):
+        self.change = change
+
+    def filepath(self):
+        path = self.change.path
+        if( self.change.kind == 'D'):
+            path = path + u'/'
+        return(path)
+
+    def filepath_unicode(self):
+        return(makeunicode(self.filepath()))
+
+    def change_type(self):
+        return(self.change.action)
+
+    def pathtype(self):
+        return(self.change.kind)
+
+    def isDirectory(self):
+        return(self.change.kind == 'D')
+
+    def entrytype(self):
+        if( self.change.excluded):
+            return('X')
+        if( self.change.oversized):
+            return('S')
+        return('R')
+
+    def lc_added(self):
+        return(self.change.lc_added)
+
+    def lc_deleted(self):
+        return(self.change.lc_deleted)
+
+    def copyfrom(self):
+        path = self.change.copyfrom_path
+        if( path is not None and self.isDirectory() and not path.endswith('/')):
+            path = path + u'/'
+        return(makeunicode(path), self.change.copyfrom_revision)
+
+class DumpRevLog:
+    def __init__(self, revno, props, changes):
+        self.revno = revno
+        self.props = props
+        self.changes = changes
+
+    def isvalid(self):
+        return(self.date is not None)
+
+    @property
+    def date(self):
+        datestr = self.props.get('svn:date')
+        if( datestr is None):
+            return(None)
+        return(parseSvnDate(datestr))
+
+    @property
+    def author(self):
+        return(self.props.get('svn:author', ''))
+
+    @property
+    def message(self):
+        msg = self.props.get('svn:log')
+        if( msg is None):
+            return(u'')
+        return(makeunicode(msg))
+
+    def getChangeEntries(self):
+        for change in self.changes:
+            yield DumpChangeEntry(change)
+
+    def changedFileCount(self):
+        filesadded = 0
+        fileschanged = 0
+        filesdeleted = 0
+        for change in self.changes:
+            if( change.kind == 'F' and not change.excluded):
+                if( change.action == 'A'):
+                    filesadded = filesadded+1
+                elif( change.action == 'D'):
+                    filesdeleted = filesdeleted+1
+                else:
+                    fileschanged = fileschanged+1
+        return(filesadded, fileschanged, filesdeleted)
+
+    def getDiffLineCount(self, bUpdLineCount=True):
+        return(self.getChangeEntries())
+
+class SVNDumpRevLogIter:
+    '''
+    iterate over the revisions of a dump stream. 'relpath' is the path of the project
+    url relative to the repository root (e.g. /trunk), only the changes below it are
+    returned. 'binaryext' is the binary file extension list as for SVNLogClient,
+    'excludes' the PathFilter of the excluded paths and 'maxfilesize' the size limit of
+    the counted files as for SVNLogClient. The revisions before 'startrev' only update
+    the repository state, they are returned without changes and line counts.
+    '''
+    def __init__(self, fileobj, relpath=u'', binaryext=[], store=None, excludes=None, maxfilesize=None, startrev=0):
+        self.reader = SVNDumpReader(fileobj)
+        self.relpath = normurlpath(makeunicode(relpath.rstrip('/')))
+        self.binaryextlist = tuple([u'.' + ext.strip().lower() for ext in binaryext])
+        if( store is None):
+            store = ContentStore()
+        self.store = store
+        self.repo = DumpRepository()
+        self.excludes = excludes
+        self.maxfilesize = maxfilesize
+        self.startrev = startrev
+
+    def __iter__(self):
+        return(self.next())
+
+    def next(self):
+        revno = None
+        revprops = None
+        changes = None
+        changedpaths = None
+        try:
+            for headers, props, text in self.reader:
+                if( 'Revision-number' in headers):
+                    if( revno is not None):
+                        revlog = self._finishRevision(revno, revprops, changes)
+                        if( revlog is not None):
+                            yield revlog
+                    revno = int(headers['Revision-number'])
+                    revprops = dict()
+                    if( props is not None):
+                        revprops = parseProps(props)[0]
+                    changes = []
+                    changedpaths = dict()
+                elif( 'Node-path' in headers):
+                    if( revno is None):
+                        raise SVNDumpError('node record before the first revision')
+                    self._applyNode(revno, headers, props, text, changes, changedpaths)
+            if( revno is not None):
+                revlog = self._finishRevision(revno, revprops, changes)
+                if( revlog is not None):
+                    yield revlog
+        finally:
+            self.repo.close()
+            self.store.close()
+
+    def _applyNode(self, revno, headers, props, text, changes, changedpaths):
+        '''
+        apply a node record to the repository state and to the change of its path in
+        'changes', which 'changedpaths' maps by path.
+        '''
+        path = normurlpath(u'/' + makeunicode(headers['Node-path']))
+        action = headers['Node-action']
+        repo = self.repo
+
+        change = changedpaths.get(path)
+        before = repo.current(path)
+        kind = headers.get('Node-kind')
+        if( kind is not None):
+            kind = {'file':'F', 'dir':'D'}[kind]
+        elif( before is not None):
+            kind = before.kind
+
+        if( change is None):
+            actioncode = {'change':'M', 'add':'A', 'delete':'D', 'replace':'R'}[action]
+            change = DumpChange(path, actioncode, kind, before)
+            changes.append(change)
+            changedpaths[path] = change
+        elif( change.action == 'D' and action == 'add'):
+            #delete followed by add of the same path is a replace
+            change.action = 'R'
+            change.kind = kind
+        if( action == 'delete'):
+            repo.delete(path, revno)
+            change.after = None
+            return
+
+        base = before
+        if( action in ('add', 'replace')):
+            if( action == 'replace'):
+                repo.delete(path, revno)
+            base = None
+            copyfrompath = headers.get('Node-copyfrom-path')
+            if( copyfrompath is not None):
+                copyfrompath = normurlpath(u'/' + makeunicode(copyfrompath))
+                copyfromrev = int(headers['Node-copyfrom-rev'])
+                change.copyfrom_path = copyfrompath
+                change.copyfrom_revision = copyfromrev
+                base = repo.stateAt(copyfrompath, copyfromrev)
+                if( base is None):
+                    raise SVNDumpError('copy source %s@%d not found' % (copyfrompath, copyfromrev))
+                if( kind == 'D'):
+                    repo.copy(copyfrompath, copyfromrev, path, revno)
+
+        state = NodeState(kind)
+        if( base is not None):
+            state.textkey = base.textkey
+            state.props = dict(base.props)
+        if( props is not None):
+            newprops, deleted = parseProps(props)
+            if( headers.get('Prop-delta') != 'true'):
+                state.props = dict()
+            state.props.update(newprops)
+            for key in deleted:
+                state.props.pop(key, None)
+        if( text is not None):
+            if( headers.get('Text-delta') == 'true'):
+                text = applySvnDiff(self.store.get(state.textkey), text)
+            state.textkey = self.store.put(text)
+        repo.setState(path, revno, state)
+        change.after = state
+
+    def _isValidPath(self, path):
+        #same prefix check as SVNLogClient.isChildPath
+        return(path.startswith(self.relpath))
+
+    def _updateCopyFromPaths(self, changes):
+        '''
+        same as SVNRevLog.__updateCopyFromPaths: paths modified or deleted below a copied
+        directory get the matching path in the copy source as 'copy from' path.
+        '''
+        copyfrom = [(change.path, change.copyfrom_path, change.copyfrom_revision) for change in changes \
+                        if( change.copyfrom_path != None and len(change.copyfrom_path) > 0)]
+        copyfrom = sorted(copyfrom, reverse=True)
+        for change in changes:
+            if( change.action != 'A'):
+                for curpath, copyfrompath, copyfromrev in copyfrom:
+                    if( not curpath.endswith('/')):
+                        curpath = curpath + '/'
+                    if( change.path.startswith(curpath) and change.copyfrom_path is None):
+                        if( not copyfrompath.endswith('/')):
+                            copyfrompath = copyfrompath + '/'
+                        change.copyfrom_path = normurlpath(change.path.replace(curpath, copyfrompath, 1))
+                        change.copyfrom_revision = copyfromrev
+
+    def _finishRevision(self, revno, revprops, changes):
+        if( revno == 0):
+            return(None)
+        if( revno < self.startrev):
+            return(DumpRevLog(revno, revprops, []))
+        self._updateCopyFromPaths(changes)
+        changes = [change for change in changes if self._isValidPath(change.path)]
+        if( self.excludes):
+            for change in changes:
+                change.excluded = self.excludes.matches(change.path)
+        if( self.maxfilesize):
+            for change in changes:
+                if( change.kind == 'F' and not change.excluded and not change.path.lower().endswith(self.binaryextlist)):
+                    state = change.after
+                    if( change.action == 'D'):
+                        state = self._prevState(change, revno)
+                    change.oversized = state is not None and self.store.size(state.textkey) > self.maxfilesize
+        if( self.relpath and len(changes) == 0):
+            #log of a sub path url doesnot contain revisions which donot touch the path.
+            return(None)
+        self._updateLineCounts(revno, changes)
+        return(DumpRevLog(revno, revprops, changes))
+
+    def _prevState(self, change, revno):
+        if( change.copyfrom_path is not None and change.copyfrom_revision is not None):
+            return(self.repo.stateAt(change.copyfrom_path, change.copyfrom_revision))
+        return(self.repo.stateAt(change.path, revno-1))
+
+    def _isBinary(self, path, state):
+        if( path.lower().endswith(self.binaryextlist)):
+            return(True)
+        return(state is not None and state.isBinary())
+
+    def _lineCount(self, state):
+        if( state is None or state.textkey is None):
+            return(countLines(_EmptyFile()))
+        contents = self.store.open(state.textkey)
+        try:
+            return(countLines(contents))
+        finally:
+            contents.close()
+
+    def _lines(self, state):
+        if( state is None):
+            return([])
+        return(self.store.get(state.textkey).splitlines(True))
+
+    def _diffCount(self, oldstate, newstate):
+        old = self._lines(oldstate)
+        new = self._lines(newstate)
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        matched = sum([block[2] for block in matcher.get_matching_blocks()])
+        return(len(new)-matched, len(old)-matched)
+
+    def _updateLineCounts(self, revno, changes):
+        '''
+        same counts as SVNRevLog: whole file line counts for added and deleted files, diff
+        counts for modified files. SVNRevLog counts a file the same with the revision
+        level diff and with the file level calls, hence the choice between them does not
+        matter here.
+        '''
+        for change in changes:
+            if( change.kind != 'F' or change.excluded or change.oversized):
+                continue
+            prev = self._prevState(change, revno)
+            if( change.action == 'D'):
+                prevpath = change.path
+                if( change.copyfrom_path is not None):
+                    prevpath = change.copyfrom_path
+                if( self._isBinary(prevpath, prev)):
+                    continue
+            elif( self._isBinary(change.path, change.after)):
+                continue
+
+            added = 0
+            deleted = 0
+            if( change.action == 'A'):
+                added = self._lineCount(change.after)
+            elif( change.action == 'D'):
+                deleted = self._lineCount(prev)
+            elif( change.action == 'R'):
+                prev = self.repo.stateAt(change.path, revno-1)
+                if( prev is not None):
+                    added, deleted = self._diffCount(prev, change.after)
+                else:
+                    added = self._lineCount(change.after)
+            else:
+                added, deleted = self._diffCount(prev, change.after)
+            change.lc_added = added
+            change.lc_deleted = deleted
+
+class _EmptyFile:
+    def read(self, size=-1):
+        return('')
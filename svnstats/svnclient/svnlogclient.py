@@ -19,9 +19,12 @@ import types
 import tempfile
 from os.path import normpath
 from operator import itemgetter
-from StringIO import StringIO
 import pysvn
 
+from clientpool import SVNClientPool, DEFAULT_POOL_SIZE
+from nodecache import NodeKindCache, BinaryFileCache
+from profiler import NULL_PROFILER, ProfiledClient
+
 SVN_HEADER_ENCODING = 'utf-8'
 URL_NORM_RE = re.compile('[/]+')
 
@@ -56,85 +59,258 @@ def normurlpath(pathstr):
         
     return(nrmpath)
     
-def getDiffLineCountDict(diff_log):
-    diff_log = makeunicode(diff_log)
-    diffio = StringIO(diff_log)
-    addlnCount=0
-    dellnCount=0
-    curfile=None
-    diffCountDict = dict()
-    newfilediffstart = 'Index: '
-    newfilepropdiffstart = 'Property changes on: '
-    for diffline in diffio:
-        #remove the newline characters near the end of line
-        diffline = diffline.rstrip()
-        if(diffline.find(newfilediffstart)==0):
-            #diff for new file has started update the old filename.
-            if(curfile != None):
-                diffCountDict[curfile] = (addlnCount, dellnCount)
-            #reset the linecounts and current filename
-            addlnCount = 0
-            dellnCount = 0
-            #Index line entry doesnot have '/' as start of file path. Hence add the '/'
-            #so that path entries in revision log list match with the names in the 'diff count' dictionary
-            logging.debug(diffline)
-            curfile = u'/'+diffline[len(newfilediffstart):]
-        elif(diffline.find(newfilepropdiffstart)==0):
-            #property modification diff has started. Ignore it.
-            if(curfile != None):
-                diffCountDict[curfile] = (addlnCount, dellnCount)
-            curfile = u'/'+diffline[len(newfilepropdiffstart):]
-            #only properties are modified. there is no content change. hence set the line count to 0,0
-            if( curfile not in diffCountDict):
-                diffCountDict[curfile] = (0, 0)
-        elif(diffline.find('---')==0 or diffline.find('+++')==0 or diffline.find('@@')==0 or diffline.find('===')==0):                
-            continue
-        elif(diffline.find('-')==0):
-            dellnCount = dellnCount+1                
-        elif(diffline.find('+')==0):
-             addlnCount = addlnCount+1
+DIFF_CHUNK_SIZE = 256*1024
+LINECOUNT_CHUNK_SIZE = 1024*1024
+NEWFILE_DIFF_START = '\nIndex: '
+NEWFILE_PROPDIFF_START = '\nProperty changes on: '
+BINARY_DIFF_MARKER = '\nCannot display: file marked as a binary type.'
+NONEWLINE_MARKER = '\n\\ No newline at end of file'
+MIMETYPE_PROP = ': svn:mime-type'
+
+class DiffLineCounter:
+    '''
+    streaming line counter for (unified) svn diff output. The diff is fed as byte
+    strings of any size with 'feed'. Lines are never split or decoded one by one,
+    only the 'Index:' and 'Property changes on:' header lines are decoded. Line counts
+    are identical to the old line by line counter: counts are reset only on 'Index:'
+    lines, lines starting with '---' or '+++' are not counted.
+    Files which svn marks as binary in the diff are collected in 'binaryfiles', files
+    with content (not property) line changes in 'textfiles', files whose
+    svn:mime-type property is changed in 'mimetypefiles' and files whose last line has
+    no newline in 'nonewlinefiles'.
+    '''
+    def __init__(self):
+        self.counts = dict()
+        self.binaryfiles = set()
+        self.textfiles = set()
+        self.mimetypefiles = set()
+        self.nonewlinefiles = set()
+        self.inprops = False
+        self.curfile = None
+        self.added = 0
+        self.deleted = 0
+        self.pending = ''
+
+    def feed(self, data):
+        buf = self.pending + data
+        last = buf.rfind('\n')
+        if( last < 0):
+            self.pending = buf
+            return
+        self.pending = buf[last+1:]
+        #prefix the virtual line start so that every line start is '\\n'
+        self._countBlock('\n' + buf[:last])
+
+    def close(self):
+        '''
+        process the remaining partial line and return the dictionary of
+        filename -> (lines added, lines deleted)
+        '''
+        if( len(self.pending) > 0):
+            self._countBlock('\n' + self.pending)
+            self.pending = ''
+        if( self.curfile != None):
+            self.counts[self.curfile] = (self.added, self.deleted)
+        return(self.counts)
+
+    def fileLineCount(self, filename, lines):
+        '''
+        line count of an added or deleted file from its 'lines' diff lines, the same as
+        countLines of the file contents (newlines + 1). The diff line count is one less,
+        unless the last line has no newline.
+        '''
+        if( filename in self.nonewlinefiles):
+            return(lines)
+        return(lines+1)
+
+    def _countLines(self, block, start, end):
+        if( self.curfile != None and start < end):
+            if( self.inprops):
+                if( block.find(MIMETYPE_PROP, start, end) >= 0):
+                    self.mimetypefiles.add(self.curfile)
+            elif( block.find(BINARY_DIFF_MARKER, start, end) >= 0):
+                self.binaryfiles.add(self.curfile)
+            elif( block.find(NONEWLINE_MARKER, start, end) >= 0):
+                self.nonewlinefiles.add(self.curfile)
+        added = block.count('\n+', start, end) - block.count('\n+++', start, end)
+        deleted = block.count('\n-', start, end) - block.count('\n---', start, end)
+        if( self.curfile != None and not self.inprops and (added > 0 or deleted > 0)):
+            self.textfiles.add(self.curfile)
+        self.added = self.added + added
+        self.deleted = self.deleted + deleted
+
+    def _countBlock(self, block):
+        pos = 0
+        blocklen = len(block)
+        nextindex = block.find(NEWFILE_DIFF_START)
+        nextprop = block.find(NEWFILE_PROPDIFF_START)
+        while( nextindex >= 0 or nextprop >= 0):
+            if( nextprop < 0 or (nextindex >= 0 and nextindex < nextprop)):
+                header, prefix = nextindex, NEWFILE_DIFF_START
+            else:
+                header, prefix = nextprop, NEWFILE_PROPDIFF_START
+            self._countLines(block, pos, header)
+            lineend = block.find('\n', header+1)
+            if( lineend < 0):
+                lineend = blocklen
+            filename = block[header+len(prefix):lineend].rstrip()
+            if( len(filename) > 0):
+                self._startFile(prefix, u'/'+makeunicode(filename))
+            pos = lineend
+            if( header == nextindex):
+                nextindex = block.find(NEWFILE_DIFF_START, lineend)
+            else:
+                nextprop = block.find(NEWFILE_PROPDIFF_START, lineend)
+        self._countLines(block, pos, blocklen)
+
+    def _startFile(self, prefix, filename):
+        if( self.curfile != None):
+            self.counts[self.curfile] = (self.added, self.deleted)
+        logging.debug(filename)
+        self.curfile = filename
+        self.inprops = (prefix == NEWFILE_PROPDIFF_START)
+        if( prefix == NEWFILE_DIFF_START):
+            #diff for new file has started. reset the linecounts.
+            self.added = 0
+            self.deleted = 0
+        elif( filename not in self.counts):
+            #property modification diff. Only properties are modified, there is no
+            #content change. hence set the line count to 0,0
+            self.counts[filename] = (0, 0)
+
+def getDiffLineCountDict(diff_log, chunksize=DIFF_CHUNK_SIZE):
+    '''
+    return the dictionary of filename -> (lines added, lines deleted) for the diff
+    output 'diff_log'. 'diff_log' can be a string or a file object. Index lines entry
+    doesnot have '/' as start of file path, hence '/' is added so that path entries
+    in revision log list match with the names in the dictionary. Every file name is
+    decoded on its own (utf-8, else latin-1) like the log paths. The line by line
+    counter decoded the whole diff at once, hence a single line which was not utf-8
+    turned all the non-ASCII names into latin-1 names which did not match the log.
+    The names are only matched against the log paths, the stored paths are taken from
+    the log.
+    '''
+    return(countDiff(diff_log, chunksize).counts)
+
+def countDiff(diff_log, chunksize=DIFF_CHUNK_SIZE):
+    '''
+    run the DiffLineCounter over the diff output and return the counter.
+    '''
+    counter = DiffLineCounter()
+    if( diff_log):
+        if( hasattr(diff_log, 'read')):
+            data = diff_log.read(chunksize)
+            while( data):
+                counter.feed(data)
+                data = diff_log.read(chunksize)
+        else:
+            if( isinstance(diff_log, unicode)):
+                diff_log = diff_log.encode('utf-8')
+            for offset in xrange(0, len(diff_log), chunksize):
+                counter.feed(diff_log[offset:offset+chunksize])
+    counter.close()
+    return(counter)
     
-    #update last file stat in the dictionary.
-    if( curfile != None):
-        diffCountDict[curfile] = (addlnCount, dellnCount)
-    return(diffCountDict)
+def countLines(fileobj, chunksize=LINECOUNT_CHUNK_SIZE):
+    '''
+    count the lines of a file object the same way as re.findall("$", contents, re.M)
+    but without reading the whole file in memory. "$" matches before every newline and
+    at the end of the contents, hence the count is number of newlines + 1, with or
+    without the trailing newline.
+    '''
+    linecount = 1
+    data = fileobj.read(chunksize)
+    while( data):
+        linecount = linecount + data.count('\n')
+        data = fileobj.read(chunksize)
+    return(linecount)
     
 class SVNLogClient:
-    def __init__(self, svnrepourl,binaryext=[], username=None,password=None):
+    '''
+    SVNLogClient can be used from multiple threads. Every thread gets its own pysvn.Client
+    from a pool of at most 'poolsize' clients (see releaseClient), the cached values
+    (root url, node kinds, binary files) are shared by all the threads. With a 'profiler'
+    the repository calls are recorded.
+    '''
+    def __init__(self, svnrepourl,binaryext=[], username=None,password=None, poolsize=DEFAULT_POOL_SIZE,
+                 profiler=None):
         self.svnrooturl = None
         self.tmppath = None
         self.username = None
         self.password = None
         self._updateTempPath()
         self.svnrepourl = svnrepourl
-        self.svnclient = pysvn.Client()
-        self.svnclient.exception_style = 1
-        self.svnclient.callback_get_login = self.get_login
-        self.svnclient.callback_ssl_server_trust_prompt = self.ssl_server_trust_prompt
-        self.svnclient.callback_ssl_client_cert_password_prompt = self.ssl_client_cert_password_prompt
+        if( profiler is None):
+            profiler = NULL_PROFILER
+        self.profiler = profiler
+        self.pool = SVNClientPool(self._newClient, poolsize)
         self.setbinextlist(binaryext)
         self.set_user_password(username, password)
-        
+        self.nodekinds = NodeKindCache()
+        self.binaryfiles = BinaryFileCache()
+        #PathFilter of the excluded paths, set by the caller.
+        self.excludes = None
+        #files larger than this (bytes) are not diffed or counted. None or 0 is no limit.
+        self.maxfilesize = None
+
+    def clearCaches(self):
+        '''
+        forget the node kinds and binary files learned so far. The caches rely on reading
+        the revisions without gaps (see svnlogiter.noteChanges), hence a caller reading
+        single revisions has to clear them in between.
+        '''
+        self.nodekinds = NodeKindCache()
+        self.binaryfiles = BinaryFileCache()
+
+    def _newClient(self):
+        client = pysvn.Client()
+        client.exception_style = 1
+        client.callback_get_login = self.get_login
+        client.callback_ssl_server_trust_prompt = self.ssl_server_trust_prompt
+        client.callback_ssl_client_cert_password_prompt = self.ssl_client_cert_password_prompt
+        if( self.username != None and self.username != u''):
+            client.set_default_username(self.username)
+        if( self.password != None):
+            client.set_default_password(self.password)
+        if( self.profiler.enabled):
+            client = ProfiledClient(client, self.profiler)
+        return(client)
+
+    @property
+    def svnclient(self):
+        '''
+        pysvn client of the calling thread.
+        '''
+        return(self.pool.get())
+
+    def releaseClient(self):
+        '''
+        give the pysvn client of the calling thread back to the pool. Worker threads have
+        to call it when they are done with the repository.
+        '''
+        self.pool.release()
+
     def setbinextlist(self, binextlist):
         '''
-        set extensionlist for binary files with some cleanup if required.
+        set extensionlist for binary files with some cleanup if required. Extensions
+        are matched case insensitive.
         '''
         binaryextlist = []
         for binext in binextlist:
-            binext = binext.strip()
+            binext = binext.strip().lower()
             binext = u'.' + binext
             binaryextlist.append(binext)
-            binext = binext.upper()
-            binaryextlist.append(binext)
         self.binaryextlist = tuple(binaryextlist)
 
     def set_user_password(self,username, password):
         if( username != None and username != u''):
             self.username = username
-            self.svnclient.set_default_username(self.username)
+            for client in self.pool.clients:
+                client.set_default_username(self.username)
         if( password != None):
             self.password = password
-            self.svnclient.set_default_password(self.password)
+            for client in self.pool.clients:
+                client.set_default_password(self.password)
         
     def get_login(self, realm, username, may_save):
         logging.debug("This is a svnclient.callback_get_login event. ")
@@ -443,12 +619,12 @@ class SVNLogClient:
                 
         return(fullpath.startswith(self.svnrepourl))
 
-    def __isBinaryFileExt(self, filepath):
+    def isBinaryFileExt(self, filepath):
         '''
         check the extension of filepath and see if the extension is in binary files
         list
         '''
-        return(filepath.endswith(self.binaryextlist))        
+        return(filepath.lower().endswith(self.binaryextlist))        
 
     def __isTextMimeType(self, fmimetype):
         '''
@@ -483,13 +659,38 @@ class SVNLogClient:
                
         return(binary)
     
+    def getFileSizes(self, dirpath, revno):
+        '''
+        return a dictionary path -> size in bytes of the files directly inside the
+        directory 'dirpath' in revision 'revno'. Single 'list' call, the file contents
+        are not transferred.
+        '''
+        url = self.getUrl(dirpath)
+        rev = pysvn.Revision(pysvn.opt_revision_kind.number, revno)
+        entries = self.svnclient.list(url, peg_revision=rev, revision=rev, depth=pysvn.depth.immediates,
+                                      dirent_fields=pysvn.SVN_DIRENT_KIND | pysvn.SVN_DIRENT_SIZE)
+        sizes = dict()
+        for entry, lock in entries:
+            if( entry.kind == pysvn.node_kind.file):
+                sizes[normurlpath(makeunicode(entry.repos_path))] = entry.size
+        return(sizes)
+
     def isBinaryFile(self, filepath, revno):
+        '''
+        check if the file is binary. The svn:mime-type property is queried only if the
+        binary status of the path is not known from earlier diffs.
+        '''
         assert(filepath is not None)
         assert(revno > 0)
-        binary = self.__isBinaryFileExt(filepath)
+        binary = self.isBinaryFileExt(filepath)
         
         if( binary == False):
-            binary = self.__isBinaryFile(filepath, revno)
+            self.binaryfiles.lookups = self.binaryfiles.lookups+1
+            binary = self.binaryfiles.get(filepath, revno)
+            if( binary is None):
+                self.binaryfiles.fallbacks = self.binaryfiles.fallbacks+1
+                binary = self.__isBinaryFile(filepath, revno)
+                self.binaryfiles.set(filepath, binary, revno)
         return(binary)
     
     def isDirectory(self, revno, changepath):
@@ -513,15 +714,26 @@ class SVNLogClient:
         return(isDir)
         
     def _getLineCount(self, filepath, revno):
+        '''
+        count the lines of the file. The file is exported to a temporary file and counted
+        in chunks, hence the memory use doesnot depend on the file size.
+        '''
         linecount = 0
         
         logging.info("Trying to get linecount for %s" % (filepath))
         rev = pysvn.Revision(pysvn.opt_revision_kind.number, revno)
         url = self.getUrl(filepath)
-        contents = self.svnclient.cat(url, revision = rev)
-        matches = re.findall("$", contents, re.M )
-        if( matches != None):
-            linecount = len(matches)
+        fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=self.tmppath)
+        os.close(fd)
+        try:
+            self.svnclient.export(url, tmpfile, force=True, revision=rev)
+            contents = open(tmpfile, 'rb')
+            try:
+                linecount = countLines(contents)
+            finally:
+                contents.close()
+        finally:
+            os.remove(tmpfile)
         logging.debug("%s linecount : %d" % (filepath, linecount))
         
         return(linecount)
@@ -580,6 +792,15 @@ class SVNLogClient:
             url = self.getRootUrl() + urllib.pathname2url(path)
         return(url)
 
+    def getRepoRelPath(self):
+        '''
+        path of the repository url relative to the repository root (e.g. /trunk). Empty
+        string if the repository url is the root.
+        '''
+        rooturl = self.getRootUrl().rstrip('/')
+        relpath = self.svnrepourl.rstrip('/')[len(rooturl):]
+        return(normurlpath(makeunicode(urllib.unquote(relpath))))
+
     def isRepoUrlSameAsRoot(self):
         repourl = self.svnrepourl.rstrip('/')
         rooturl = self.getRootUrl()
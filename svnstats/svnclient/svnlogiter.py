@@ -19,42 +19,187 @@ import os, re, string
 import urllib, urlparse
 import getpass
 import tempfile
+import threading
+import Queue
 from operator import itemgetter
 from StringIO import StringIO
 from svnlogclient import *
 
+#maximum number of files in a revision for the revision level diff.
+REVDIFF_MAX_FILES = 1000
+
+#log batches are sized so that one 'log' call takes about LOG_TARGET_SECONDS and
+#returns at most about LOG_MAX_PATHS changed paths.
+LOG_TARGET_SECONDS = 2.0
+LOG_MAX_PATHS = 20000
+LOG_MIN_BATCH = 10
+LOG_MAX_BATCH = 1000
+
+_DONE = object()
+
+def _put(queue, item, stopped):
+    '''
+    put the item in a bounded queue. Gives up (returns False) once 'stopped' is set.
+    '''
+    while( not stopped.isSet()):
+        try:
+            queue.put(item, True, 0.5)
+            return(True)
+        except Queue.Full:
+            pass
+    return(False)
+
+def noteChanges(logclient, revlog):
+    '''
+    note the paths of a revision whose node kind or svn:mime-type can change: added and
+    replaced paths, and paths with property changes. Called in revision order, before the
+    revision is processed (see nodecache.PathCache.change). Older servers do not report
+    the property changes, the diffs tell the svn:mime-type changes then.
+    '''
+    revno = revlog.revision.number
+    for change in revlog.changed_paths:
+        path = normurlpath(change['path'])
+        if( change['action'] in ('A', 'R')):
+            logclient.nodekinds.change(path, revno)
+            logclient.binaryfiles.change(path, revno)
+        elif( change.get('prop_mods')):
+            logclient.binaryfiles.change(path, revno, False)
+
+def nextBatchSize(size, count, paths, elapsed):
+    '''
+    size of the next log batch from the revision count, the changed path count and
+    the time of the last batch. Grows at most by a factor of two per batch.
+    '''
+    if( count == 0):
+        return(size)
+    newsize = size*2
+    if( elapsed > 0):
+        newsize = min(newsize, int(size*LOG_TARGET_SECONDS/elapsed))
+    if( paths > 0):
+        newsize = min(newsize, int(LOG_MAX_PATHS*count/paths))
+    return(max(LOG_MIN_BATCH, min(LOG_MAX_BATCH, newsize)))
+
 class SVNRevLogIter:
-    def __init__(self, logclient, startRevNo, endRevNo, cachesize=50):
+    '''
+    iterate over the log of a revision range. The logs are fetched in batches; with
+    'prefetch' > 0 a background thread fetches upto 'prefetch' batches ahead while the
+    current batch is processed. 'cachesize' is the size of the first batch, the later
+    batch sizes adapt to the server latency and the changed paths per revision.
+    '''
+    def __init__(self, logclient, startRevNo, endRevNo, cachesize=50, prefetch=2):
         self.logclient = logclient
         self.startrev = startRevNo
         self.endrev = endRevNo
         self.revlogcache = None
         self.cachesize = cachesize
-        
+        self.prefetch = prefetch
+        self.queue = None
+        #time the consumer waited for the next batch and the time of the log calls.
+        self.waittime = 0.0
+        self.fetchtime = 0.0
+        self.batches = 0
+        self.revisions = 0
+
     def __iter__(self):
         return(self.next())
 
     def next(self):
+        for revlog in self.rawlogs():
+            svnrevlog = SVNRevLog(self.logclient, revlog)
+            yield svnrevlog
+
+    def queuedepth(self):
+        '''
+        number of fetched batches waiting to be processed.
+        '''
+        if( self.queue is None):
+            return(0)
+        return(self.queue.qsize())
+
+    def report(self):
+        return('log: %d revisions in %d batches, %.1fs in log calls, %.1fs waiting for the server' % \
+                    (self.revisions, self.batches, self.fetchtime, self.waittime))
+
+    def rawlogs(self):
+        '''
+        iterate over the pysvn log entries without wrapping them in SVNRevLog objects.
+        '''
         if( self.endrev == 0):
             self.endrev = self.logclient.getHeadRevNo()
         if( self.startrev == 0):
             self.startrev = self.endrev
-        
-        while (self.startrev < self.endrev):
+
+        if( self.prefetch > 0):
+            batches = self._prefetchedBatches()
+        else:
+            batches = self._batches()
+        try:
+            for batch in batches:
+                for revlog in batch:
+                    #since reach revision log entry is a dictionary. If the dictionary is empty
+                    #then log is not available or its end of log entries
+                    if( len(revlog) == 0):
+                        raise StopIteration
+                    noteChanges(self.logclient, revlog)
+                    yield revlog
+        finally:
+            #stops the prefetch thread
+            batches.close()
+
+    def _batches(self):
+        batchsize = self.cachesize
+        while (self.startrev <= self.endrev):
             logging.info("updating logs %d to %d" % (self.startrev, self.endrev))
+            start = time.time()
             self.revlogcache = self.logclient.getLogs(self.startrev, self.endrev,
-                                                          cachesize=self.cachesize, detailedLog=True)
+                                                          cachesize=batchsize, detailedLog=True)
+            elapsed = time.time()-start
+            self.fetchtime = self.fetchtime + elapsed
             if( self.revlogcache == None or len(self.revlogcache) == 0):
                 raise StopIteration
-            
+
+            self.batches = self.batches+1
+            self.revisions = self.revisions+len(self.revlogcache)
             self.startrev = self.revlogcache[-1].revision.number+1
-            for revlog in self.revlogcache:
-                #since reach revision log entry is a dictionary. If the dictionary is empty
-                #then log is not available or its end of log entries
-                if( len(revlog) == 0):
-                    raise StopIteration
-                svnrevlog = SVNRevLog(self.logclient, revlog)
-                yield svnrevlog
+            paths = sum([len(revlog.get('changed_paths', [])) for revlog in self.revlogcache])
+            batch = self.revlogcache
+            batchsize = nextBatchSize(batchsize, len(batch), paths, elapsed)
+            yield batch
+
+    def _prefetchedBatches(self):
+        self.queue = Queue.Queue(self.prefetch)
+        stopped = threading.Event()
+        fetcher = threading.Thread(target=self._fetch, args=(self.queue, stopped))
+        fetcher.setDaemon(True)
+        fetcher.start()
+        try:
+            while True:
+                start = time.time()
+                batch = self.queue.get()
+                elapsed = time.time()-start
+                self.waittime = self.waittime + elapsed
+                self.logclient.profiler.record('wait for log', elapsed)
+                if( batch is _DONE):
+                    break
+                if( isinstance(batch, Exception)):
+                    raise batch
+                yield batch
+        finally:
+            stopped.set()
+
+    def _fetch(self, queue, stopped):
+        try:
+            try:
+                for batch in self._batches():
+                    if( not _put(queue, batch, stopped)):
+                        return
+            except Exception, expinst:
+                logging.exception("Error in fetching revision logs")
+                _put(queue, expinst, stopped)
+                return
+            _put(queue, _DONE, stopped)
+        finally:
+            self.logclient.releaseClient()
 
 class SVNChangeEntry:
     '''
@@ -69,6 +214,29 @@ class SVNChangeEntry:
         self.revno = parent.getRevNo()
         self.changedpath = changedpath
                 
+    def __inferPathType(self):
+        '''
+        find the path type without querying the repository. Returns None if the path type
+        cannot be inferred.
+        '''
+        #newer servers report the node kind in the log itself.
+        nodekind = self.changedpath.get('node_kind')
+        if( nodekind == pysvn.node_kind.dir):
+            return('D')
+        if( nodekind == pysvn.node_kind.file):
+            return('F')
+        #some other path in this revision is inside this path.
+        if( self.parent.isParentDir(self.filepath())):
+            return('D')
+        nodekinds = self.logclient.nodekinds
+        if( self.is_copied()):
+            return(nodekinds.get(self.changedpath['copyfrom_path'], self.prev_revno()))
+        #a modified or deleted path existed before. Its type is known if it was seen earlier.
+        #An added or replaced path can be of a different type than the earlier path.
+        if( self.change_type() in ('M', 'D')):
+            return(nodekinds.get(self.filepath(), self.revno))
+        return(None)
+
     def __updatePathType(self):
         '''
         Update the path type of change entry. 
@@ -84,10 +252,22 @@ class SVNChangeEntry:
                 assert(filepath != None)            
                 revno= self.prev_revno()
                 
-            #see if directory check is alredy done on this path. If not, then check with the repository        
-            pathtype = 'F'
-            if(self.logclient.isDirectory(revno, filepath) ==True):
-                pathtype='D'
+            nodekinds = self.logclient.nodekinds
+            nodekinds.lookups = nodekinds.lookups+1
+            pathtype = self.__inferPathType()
+            if( pathtype is None and self.isExcluded()):
+                #excluded paths are not queried. The guess is not cached, the path type is
+                #checked if the path is included again (see Project.applyExcludes)
+                pathtype = 'F'
+            elif( pathtype is None):
+                #path type is not known. Check with the repository
+                nodekinds.fallbacks = nodekinds.fallbacks+1
+                pathtype = 'F'
+                if(self.logclient.isDirectory(revno, filepath) ==True):
+                    pathtype='D'
+                nodekinds.set(self.filepath(), pathtype, self.revno)
+            else:
+                nodekinds.set(self.filepath(), pathtype, self.revno)
             self.changedpath['pathtype'] = pathtype
             #filepath may changed in case of 'delete' action.
             filepath = self.filepath()
@@ -101,7 +281,57 @@ class SVNChangeEntry:
         if the repository path is same is repository 'root'
         '''
         return(self.logclient.isChildPath(self.filepath()))
-    
+
+    def isExcluded(self):
+        '''
+        check if the path matches the excludes of the project. Excluded paths are stored
+        without line counts and without querying the repository for them.
+        '''
+        if( 'excluded' not in self.changedpath):
+            excludes = getattr(self.logclient, 'excludes', None)
+            self.changedpath['excluded'] = bool(excludes) and excludes.matches(self.filepath())
+        return(self.changedpath['excluded'])
+
+    def isOversized(self):
+        '''
+        check the size of the file against the size limit (logclient.maxfilesize) before its
+        contents are transferred. Oversized files are stored without line counts. Files
+        with a binary extension are never transferred, their directory is not listed.
+        '''
+        if( 'oversized' not in self.changedpath):
+            oversized = False
+            maxfilesize = getattr(self.logclient, 'maxfilesize', None)
+            if( maxfilesize and not self.isExcluded() and self.pathtype() == 'F'):
+                filepath = self.filepath()
+                revno = self.revno
+                if( self.change_type() == 'D'):
+                    filepath = self.prev_filepath()
+                    revno = self.prev_revno()
+                if( not self.logclient.isBinaryFileExt(filepath)):
+                    size = self.parent.getFileSize(filepath, revno)
+                    oversized = size is not None and size > maxfilesize
+            self.changedpath['oversized'] = oversized
+        return(self.changedpath['oversized'])
+
+    def entrytype(self):
+        '''
+        (R)egular, e(X)cluded or (S)kipped because of the file size.
+        '''
+        if( self.isExcluded()):
+            return('X')
+        if( self.isOversized()):
+            return('S')
+        return('R')
+
+    def canUseRevDiff(self):
+        '''
+        check if the line count of this entry can be taken from the revision level diff.
+        Revision level diff ignores the ancestry, hence copied and replaced paths need
+        file level diff.
+        '''
+        return(self.change_type() in ('A', 'M', 'D') and not self.is_copied() and not self.isExcluded() \
+                    and not self.isDirectory())
+
     def is_branchtag(self):
         '''
         Is this entry represent a branch or tag.
@@ -196,7 +426,7 @@ class SVNChangeEntry:
         '''        
         binary=False
         #check detailed binary check only if the change entry is of a file.
-        if( self.pathtype() == 'F'):
+        if( self.pathtype() == 'F' and not self.isExcluded()):
             revno = self.revno
             filepath = self.filepath()
             
@@ -205,12 +435,18 @@ class SVNChangeEntry:
                 logging.debug("Found file deletion for <%s>" % filepath)
                 filepath = self.prev_filepath()
                 revno= self.prev_revno()
+            elif( self.is_copied()):
+                #copied file has the properties of the copy source.
+                binaryfiles = self.logclient.binaryfiles
+                copied = binaryfiles.get(self.prev_filepath(), self.prev_revno())
+                if( binaryfiles.get(filepath, revno) is None and copied is not None):
+                    binaryfiles.set(filepath, copied, revno)
             binary = self.logclient.isBinaryFile(filepath, revno)
             
         return(binary)    
                                            
     def updateDiffLineCountFromDict(self, diffCountDict):
-        if( 'lc_added' not in self.changedpath):
+        if( 'lc_added' not in self.changedpath and not self.isExcluded() and not self.isOversized()):
             try:
                 linesadded=0
                 linesdeleted=0
@@ -229,7 +465,10 @@ class SVNChangeEntry:
         added = self.changedpath.get('lc_added', 0)
         deleted = self.changedpath.get('lc_deleted', 0)
             
-        if( 'lc_added' not in self.changedpath):
+        if( 'lc_added' not in self.changedpath and (self.isExcluded() or self.isOversized())):
+            self.changedpath['lc_added'] = 0
+            self.changedpath['lc_deleted'] = 0
+        elif( 'lc_added' not in self.changedpath):
             revno = self.revno
             filepath = self.filepath()
             changetype = self.change_type()
@@ -237,7 +476,16 @@ class SVNChangeEntry:
             prev_revno = self.prev_revno()
             filename = filepath
 
-            if( self.isDirectory() == False and not self.isBinaryFile() ):
+            if( self.isDirectory() == False and changetype not in ('A', 'D', 'R')):
+                #path is modified. svn marks binary files in the diff, hence diff first and
+                #check the binary status after that. This saves the 'proplist' call. Files
+                #with a binary extension are not diffed at all.
+                if( not self.logclient.isBinaryFileExt(filepath)):
+                    added, deleted = self.__getDiffLineCount(filepath, revno,prev_filepath, prev_revno)
+                if( self.isBinaryFile()):
+                    added = 0
+                    deleted = 0
+            elif( self.isDirectory() == False and not self.isBinaryFile() ):
                 #path is added or deleted. First check if the path is a directory. If path is not a directory
                 # then process further.
                 if( changetype == 'A'):
@@ -254,10 +502,6 @@ class SVNChangeEntry:
                         added, deleted = self.__getDiffLineCount(filepath, revno,None, None)
                     except:
                         added = self.logclient.getLineCount(filepath, revno)
-                else:
-                    #change type is 'changetype != 'A' and changetype != 'D'
-                    #directory is modified
-                    added, deleted = self.__getDiffLineCount(filepath, revno,prev_filepath, prev_revno)
                     
             logging.debug("DiffLineCount %d : %s : %s : %d : %d " % (revno, filename, changetype, added, deleted))
             self.changedpath['lc_added'] = added
@@ -267,10 +511,13 @@ class SVNChangeEntry:
     
     def __getDiffLineCount(self, filepath, revno, prev_filepath, prev_revno):
         diff_log = self.logclient.getRevFileDiff(filepath, revno,prev_filepath, prev_revno)
-        diffDict = getDiffLineCountDict(diff_log)
+        with self.logclient.profiler.phase('parse diff'):
+            counter = countDiff(diff_log)
+        diffDict = counter.counts
         added=0
         deleted=0
         if( len(diffDict)==1):
+            self.logclient.binaryfiles.update(counter, lambda fname: filepath, revno)
             #for single files the 'diff_log' contains only the 'name of file' and not full path.
             #Hence to need to 'extract' the filename from full filepath
             filename = u'/'+filepath.rsplit(u'/', 2)[-1]
@@ -280,11 +527,14 @@ class SVNChangeEntry:
 class SVNRevLog:
     def __init__(self, logclient, revnolog):
         self.logclient = logclient
+        self.diffcountdict = None
+        self.parentdirs = None
+        self.filesizes = dict()
         if( isinstance(revnolog, pysvn.PysvnLog) == False):
             self.revlog = self.logclient.getLog(revnolog, detailedLog=True)
         else:
             self.revlog = revnolog
-        assert(self.revlog == None or isinstance(revnolog, pysvn.PysvnLog)==True)
+        assert(self.revlog == None or isinstance(self.revlog, pysvn.PysvnLog)==True)
         if( self.revlog):
             self.__normalizePaths()
             self.__updateCopyFromPaths()
@@ -345,6 +595,40 @@ class SVNRevLog:
                             change['copyfrom_path'] = normurlpath(curfilepath.replace(curpath, copyfrompath,1))
                             change['copyfrom_revision'] = copyfromrev                    
                 
+    def isParentDir(self, path):
+        '''
+        check if some changed path of this revision is inside the given path. Such a path
+        is a directory.
+        '''
+        if( self.parentdirs is None):
+            parentdirs = set()
+            for change in self.revlog.changed_paths:
+                changepath = change['path'].rstrip('/')
+                idx = changepath.rfind('/')
+                while( idx > 0):
+                    changepath = changepath[:idx]
+                    if( changepath in parentdirs):
+                        break
+                    parentdirs.add(changepath)
+                    idx = changepath.rfind('/')
+            self.parentdirs = parentdirs
+        return(path.rstrip('/') in self.parentdirs)
+
+    def getFileSize(self, filepath, revno):
+        '''
+        size of a file changed in this revision, None if it is not known. The files are
+        listed per directory, i.e. one 'list' call per directory and revision.
+        '''
+        dirpath = filepath[:filepath.rfind('/')+1]
+        key = (dirpath, revno)
+        if( key not in self.filesizes):
+            try:
+                self.filesizes[key] = self.logclient.getFileSizes(dirpath, revno)
+            except pysvn.ClientError:
+                logging.exception("Error in listing %s@%d" % (dirpath, revno))
+                self.filesizes[key] = dict()
+        return(self.filesizes[key].get(filepath))
+
     def getChangeEntries(self):
         '''
         get the change entries from each changed path entry
@@ -377,6 +661,8 @@ class SVNRevLog:
         logging.debug("Changed path count : %d" % len(self.revlog.changed_paths))
         
         for change in self.getChangeEntries():
+                if( change.isExcluded()):
+                    continue
                 isdir = change.isDirectory()
                 if( isdir == False):
                     action = change.change_type()                
@@ -399,7 +685,10 @@ class SVNRevLog:
         """                        
         diffCountDict = None
         if( bUpdLineCount == True):
-            diffCountDict = self.__updateDiffCount()
+            #diff the revision only once even if the line counts are asked for multiple times.
+            if( self.diffcountdict is None):
+                self.diffcountdict = self.__updateDiffCount()
+            diffCountDict = self.diffcountdict
                     
         #get change entries sorted in the order of actions, and then paths.
         
@@ -412,6 +701,15 @@ class SVNRevLog:
             logging.debug("%d : %s : %s : %d : %d " % (self.revno, filename, change.change_type(), linesadded, linesdeleted))
             yield change                    
     
+    def prepare(self):
+        '''
+        run all the repository queries needed for this revision (path types, binary file
+        checks and line counts) so that later calls are answered from the cached values.
+        '''
+        self.changedFileCount()
+        for change in self.getDiffLineCount(True):
+            pass
+
     def getCopiedDirs(self):        
         '''
         return a list of change entries where directory is added/replaced during
@@ -465,59 +763,97 @@ class SVNRevLog:
             return(filesadded+fileschanged+filesdeleted)
         return(None)
     
-    def __useFileRevDiff(self):
-        '''
-        file level revision diff requires less memory but more calls to repository.
-        Hence for large sized repositories, repository with many large commits, and
-        repositories which are local file system, it is better to use file level revision
-        diff. For other cases it is better to query diff of entire revision at a time.
-        '''
-        # repourl is not same as repository root (e.g. <root>/trunk) then we have to
-        # use the file revision diffs.
-        usefilerevdiff = True
-        if( self.logclient.isRepoUrlSameAsRoot()):
-            usefilerevdiff = False
-        rooturl = self.logclient.getRootUrl()
-        if( rooturl.startswith('file://')):
-            usefilerevdiff=True
-        if( not usefilerevdiff ):
-            #check if there are additions or deletions. If yes, then use 'file level diff' to
-            #avoid memory errors in large number of file additions or deletions.
-            fadded, fchanged, fdeleted = self.changedFileCount()
-            if( fadded > 1 or fdeleted > 1 or fchanged > 5):
-                usefilerevdiff=True
-        
-        #For the time being always return True, as in case of 'revision level' diff filenames returned
-        #in the diff are different than the filename returned by the svn log. hence this will result
-        #wrong linecount computation. So far, I don't have good fix for this condition. Hence falling
-        #back to using 'file level' diffs. This will result in multiple calls to repository and hence
-        # will be slower but linecount data will be  more reliable. -- Nitin (15 Dec 2010)
-        #usefilerevdiff=True
-        return(usefilerevdiff)
-        
+    def __getRevDiffEntries(self):
+        '''
+        return the change entries whose line counts can be taken from a single revision
+        level diff, or None if the file level diffs should be used for this revision.
+        Revision level diff needs one call to repository instead of one call per file. But
+        the complete diff of the revision is held in memory, hence it is not used for
+        revisions adding or deleting a very large number of files or whole directories.
+        '''
+        entries = [change for change in self.getChangeEntries() if change.canUseRevDiff()]
+        #with a single file, file level diff is also a single call.
+        if( len(entries) < 2):
+            return(None)
+        #the revision diff contains the full text of every file below a copied or deleted
+        #directory (branches, tags, removed trees). Their lines are not used.
+        if( len(self.getCopiedDirs()) > 0 or len(self.getDeletedDirs()) > 0):
+            return(None)
+        #the revision diff contains the excluded files too. Diff the files one by one
+        #if that saves most of the diff (e.g. a commit to a vendor directory).
+        excluded = [change for change in self.getChangeEntries() if change.isExcluded() \
+                        and change.change_type() in ('A', 'M', 'D') and not change.is_copied()]
+        if( len(excluded) > len(entries)):
+            return(None)
+        #the revision diff would transfer the oversized files too.
+        for change in entries:
+            if( change.isOversized()):
+                return(None)
+        maxfiles = getattr(self.logclient, 'revdiffmaxfiles', REVDIFF_MAX_FILES)
+        if( maxfiles is not None and len(entries) > maxfiles):
+            return(None)
+        return(entries)
+
+    def __getRevDiffCountDict(self, entries):
+        '''
+        get the line counts of the change entries from the revision level diff. 'Index:'
+        paths in the diff are relative to the repository url, while the log paths are
+        relative to the repository root. Hence the paths are prefixed with the repository
+        url path (e.g. /trunk). Added and deleted files are counted as getLineCount counts
+        them, hence a file has the same count with and without the revision diff. Returns
+        None if the revision diff is not available.
+        '''
+        revno = self.getRevNo()
+        try:
+            revdiff_log = self.logclient.getRevDiff(revno)
+        except pysvn.ClientError, expinst:
+            #e.g. repository url doesnot exist in the previous revision
+            logging.debug("Revision diff of %d failed. Using file level diff" % revno)
+            return(None)
+        relpath = self.logclient.getRepoRelPath()
+        pathmap = lambda filename: normurlpath(relpath + filename)
+        with self.logclient.profiler.phase('parse diff'):
+            counter = countDiff(revdiff_log)
+        #the diff tells which files svn considers binary. Saves the 'proplist' calls for those files.
+        self.logclient.binaryfiles.update(counter, pathmap, revno)
+        filenames = dict()
+        for filename in counter.counts:
+            filenames[pathmap(filename)] = filename
+        diffcountdict = dict()
+        for change in entries:
+            filepath = change.filepath()
+            if( filepath not in filenames):
+                continue
+            filename = filenames[filepath]
+            added, deleted = counter.counts[filename]
+            if( change.change_type() == 'A'):
+                added = counter.fileLineCount(filename, added)
+            elif( change.change_type() == 'D'):
+                deleted = counter.fileLineCount(filename, deleted)
+            diffcountdict[filepath] = (added, deleted)
+        return(diffcountdict)
+
     def __updateDiffCount(self):
         diffcountdict = dict()            
         try:
             revno = self.getRevNo()                            
             logging.debug("Updating line count for revision %d" % revno)
-            if( self.__useFileRevDiff()):
-                logging.debug("Using file level revision diff")
-                for change in self.getChangeEntries():
-                    filename = change.filepath()
-                    diffcountdict[filename] = change.getDiffLineCount()
-            else:                
-                #if the svnrepourl and root url are same then we can use 'revision level' diff calls
-                # get 'diff' of multiple files included in a 'revision' by a single svn api call.
-                # As All the changes are 'modifications' (M type) then directly call the 'getRevDiff'.
-                #getRevDiff fails if there are files added or 'deleted' and repository path is not
-                # the root path.
+            revdiffentries = self.__getRevDiffEntries()
+            revdiffdict = None
+            if( revdiffentries is not None):
                 logging.debug("Using entire revision diff at a time")
-                revdiff_log = self.logclient.getRevDiff(revno)                
-                diffcountdict = getDiffLineCountDict(revdiff_log)
+                revdiffdict = self.__getRevDiffCountDict(revdiffentries)
+            if( revdiffdict is not None):
+                diffcountdict.update(revdiffdict)
+            #entries which are not matched in the revision diff (copies, replaced files, paths
+            #with unexpected names) are counted with file level diffs.
+            for change in self.getChangeEntries():
+                filename = change.filepath()
+                if( filename not in diffcountdict):
+                    diffcountdict[filename] = change.getDiffLineCount()
             
         except Exception, expinst:            
             logging.exception("Error in diffline count")
             raise
                         
         return(diffcountdict)
-                 
@@ -0,0 +1,127 @@
+'''
+svnpipeline.py
+
+Concurrent version of SVNRevLogIter. The svn log is fetched on one thread, the path
+type checks, binary file checks and diffs of each revision run on a pool of worker
+threads, and the revisions are handed back to the caller in revision number order.
+The stages are connected by bounded queues so that a slow consumer (e.g. the database
+writer) throttles the repository queries.
+'''
+
+import logging
+import threading
+import Queue
+
+from svnlogiter import SVNRevLogIter, SVNRevLog, _put
+
+_DONE = object()
+
+class SVNRevLogPipeline:
+    def __init__(self, logclient, startRevNo, endRevNo, workers=4, queuesize=None, cachesize=50):
+        self.logclient = logclient
+        self.startrev = startRevNo
+        self.endrev = endRevNo
+        #the fetch thread, the workers and the calling thread each hold a client of the pool.
+        #With less than 3 clients the only worker would wait for a client forever.
+        if( logclient.pool.size < 3):
+            raise ValueError('the pipeline needs at least 3 pysvn clients, the pool has %d' % logclient.pool.size)
+        self.workers = max(1, min(workers, logclient.pool.size-2))
+        if( queuesize is None):
+            queuesize = self.workers*4
+        self.queuesize = max(self.workers, queuesize)
+        self.cachesize = cachesize
+        self.logiter = None
+
+    def __iter__(self):
+        return(self.next())
+
+    def next(self):
+        #'inflight' bounds the number of revisions which are fetched but not yet
+        #consumed. Without it, one slow revision would let the reorder buffer grow without limit.
+        inflight = threading.Semaphore(self.queuesize)
+        logqueue = Queue.Queue(self.queuesize)
+        resultqueue = Queue.Queue()
+        stopped = threading.Event()
+
+        self.logiter = SVNRevLogIter(self.logclient, self.startrev, self.endrev, self.cachesize)
+        threads = [threading.Thread(target=self._fetch, args=(logqueue, resultqueue, inflight, stopped))]
+        for idx in range(self.workers):
+            threads.append(threading.Thread(target=self._work, args=(logqueue, resultqueue, stopped)))
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+
+        try:
+            nextseq = 0
+            lastseq = None
+            finished = dict()
+            errors = dict()
+            while( lastseq is None or nextseq < lastseq):
+                with self.logclient.profiler.phase('wait for revision'):
+                    seq, result = resultqueue.get()
+                if( result is _DONE):
+                    lastseq = seq
+                    continue
+                if( isinstance(result, Exception)):
+                    errors[seq] = result
+                else:
+                    finished[seq] = result
+                #errors are raised in revision order, after all the earlier revisions are consumed.
+                while( nextseq in errors or nextseq in finished):
+                    if( nextseq in errors):
+                        raise errors[nextseq]
+                    revlog = finished.pop(nextseq)
+                    nextseq = nextseq+1
+                    inflight.release()
+                    yield revlog
+            if( lastseq in errors):
+                raise errors[lastseq]
+        finally:
+            stopped.set()
+            #wake up the fetch thread if it is waiting for a free slot.
+            for idx in range(self.queuesize):
+                inflight.release()
+
+    def report(self):
+        if( self.logiter is None):
+            return('')
+        return(self.logiter.report())
+
+    def _fetch(self, logqueue, resultqueue, inflight, stopped):
+        seq = 0
+        try:
+            for revlog in self.logiter.rawlogs():
+                inflight.acquire()
+                if( not _put(logqueue, (seq, revlog), stopped)):
+                    return
+                seq = seq+1
+        except Exception, expinst:
+            logging.exception("Error in fetching revision logs")
+            resultqueue.put((seq, expinst))
+        finally:
+            self.logclient.releaseClient()
+            #one end marker for each worker.
+            for idx in range(self.workers):
+                try:
+                    logqueue.put((seq, _DONE), not stopped.isSet())
+                except Queue.Full:
+                    break
+
+    def _work(self, logqueue, resultqueue, stopped):
+        try:
+            while( not stopped.isSet()):
+                seq, revlog = logqueue.get()
+                if( revlog is _DONE):
+                    resultqueue.put((seq, _DONE))
+                    break
+                try:
+                    svnrevlog = SVNRevLog(self.logclient, revlog)
+                    with self.logclient.profiler.phase('prepare revision'):
+                        svnrevlog.prepare()
+                    resultqueue.put((seq, svnrevlog))
+                except Exception, expinst:
+                    logging.exception("Error in processing revision %d" % revlog.revision.number)
+                    resultqueue.put((seq, expinst))
+                    break
+        finally:
+            self.logclient.releaseClient()
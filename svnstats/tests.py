@@ -5,8 +5,135 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import datetime
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from distutils.spawn import find_executable
+from email.utils import formatdate
+from StringIO import StringIO
 
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from django.utils import simplejson
+from django.utils.unittest import skipIf
+
+from svnstats.models import Project, SVNLog, SVNLogDetail, SVNPath, SVNAuthor, IngestJob, IngestRun, LeaseLost, BINARYFILEXT
+from svnstats.pathcache import SVNPathCache
+from svnstats.logwriter import SVNLogWriter
+import svnstats.pathcache
+from svnstats.leaderboard import getLeaderboards, Window
+from svnstats import rollups, churn, dashboard, schema, jobs
+from svnstats.svnclient.svnlogclient import SVNLogClient, getDiffLineCountDict, countDiff, countLines
+from svnstats.svnclient.svnlogiter import SVNRevLogIter, nextBatchSize
+from svnstats.svnclient.svnpipeline import SVNRevLogPipeline
+from svnstats.svnclient.profiler import Profiler, ProfiledClient
+from svnstats.svnclient.clientpool import SVNClientPool
+from svnstats.svnclient.pathfilter import PathFilter
+from svnstats.svnclient.nodecache import NodeKindCache, BinaryFileCache
+from svnstats.svnclient.svndump import applySvnDiff, SVNDumpError
+from svnstats.benchmarks.diffcount import legacyDiffLineCountDict, makeDiff
+from svnstats.benchmarks.ingest import dumpNode, dumpRevision, loadDump
+from svnstats.management.commands import ingest
+
+def createProject(name='p', **kwargs):
+    '''
+    project row without a repository. Fields can be overridden with keyword arguments.
+    '''
+    fields = dict(desc='', repository='', username='', password='', updatedate=datetime.datetime.now())
+    fields.update(kwargs)
+    return(Project.objects.create(name=name, **fields))
+
+def createLog(project, revno, commitdate, author='bob', addedfiles=0, changedfiles=0, deletedfiles=0):
+    return(SVNLog.objects.create(project=project, revno=revno, commitdate=commitdate, author=author, msg='',
+                                 addedfiles=addedfiles, changedfiles=changedfiles, deletedfiles=deletedfiles))
+
+#the tests of real repositories are skipped without the svn tools.
+SVNADMIN = find_executable('svnadmin')
+
+def createRepository(workdir, revisions):
+    '''
+    file:// repository of the given revisions, each a list of dump records (see
+    benchmarks/ingest.py).
+    '''
+    dump = tempfile.TemporaryFile()
+    try:
+        dump.write('SVN-fs-dump-format-version: 2\n\n')
+        for records in revisions:
+            dump.write(''.join(records))
+        dump.seek(0)
+        return(loadDump(os.path.join(workdir, 'repo'), dump))
+    finally:
+        dump.close()
+
+def getCounts(project):
+    '''
+    (revno, path) -> (entry type, lines added, lines deleted) of the stored details.
+    '''
+    details = SVNLogDetail.objects.filter(svnlog__project=project)
+    rows = details.values_list('svnlog__revno', 'changedpath__path', 'entrytype', 'linesadded', 'linesdeleted')
+    return(dict([(row[:2], row[2:]) for row in rows]))
+
+class FakeChange:
+    '''
+    counted change of a revision, the interface of SVNChangeEntry used by SVNLogWriter.
+    '''
+    def __init__(self, path, changetype='M', added=1, deleted=0, pathtype='F', entrytype='R'):
+        self.path = path
+        self.changetype = changetype
+        self.added = added
+        self.deleted = deleted
+        self.kind = pathtype
+        self.entry = entrytype
+
+    def filepath_unicode(self):
+        return(self.path)
+
+    def change_type(self):
+        return(self.changetype)
+
+    def lc_added(self):
+        return(self.added)
+
+    def lc_deleted(self):
+        return(self.deleted)
+
+    def pathtype(self):
+        return(self.kind)
+
+    def entrytype(self):
+        return(self.entry)
+
+    def copyfrom(self):
+        return(None, None)
+
+class FakeRevLog:
+    '''
+    revision with the interface of SVNRevLog used by SVNLogWriter, one hour per revision.
+    '''
+    def __init__(self, revno, changes=(), author='bob'):
+        self.revno = revno
+        self.changes = list(changes)
+        self.author = author
+        self.date = datetime.datetime(2012, 3, 1) + datetime.timedelta(hours=revno)
+        self.message = u'r%d' % revno
+
+    def isvalid(self):
+        return(True)
+
+    def changedFileCount(self):
+        types = [change.changetype for change in self.changes if change.kind == 'F']
+        return(types.count('A'), types.count('M')+types.count('R'), types.count('D'))
+
+    def getDiffLineCount(self, bUpdLineCount=True):
+        return(iter(self.changes))
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +141,913 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class DiffLineCountTest(TestCase):
+    def test_same_counts_as_line_by_line(self):
+        """
+        Streaming counter returns the same counts as the old counter for any chunk size.
+        """
+        diff = makeDiff(50, 40)
+        expected = legacyDiffLineCountDict(diff)
+        for chunksize in (1, 7, 4096, len(diff)):
+            self.assertEqual(getDiffLineCountDict(diff, chunksize), expected)
+
+    def test_non_ascii_paths(self):
+        """
+        Names are decoded as the log paths, also if some content line is not utf-8.
+        """
+        diff = 'Index: trunk/\xc3\xa9.c\n===\n--- trunk/\xc3\xa9.c\n+++ trunk/\xc3\xa9.c\n@@ -1 +1 @@\n-x\n+y\n+z\n'
+        expected = legacyDiffLineCountDict(diff)
+        self.assertEqual(expected, {u'/trunk/\xe9.c': (2, 1)})
+        for chunksize in (1, 3, 64):
+            self.assertEqual(getDiffLineCountDict(diff, chunksize), expected)
+        #the line by line counter decoded every name as latin-1 here.
+        diff = diff + 'Index: trunk/b.c\n===\n--- trunk/b.c\n+++ trunk/b.c\n@@ -1 +1 @@\n+\xe9t\xe9\n'
+        self.assertEqual(legacyDiffLineCountDict(diff), {u'/trunk/\xc3\xa9.c': (2, 1), u'/trunk/b.c': (1, 0)})
+        for chunksize in (1, 3, 64):
+            self.assertEqual(getDiffLineCountDict(diff, chunksize), {u'/trunk/\xe9.c': (2, 1), u'/trunk/b.c': (1, 0)})
+
+    def test_property_changes(self):
+        diff = 'Index: a.c\n===\n--- a.c\n+++ a.c\n@@ -1 +1 @@\n-x\n+y\n+z\n' \
+               '\nProperty changes on: a.c\n___\nAdded: svn:eol-style\n   + native\n'
+        self.assertEqual(getDiffLineCountDict(diff), {u'/a.c': (2, 1)})
+
+    def test_binary_files(self):
+        """
+        Binary files are taken from the diff marker, property lines are not content changes.
+        """
+        diff = 'Index: a.png\n===\nCannot display: file marked as a binary type.\n' \
+               'svn:mime-type = image/png\n\nProperty changes on: a.png\n___\n' \
+               'Added: svn:mime-type\n## -0,0 +1 ##\n+image/png\n' \
+               'Index: b.c\n===\n--- b.c\n+++ b.c\n@@ -1 +1 @@\n+x\n'
+        counter = countDiff(diff)
+        self.assertEqual(counter.binaryfiles, set([u'/a.png']))
+        self.assertEqual(counter.textfiles, set([u'/b.c']))
+        self.assertEqual(counter.mimetypefiles, set([u'/a.png']))
+
+class ClientPoolTest(TestCase):
+    def test_clients_are_bound_to_threads_and_reused(self):
+        created = []
+        def factory():
+            created.append(object())
+            return(created[-1])
+        pool = SVNClientPool(factory, 2)
+        client = pool.get()
+        self.assertTrue(pool.get() is client)
+
+        clients = []
+        def use(done):
+            clients.append(pool.get())
+            done.wait()
+            pool.release()
+        first = threading.Event()
+        threads = [threading.Thread(target=use, args=(first,))]
+        #the pool is exhausted, the second thread waits for a released client.
+        second = threading.Event()
+        threads.append(threading.Thread(target=use, args=(second,)))
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        time.sleep(0.2)
+        self.assertEqual((len(clients), pool.inuse()), (1, 2))
+        first.set()
+        second.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(created), 2)
+        self.assertTrue(clients[0] is clients[1])
+        pool.release()
+        self.assertEqual(pool.inuse(), 0)
+        self.assertTrue(pool.get() in created)
+
+    def test_whole_file_line_counts(self):
+        """
+        Added files of a diff are counted as countLines counts their contents.
+        """
+        diff = 'Index: a.c\n===\n--- a.c\n+++ a.c\n@@ -0,0 +1,2 @@\n+c\n+d\n' \
+               'Index: e.c\n===\n--- e.c\n+++ e.c\n@@ -0,0 +1 @@\n+e\n\\ No newline at end of file\n'
+        for chunksize in (1, 5, 4096):
+            counter = countDiff(diff, chunksize)
+            self.assertEqual(counter.fileLineCount(u'/a.c', counter.counts[u'/a.c'][0]), countLines(StringIO('c\nd\n')))
+            self.assertEqual(counter.fileLineCount(u'/e.c', counter.counts[u'/e.c'][0]), countLines(StringIO('e')))
+
+class LineCountTest(TestCase):
+    def test_same_counts_as_regex(self):
+        """
+        Chunked line count matches re.findall("$") with and without trailing newline.
+        """
+        for contents in ('', 'a', 'a\n', 'a\nb', 'a\r\nb\r\n', '\n\n'):
+            expected = len(re.findall("$", contents, re.M))
+            self.assertEqual(countLines(StringIO(contents), 2), expected)
+
+class PathFilterTest(TestCase):
+    def test_prefixes_and_globs(self):
+        excludes = PathFilter('/trunk/vendor, /tags/; *.min.js\n/branches/*/gen')
+        self.assertTrue(excludes.matches(u'/trunk/vendor'))
+        self.assertTrue(excludes.matches(u'/trunk/vendor/lib/a.c'))
+        self.assertTrue(excludes.matches(u'/tags/1.0/'))
+        self.assertTrue(excludes.matches(u'/trunk/web/app.min.js'))
+        self.assertTrue(excludes.matches(u'/branches/b1/gen'))
+        self.assertFalse(excludes.matches(u'/trunk/vendors/a.c'))
+        self.assertFalse(excludes.matches(u'/trunk/'))
+        self.assertFalse(PathFilter(None))
+
+def svnVarint(value):
+    data = chr(value & 0x7f)
+    value = value >> 7
+    while( value > 0):
+        data = chr(0x80 | (value & 0x7f)) + data
+        value = value >> 7
+    return(data)
+
+def svnDiffWindow(sviewlen, tviewlen, instructions, newdata, version=0):
+    '''
+    one svndiff window of a source view starting at offset 0. The sections of version 1
+    are compressed if that makes them shorter.
+    '''
+    if( version == 1):
+        sections = []
+        for section in (instructions, newdata):
+            compressed = zlib.compress(section)
+            if( len(compressed) >= len(section)):
+                compressed = section
+            sections.append(svnVarint(len(section)) + compressed)
+        instructions, newdata = sections
+    return(svnVarint(0) + svnVarint(sviewlen) + svnVarint(tviewlen) + svnVarint(len(instructions)) + \
+            svnVarint(len(newdata)) + instructions + newdata)
+
+class SvnDiffTest(TestCase):
+    def test_copy_and_new_data(self):
+        """
+        source copy, new data and an overlapping target copy, in both versions.
+        """
+        #copy 3 bytes from offset 0 of the source, 2 new bytes, 7 bytes from offset 0 of the target
+        instructions = chr(0x03) + svnVarint(0) + chr(0x82) + chr(0x47) + svnVarint(0)
+        for version in (0, 1):
+            delta = 'SVN' + chr(version) + svnDiffWindow(3, 12, instructions, 'de', version)
+            self.assertEqual(applySvnDiff('abcxyz', delta), 'abcdeabcdeab')
+
+    def test_compressed_sections_and_windows(self):
+        text = 'line\n'*100
+        #new data longer than 63 bytes has its length in a varint
+        instructions = chr(0x80) + svnVarint(len(text))
+        window = svnDiffWindow(0, len(text), instructions, text, 1)
+        self.assertTrue(len(window) < len(text))
+        self.assertEqual(applySvnDiff('', 'SVN\x01' + window + window), text*2)
+        self.assertEqual(applySvnDiff('old', 'SVN\x00'), '')
+
+    def test_invalid_deltas(self):
+        self.assertRaises(SVNDumpError, applySvnDiff, '', 'XYZ\x00')
+        self.assertRaises(SVNDumpError, applySvnDiff, '', 'SVN\x02')
+        self.assertRaises(SVNDumpError, applySvnDiff, 'abc', 'SVN\x00' + svnDiffWindow(3, 4, chr(0x03) + svnVarint(0), ''))
+
+class RollupTest(TestCase):
+    def test_incremental_totals_match_rebuild(self):
+        project = createProject(lastrev=3)
+        path = SVNPath.objects.create(path=u'/trunk/a.c')
+        SVNAuthor.objects.create(author='bob', display='Bob')
+        totals = dict()
+        svnlogs = []
+        for revno, author, hour, added in ((1, 'bob', 10, 5), (2, 'bob', 11, 3), (3, 'eve', 12, 7)):
+            commitdate = datetime.datetime(2012, 3, 1, hour)
+            svnlog = createLog(project, revno, commitdate, author, addedfiles=1)
+            SVNLogDetail.objects.create(svnlog=svnlog, changedpath=path, changetype='A', pathtype='F',
+                                        linesadded=added, linesdeleted=1, entrytype='R')
+            rollups.addRevision(totals, author, commitdate, added, 1, 1, 0, 0)
+            svnlogs.append(svnlog)
+        rollups.addSummary(project, svnlogs, totals, 3)
+        rollups.addTotals(project, totals)
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.verifySummary(project), [])
+        summary = rollups.getSummary(project)
+        self.assertEqual((summary.contributors, summary.revisions, summary.linesadded, summary.headrev), (2, 3, 15, 3))
+
+        boards = getLeaderboards([Window('day', datetime.date(2012, 3, 1), datetime.date(2012, 3, 2)),
+                                  Window('later', datetime.date(2012, 3, 2), datetime.date(2012, 3, 9))], project)
+        self.assertEqual([(coder['author'], coder['display'], coder['linesadded'], coder['percent']) for coder in boards['day']],
+                         [('bob', 'Bob', 8, 100), ('eve', None, 7, 87)])
+        self.assertEqual(boards['later'], [])
+
+        SVNLogDetail.objects.filter(svnlog__revno=3).update(linesadded=0)
+        self.assertEqual(len(rollups.verify(project)), 1)
+        rollups.rebuildDays(project, [datetime.date(2012, 3, 1)])
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.getSummary(project).linesadded, 8)
+
+class DashboardTest(TestCase):
+    def test_version_moves_with_stored_data_and_names(self):
+        project = createProject(updatedate=datetime.datetime(2012, 1, 1))
+        version = dashboard.getVersion()
+        self.assertEqual(dashboard.getVersion(), version)
+        self.assertEqual(dashboard.getCached(dashboard.cacheKey('test', version), lambda: 1), 1)
+        self.assertEqual(dashboard.getCached(dashboard.cacheKey('test', version), lambda: 2), 1)
+        #an update which stored nothing keeps the version.
+        Project.objects.filter(pk=project.pk).update(updatedate=datetime.datetime(2012, 2, 1))
+        self.assertEqual(dashboard.getVersion(), version)
+        Project.objects.filter(pk=project.pk).update(lastrev=3)
+        self.assertNotEqual(dashboard.getVersion(), version)
+        self.assertEqual(dashboard.getCached(dashboard.cacheKey('test', dashboard.getVersion()), lambda: 2), 2)
+
+        version = dashboard.getVersion()
+        author = SVNAuthor.objects.create(author='bob', display='Bob')
+        self.assertNotEqual(dashboard.getVersion(), version)
+        version = dashboard.getVersion()
+        author.display = 'Robert'
+        author.save()
+        self.assertNotEqual(dashboard.getVersion(), version)
+        self.assertTrue(dashboard.getLastModified() > datetime.datetime(2012, 2, 1))
+
+class SchemaTest(TestCase):
+    def test_paths_are_unique_by_hash(self):
+        path = SVNPath.objects.create(path=u'/trunk/\xe4.c')
+        pathcache = SVNPathCache()
+        self.assertEqual(pathcache.resolve([u'/trunk/\xe4.c', u'/trunk/b.c'], dict())[u'/trunk/\xe4.c'], path.id)
+        self.assertEqual(SVNPath.objects.filter(path=u'/trunk/b.c').count(), 1)
+
+    def test_hot_queries_use_indexes(self):
+        if schema.getEngine() != 'sqlite3':
+            return
+        project = createProject()
+        for name, lines, scans in schema.checkPlans(project):
+            self.assertEqual(scans, [], '%s: %s' % (name, lines))
+
+class RacingPathCache(SVNPathCache):
+    '''
+    the first lookup misses the paths, as if they were stored meanwhile.
+    '''
+    raced = False
+
+    def _lookup(self, paths):
+        if( not self.raced):
+            self.raced = True
+            return(dict())
+        return(SVNPathCache._lookup(self, paths))
+
+class PathCacheTest(TestCase):
+    def test_created_paths_are_cached_after_the_commit(self):
+        stored = SVNPath.objects.create(path=u'/trunk/a.c')
+        pathcache = SVNPathCache()
+        created = dict()
+        ids = pathcache.resolve([u'/trunk/a.c', u'/trunk/b.c'], created)
+        self.assertEqual(ids[u'/trunk/a.c'], stored.id)
+        self.assertEqual(created, {u'/trunk/b.c': ids[u'/trunk/b.c']})
+        #visible to the transaction which created it, not to the others.
+        self.assertEqual(pathcache.get(u'/trunk/b.c', created), ids[u'/trunk/b.c'])
+        self.assertFalse(u'/trunk/b.c' in pathcache.ids)
+        self.assertEqual(SVNPath.objects.filter(path=u'/trunk/b.c').count(), 1)
+        pathcache.publish(created)
+        self.assertEqual(pathcache.ids[u'/trunk/b.c'], ids[u'/trunk/b.c'])
+        self.assertEqual(pathcache.resolve([u'/trunk/b.c'], dict()), {u'/trunk/b.c': ids[u'/trunk/b.c']})
+
+    def test_paths_of_a_failed_insert_are_cached_after_the_commit(self):
+        pathcache = RacingPathCache()
+        pathcache.warm()
+        #stored by some other ingestion after the lookup.
+        stored = SVNPath.objects.create(path=u'/trunk/b.c')
+        created = dict()
+        ids = pathcache.resolve([u'/trunk/a.c', u'/trunk/b.c'], created)
+        self.assertEqual(ids[u'/trunk/b.c'], stored.id)
+        self.assertEqual(ids[u'/trunk/a.c'], SVNPath.objects.get(path=u'/trunk/a.c').id)
+        self.assertEqual(created, ids)
+        self.assertEqual(len(pathcache.ids), 0)
+
+    def test_least_recently_used_paths_are_evicted(self):
+        for name in ('a', 'b', 'c'):
+            SVNPath.objects.create(path=u'/trunk/%s.c' % name)
+        pathcache = SVNPathCache(2)
+        pathcache.warm()
+        #the newest paths are cached.
+        self.assertEqual(pathcache.ids.keys(), [u'/trunk/b.c', u'/trunk/c.c'])
+        pathcache.resolve([u'/trunk/b.c'], dict())
+        pathcache.resolve([u'/trunk/a.c'], dict())
+        self.assertEqual(pathcache.ids.keys(), [u'/trunk/b.c', u'/trunk/a.c'])
+        self.assertEqual((pathcache.hits, pathcache.misses), (1, 1))
+        self.assertEqual(SVNPath.objects.count(), 3)
+
+class WriterTest(TransactionTestCase):
+    def test_batches_move_the_watermark(self):
+        project = createProject()
+        writer = SVNLogWriter(project, 2, pathcache=SVNPathCache())
+        writer.addRevision(FakeRevLog(1, [FakeChange(u'/trunk/a.c', 'A', 3)]))
+        self.assertEqual(SVNLog.objects.filter(project=project).count(), 0)
+        writer.addRevision(FakeRevLog(2, [FakeChange(u'/trunk/a.c', 'M', 1, 1), FakeChange(u'/trunk/b.c', 'A', 2)]))
+        self.assertEqual(SVNLog.objects.filter(project=project).count(), 2)
+        self.assertEqual(Project.objects.get(pk=project.pk).lastrev, 2)
+        writer.addRevision(FakeRevLog(3, [FakeChange(u'/trunk/a.c', 'D', 0, 4)], author='eve'))
+        #revisions 4 and 5 are not in the log of the project url.
+        writer.close(5)
+        self.assertEqual(SVNLog.objects.filter(project=project).count(), 3)
+        self.assertEqual(Project.objects.get(pk=project.pk).lastrev, 5)
+        self.assertEqual(getCounts(project)[(3, u'/trunk/a.c')], ('R', 0, 4))
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.verifySummary(project), [])
+
+    def test_batches_above_the_variable_limit(self):
+        project = createProject()
+        writer = SVNLogWriter(project, 1200, pathcache=SVNPathCache())
+        for revno in range(1, 1201):
+            writer.addRevision(FakeRevLog(revno, [FakeChange(u'/trunk/a.c', 'M', 1)]))
+        self.assertEqual(SVNLog.objects.filter(project=project).count(), 1200)
+        self.assertEqual(SVNLogDetail.objects.filter(svnlog__project=project).count(), 1200)
+
+    def test_failed_batch_is_rolled_back(self):
+        project = createProject()
+        pathcache = SVNPathCache()
+        writer = SVNLogWriter(project, 10, pathcache=pathcache)
+        writer.addRevision(FakeRevLog(1, [FakeChange(u'/trunk/a.c', 'A', 1)]))
+        writer.close()
+        #the detail row without line count fails after the log rows and the path are inserted.
+        writer.addRevision(FakeRevLog(2, [FakeChange(u'/trunk/new.c', 'A', None)]))
+        self.assertRaises(IntegrityError, writer.close)
+        self.assertEqual(list(SVNLog.objects.filter(project=project).values_list('revno', flat=True)), [1])
+        self.assertEqual(Project.objects.get(pk=project.pk).lastrev, 1)
+        self.assertEqual(SVNPath.objects.filter(path=u'/trunk/new.c').count(), 0)
+        self.assertFalse(u'/trunk/new.c' in pathcache.ids)
+        self.assertTrue(u'/trunk/a.c' in pathcache.ids)
+        self.assertEqual(rollups.verify(project), [])
+
+class WatermarkTest(TestCase):
+    def test_partial_revisions_are_removed(self):
+        project = createProject()
+        writer = SVNLogWriter(project, 10, pathcache=SVNPathCache())
+        for revno in (1, 2, 3):
+            writer.addRevision(FakeRevLog(revno, [FakeChange(u'/trunk/a.c', 'M', revno)]))
+        writer.close()
+        self.assertEqual(project.getLastStoredRev(), 3)
+        self.assertFalse(project.repairPartialRevisions(3))
+
+        #rows of revision 3 left over by an interrupted batch.
+        Project.objects.filter(pk=project.pk).update(lastrev=2)
+        self.assertEqual(project.getLastStoredRev(), 2)
+        self.assertTrue(project.repairPartialRevisions(2))
+        self.assertEqual(list(SVNLog.objects.filter(project=project).order_by('revno').values_list('revno', flat=True)), [1, 2])
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.getSummary(project).linesadded, 3)
+
+        #databases without watermark ingest the last stored revision again.
+        Project.objects.filter(pk=project.pk).update(lastrev=None)
+        self.assertEqual(project.getLastStoredRev(), 1)
+        self.assertEqual(createProject('empty').getLastStoredRev(), 0)
+
+class FakeClient:
+    def cat(self, url):
+        return('a\nb\n')
+
+class ProfilerTest(TestCase):
+    def test_runs_are_stored_with_their_statistics(self):
+        profiler = Profiler()
+        client = ProfiledClient(FakeClient(), profiler)
+        client.cat('file:///a.c')
+        client.cat('file:///b.c')
+        client.exception_style = 1
+        self.assertEqual(client.client.exception_style, 1)
+        with profiler.phase('write batch'):
+            pass
+        self.assertEqual(profiler.stats['svn.cat'][:2], [2, 8])
+
+        project = createProject(lastrev=7)
+        started = datetime.datetime.now()
+        IngestRun.record(project, profiler, started, 3, True)
+        run = IngestRun.objects.get(project=project)
+        self.assertEqual((run.fromrev, run.torev, run.ok), (3, 7, True))
+        self.assertTrue(run.finished >= started)
+        stats = run.ingestrunstat_set.order_by('name')
+        self.assertEqual([(stat.name, stat.calls, stat.bytes) for stat in stats], [('svn.cat', 2, 8), ('write batch', 1, 0)])
+
+class ApiTest(TestCase):
+    def test_series_buckets_and_conditional_get(self):
+        project = createProject()
+        totals = dict()
+        for day, added in ((27, 1), (29, 2)):
+            rollups.addRevision(totals, 'bob', datetime.datetime(2012, 2, day, 12), added, 0, 0, 1, 0)
+        rollups.addRevision(totals, 'eve', datetime.datetime(2012, 3, 1, 12), 3, 1, 0, 1, 0)
+        rollups.addTotals(project, totals)
+
+        url = '/api/projects/%d/series/' % project.pk
+        query = {'bucket': 'week', 'start': '2012-02-01', 'end': '2012-04-01'}
+        response = self.client.get(url, query)
+        self.assertEqual(response.status_code, 200)
+        data = simplejson.loads(response.content)
+        self.assertEqual([(item['start'], item['linesadded'], item['commits']) for item in data['series']],
+                         [('2012-02-27', 6, 3)])
+        #the local time of the last change is sent as UTC.
+        updated = max(Project.objects.get(pk=project.pk).updatedate, dashboard.getEdits()[1])
+        self.assertEqual(response['Last-Modified'], formatdate(time.mktime(updated.timetuple()), usegmt=True))
+        response = self.client.get(url, query, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/authors/bob/series/', {'bucket': 'month', 'start': '2012-01-01'})
+        self.assertEqual([item['linesadded'] for item in simplejson.loads(response.content)['series']], [3])
+        self.assertEqual(self.client.get(url, {'bucket': 'year'}).status_code, 400)
+
+class LeaseTest(TestCase):
+    def expire(self, project):
+        Project.objects.filter(pk=project.pk).update(leaseexpires=datetime.datetime.now()-datetime.timedelta(seconds=1))
+
+    def test_expired_lease_is_taken_over(self):
+        project = createProject()
+        first = Project.objects.get(pk=project.pk)
+        second = Project.objects.get(pk=project.pk)
+        self.assertTrue(first.acquireLease('first'))
+        self.assertFalse(second.acquireLease('second'))
+        self.assertFalse(second.update('second'))
+        self.assertTrue(Project.objects.get(pk=project.pk).isUpdating())
+
+        self.expire(project)
+        self.assertFalse(Project.objects.get(pk=project.pk).isUpdating())
+        self.assertTrue(second.acquireLease('second'))
+        self.assertRaises(LeaseLost, first.renewLease)
+        first.lastheartbeat = None
+        self.assertRaises(LeaseLost, first.heartbeat)
+        #the old owner cannot free the lease of the new one.
+        first.releaseLease()
+        self.assertEqual(Project.objects.get(pk=project.pk).leaseowner, 'second')
+        second.heartbeat()
+        second.releaseLease()
+        self.assertFalse(Project.objects.get(pk=project.pk).isUpdating())
+
+    def test_jobs_of_lost_leases_fail(self):
+        project = createProject()
+        job = jobs.enqueue(project)
+        self.assertEqual(jobs.enqueue(project, 5).pk, job.pk)
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).priority, 5)
+        job = jobs.claimNextJob('worker')
+        self.assertEqual((job.state, job.owner), ('R', 'worker'))
+        self.assertEqual(jobs.claimNextJob('other'), None)
+
+        #the job is recovered only after its worker had time to take the lease.
+        jobs.recoverJobs()
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).state, 'R')
+        IngestJob.objects.filter(pk=job.pk).update(started=datetime.datetime.now()-datetime.timedelta(minutes=2))
+        self.assertTrue(project.acquireLease('worker'))
+        jobs.recoverJobs()
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).state, 'R')
+        self.expire(project)
+        jobs.recoverJobs()
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).state, 'F')
+
+        Project.objects.filter(pk=project.pk).update(leaseowner='other',
+                                                     leaseexpires=datetime.datetime.now()+datetime.timedelta(minutes=5))
+        jobs.enqueue(project)
+        job = jobs.claimNextJob('worker')
+        self.assertFalse(jobs.runJob(job))
+        self.assertEqual(IngestJob.objects.get(pk=job.pk).state, 'F')
+
+class ChurnTest(TestCase):
+    def test_subtree_and_subdirectories(self):
+        self.assertEqual(churn.getDirs(u'/trunk/src/a.c', 'F'), [u'/', u'/trunk', u'/trunk/src'])
+        self.assertEqual(churn.getDirs(u'/trunk/doc', 'D'), [u'/', u'/trunk', u'/trunk/doc'])
+        project = createProject()
+        totals = dict()
+        churn.addRevision(totals, 'bob', datetime.datetime(2012, 3, 1, 10),
+                          [(u'/trunk/src/a.c', 'F', 'R', 10, 2), (u'/trunk/src/b.c', 'F', 'R', 5, 0),
+                           (u'/trunk/vendor/x.c', 'F', 'X', 0, 0)])
+        churn.addTotals(project, totals)
+        totals = dict()
+        churn.addRevision(totals, 'eve', datetime.datetime(2012, 3, 2, 10),
+                          [(u'/trunk/doc/a.txt', 'F', 'R', 1, 1)])
+        churn.addRevision(totals, 'bob', datetime.datetime(2012, 3, 1, 11), [(u'/trunk/src/a.c', 'F', 'R', 3, 3)])
+        churn.addTotals(project, totals)
+
+        total, children = churn.getChurn(project, u'/trunk/', datetime.date(2012, 3, 1), datetime.date(2012, 3, 3))
+        self.assertEqual((total['linesadded'], total['linesdeleted'], total['commits'], total['authors']), (19, 6, 3, 2))
+        self.assertEqual([(child['path'], child['linesadded'], child['commits']) for child in children],
+                         [(u'/trunk/src', 18, 2), (u'/trunk/doc', 1, 1)])
+        total, children = churn.getChurn(project, u'/trunk', datetime.date(2012, 3, 2), datetime.date(2012, 3, 3))
+        self.assertEqual((total['linesadded'], total['authors']), (1, 1))
+
+class IngestCommandTest(TransactionTestCase):
+    '''
+    the child processes see the committed projects only.
+    '''
+    def setUp(self):
+        self.command = ingest.Command()
+        self.command.stdout = StringIO()
+        self.command.stderr = StringIO()
+        self.options = dict(all=False, jobs=2, since=None, until=None, dryrun=False)
+
+    def test_projects_are_required(self):
+        self.assertRaises(CommandError, self.command.handle, **self.options)
+        self.assertRaises(CommandError, self.command.handle, 'missing', **self.options)
+
+    @skipIf(SVNADMIN is None, 'svnadmin is not installed')
+    def test_failed_updates_are_reported(self):
+        command = self.command
+        options = self.options
+        workdir = tempfile.mkdtemp(prefix='svnstatstest')
+        try:
+            url = createRepository(workdir, [[dumpRevision(1, 'bob', datetime.datetime(2012, 3, 1, 10), 'add'),
+                                              dumpNode('trunk', 'dir', 'add', props={}),
+                                              dumpNode('trunk/a.c', 'file', 'add', text='a\n', props={})]])
+            svnstats.pathcache._pathcache = None
+            createProject('good', repository=url)
+            createProject('bad', repository=url + '/missing')
+            options['dryrun'] = True
+            command.handle('good', **options)
+            self.assertTrue(command.stdout.getvalue().startswith('good: revisions 1 - 1,'))
+
+            options['dryrun'] = False
+            try:
+                command.handle('good', 'bad', **options)
+                self.fail('update of bad did not fail')
+            except CommandError, e:
+                self.assertEqual(str(e), 'Update failed for: bad')
+        finally:
+            shutil.rmtree(workdir, True)
+
+BIGFILE = ''.join(['line %d\n' % idx for idx in range(40)])
+
+@skipIf(SVNADMIN is None, 'svnadmin is not installed')
+class RepositoryTestCase(TestCase):
+    '''
+    ingestion of a small repository made of the dump records of 'getRevisions'. The
+    tests are skipped if svnadmin is not installed.
+    '''
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='svnstatstest')
+        self.url = createRepository(self.workdir, self.getRevisions(datetime.datetime(2012, 3, 1, 10)))
+        #the cached path ids of earlier tests are rolled back with their transaction.
+        svnstats.pathcache._pathcache = None
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, True)
+
+    def getRevisions(self, start):
+        return([])
+
+    def dump(self, *options):
+        dump = tempfile.TemporaryFile()
+        subprocess.check_call(['svnadmin', 'dump', '-q'] + list(options) + [os.path.join(self.workdir, 'repo')],
+                              stdout=dump)
+        dump.seek(0)
+        return(dump)
+
+    def ingest(self, name, until=None, **kwargs):
+        project = createProject(name, repository=self.url, **kwargs)
+        project.update(until=until)
+        return(Project.objects.get(pk=project.pk))
+
+class RepositoryTest(RepositoryTestCase):
+    def getRevisions(self, start):
+        return([
+            [dumpRevision(1, 'bob', start, 'add'),
+             dumpNode('trunk', 'dir', 'add', props={}),
+             dumpNode('trunk/vendor', 'dir', 'add', props={}),
+             dumpNode('trunk/a.c', 'file', 'add', text='a\nb\nc\n', props={}),
+             dumpNode('trunk/big.c', 'file', 'add', text=BIGFILE, props={}),
+             dumpNode('trunk/logo.png', 'file', 'add', text=BIGFILE, props={}),
+             dumpNode('trunk/vendor/v.c', 'file', 'add', text='v\n'*5, props={})],
+            [dumpRevision(2, 'eve', start + datetime.timedelta(days=1), 'change'),
+             dumpNode('trunk/big.c', 'file', 'change', text=BIGFILE + 'x\ny\n'),
+             dumpNode('trunk/vendor/v.c', 'file', 'change', text='v\n'*6)],
+        ])
+
+    def assertCountedAs(self, project, expected):
+        self.assertEqual(getCounts(project), getCounts(expected))
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.verifySummary(project), [])
+        self.assertEqual(churn.verify(project, SVNLog.objects.filter(project=project)), [])
+
+    def test_recount_skipped_files(self):
+        full = self.ingest('full')
+        project = self.ingest('limited', maxfilesize=100)
+        self.assertEqual(getCounts(project)[(1, u'/trunk/big.c')], ('S', 0, 0))
+        #binary files are never transferred, their size is not checked.
+        self.assertEqual(getCounts(project)[(1, u'/trunk/logo.png')], ('R', 0, 0))
+        self.assertEqual(getCounts(project)[(1, u'/trunk/a.c')], getCounts(full)[(1, u'/trunk/a.c')])
+        self.assertTrue(project.recountSkipped(0))
+        self.assertCountedAs(project, full)
+
+    def test_apply_excludes_with_a_new_client(self):
+        full = self.ingest('full')
+        project = self.ingest('excluded', excludes='/trunk/vendor')
+        self.assertEqual(getCounts(project)[(2, u'/trunk/vendor/v.c')], ('X', 0, 0))
+        project.excludes = ''
+        svnclient = SVNLogClient(self.url, BINARYFILEXT)
+        svnclient.excludes = PathFilter(project.excludes)
+        project.applyExcludes(svnclient)
+        self.assertCountedAs(project, full)
+
+    def test_revision_diff_of_a_sub_url(self):
+        url = self.url + '/trunk'
+        results = []
+        #no limit uses the revision diff, 0 diffs every file.
+        for maxfiles in (None, 0):
+            profiler = Profiler()
+            svnclient = SVNLogClient(url, BINARYFILEXT, profiler=profiler)
+            svnclient.revdiffmaxfiles = maxfiles
+            project = createProject('trunk%s' % maxfiles, repository=url)
+            project.ConvertRevs(svnclient, 1, 2, workers=0)
+            results.append((getCounts(project), profiler.stats['svn.diff'][0]))
+        (revdiffcounts, revdiffcalls), (filecounts, filecalls) = results
+        #'Index:' paths of the diff are relative to the project url.
+        self.assertEqual(revdiffcounts[(2, u'/trunk/big.c')], ('R', 2, 0))
+        self.assertEqual(revdiffcounts[(2, u'/trunk/vendor/v.c')], ('R', 1, 0))
+        self.assertEqual(revdiffcounts, filecounts)
+        self.assertTrue(revdiffcalls < filecalls)
+
+    def test_update_resumes_after_the_watermark(self):
+        full = self.ingest('full')
+        project = self.ingest('resumed', until=1)
+        self.assertEqual(project.lastrev, 1)
+        self.assertEqual(SVNLog.objects.filter(project=project, revno__gt=1).count(), 0)
+        #revisions after the watermark cannot be skipped.
+        self.assertRaises(ValueError, project.getUpdateRange, SVNLogClient(self.url, BINARYFILEXT), 3)
+        self.assertTrue(project.update())
+        self.assertEqual(Project.objects.get(pk=project.pk).lastrev, 2)
+        self.assertCountedAs(project, full)
+
+    def test_profiled_update_is_recorded(self):
+        profile = settings.SVNSTATS_PROFILE
+        settings.SVNSTATS_PROFILE = True
+        try:
+            project = self.ingest('profiled')
+        finally:
+            settings.SVNSTATS_PROFILE = profile
+        run = IngestRun.objects.get(project=project)
+        self.assertEqual((run.fromrev, run.torev, run.ok), (0, 2, True))
+        names = set(run.ingestrunstat_set.values_list('name', flat=True))
+        self.assertTrue('svn.log' in names and 'svn.diff' in names)
+        #without profiling nothing is recorded.
+        self.ingest('plain')
+        self.assertEqual(IngestRun.objects.count(), 1)
+
+    def test_update_applies_changed_excludes(self):
+        full = self.ingest('full')
+        project = self.ingest('excluded', excludes='/trunk/vendor')
+        excluded = getCounts(project)
+        linesadded = rollups.getSummary(project).linesadded
+        Project.objects.filter(pk=project.pk).update(excludes='')
+        self.assertTrue(Project.objects.get(pk=project.pk).update())
+        self.assertCountedAs(project, full)
+        self.assertEqual(list(SVNLog.objects.filter(project=project).order_by('revno').values_list('addedfiles', 'changedfiles')),
+                         list(SVNLog.objects.filter(project=full).order_by('revno').values_list('addedfiles', 'changedfiles')))
+
+        Project.objects.filter(pk=project.pk).update(excludes='/trunk/vendor')
+        self.assertTrue(Project.objects.get(pk=project.pk).update())
+        self.assertEqual(getCounts(project), excluded)
+        self.assertEqual(rollups.verify(project), [])
+        self.assertEqual(rollups.getSummary(project).linesadded, linesadded)
+
+class PipelineTest(RepositoryTestCase):
+    '''
+    revisions of different sizes, the workers finish them out of order.
+    '''
+    REVISIONS = 12
+
+    def getRevisions(self, start):
+        revisions = [[dumpRevision(1, 'bob', start, 'add'),
+                      dumpNode('trunk', 'dir', 'add', props={}),
+                      dumpNode('trunk/a.c', 'file', 'add', text='a\n', props={})]]
+        for revno in range(2, self.REVISIONS+1):
+            revisions.append([dumpRevision(revno, 'bob', start + datetime.timedelta(hours=revno), 'r%d' % revno),
+                              dumpNode('trunk/a.c', 'file', 'change', text='a\n'*revno),
+                              dumpNode('trunk/f%d.c' % revno, 'file', 'add', text=BIGFILE*(revno%3), props={})])
+        return(revisions)
+
+    def test_revisions_in_order_and_counted_as_serially(self):
+        svnclient = SVNLogClient(self.url, BINARYFILEXT, poolsize=5)
+        pipeline = SVNRevLogPipeline(svnclient, 1, 0, workers=3, queuesize=3, cachesize=4)
+        self.assertEqual([revlog.revno for revlog in pipeline], range(1, self.REVISIONS+1))
+
+        serial = createProject('serial', repository=self.url)
+        serial.ConvertRevs(SVNLogClient(self.url, BINARYFILEXT), 1, self.REVISIONS, workers=0)
+        project = createProject('parallel', repository=self.url)
+        project.ConvertRevs(SVNLogClient(self.url, BINARYFILEXT, poolsize=5), 1, self.REVISIONS, workers=3)
+        self.assertEqual(getCounts(project), getCounts(serial))
+        self.assertEqual(getCounts(project)[(7, u'/trunk/a.c')], ('R', 1, 0))
+        self.assertEqual(list(SVNLog.objects.filter(project=project).order_by('id').values_list('revno', flat=True)),
+                         range(1, self.REVISIONS+1))
+
+    def test_small_client_pool_processes_serially(self):
+        svnclient = SVNLogClient(self.url, BINARYFILEXT, poolsize=2)
+        self.assertRaises(ValueError, SVNRevLogPipeline, svnclient, 1, 0, 3)
+        serial = createProject('serial', repository=self.url)
+        serial.ConvertRevs(SVNLogClient(self.url, BINARYFILEXT), 1, self.REVISIONS, workers=0)
+        project = createProject('small pool', repository=self.url)
+        project.ConvertRevs(svnclient, 1, self.REVISIONS, workers=3)
+        self.assertEqual(getCounts(project), getCounts(serial))
+
+    def test_batch_sizes_adapt(self):
+        #empty batch, at most doubled, time target, changed path limit, bounds.
+        self.assertEqual(nextBatchSize(50, 0, 0, 1.0), 50)
+        self.assertEqual(nextBatchSize(50, 50, 100, 0.1), 100)
+        self.assertEqual(nextBatchSize(100, 100, 100, 4.0), 50)
+        self.assertEqual(nextBatchSize(100, 100, 100000, 0.1), 20)
+        self.assertEqual(nextBatchSize(10, 10, 10, 10.0), 10)
+        self.assertEqual(nextBatchSize(800, 800, 800, 0.1), 1000)
+
+    def test_prefetched_batches_in_order(self):
+        for prefetch in (0, 2):
+            logiter = SVNRevLogIter(SVNLogClient(self.url, BINARYFILEXT), 1, 0, cachesize=3, prefetch=prefetch)
+            self.assertEqual([revlog.revno for revlog in logiter], range(1, self.REVISIONS+1))
+            #3 revisions, then the smallest batch size.
+            self.assertEqual((logiter.batches, logiter.revisions), (2, self.REVISIONS))
+
+class RevDiffTest(RepositoryTestCase):
+    '''
+    file edits committed together with a branch and with the removal of the branch.
+    '''
+    def getRevisions(self, start):
+        day = datetime.timedelta(days=1)
+        return([
+            [dumpRevision(1, 'bob', start, 'add'),
+             dumpNode('trunk', 'dir', 'add', props={}),
+             dumpNode('branches', 'dir', 'add', props={}),
+             dumpNode('trunk/a.c', 'file', 'add', text='a\n', props={}),
+             dumpNode('trunk/b.c', 'file', 'add', text='b\n', props={}),
+             dumpNode('trunk/big.c', 'file', 'add', text=BIGFILE, props={})],
+            [dumpRevision(2, 'bob', start + day, 'branch and edit'),
+             dumpNode('branches/b1', 'dir', 'add', copyfrom=('trunk', 1)),
+             dumpNode('trunk/a.c', 'file', 'change', text='a\nb\n'),
+             dumpNode('trunk/b.c', 'file', 'change', text='c\n')],
+            [dumpRevision(3, 'bob', start + day*2, 'remove the branch and edit'),
+             dumpNode('branches/b1', None, 'delete'),
+             dumpNode('trunk/a.c', 'file', 'change', text='a\n'),
+             dumpNode('trunk/b.c', 'file', 'change', text='b\nc\n')],
+            [dumpRevision(4, 'bob', start + day*3, 'add alone'),
+             dumpNode('trunk/c.c', 'file', 'add', text='c\nd\n', props={})],
+            [dumpRevision(5, 'bob', start + day*4, 'add together'),
+             dumpNode('trunk/d.c', 'file', 'add', text='c\nd\n', props={}),
+             dumpNode('trunk/e.c', 'file', 'add', text='e', props={})],
+            [dumpRevision(6, 'bob', start + day*5, 'delete together'),
+             dumpNode('trunk/c.c', None, 'delete'),
+             dumpNode('trunk/d.c', None, 'delete')],
+            [dumpRevision(7, 'bob', start + day*6, 'delete alone'),
+             dumpNode('trunk/e.c', None, 'delete')],
+        ])
+
+    def test_directory_copies_and_deletions_use_file_diffs(self):
+        profiler = Profiler()
+        svnclient = SVNLogClient(self.url, BINARYFILEXT, profiler=profiler)
+        project = createProject('revdiff', repository=self.url)
+        project.ConvertRevs(svnclient, 1, 3, workers=0)
+        counts = getCounts(project)
+        self.assertEqual((counts[(2, u'/trunk/a.c')], counts[(2, u'/trunk/b.c')]), (('R', 1, 0), ('R', 1, 1)))
+        self.assertEqual((counts[(3, u'/trunk/a.c')], counts[(3, u'/trunk/b.c')]), (('R', 0, 1), ('R', 1, 0)))
+        #one revision diff for revision 1, then file diffs. The files of the branch are never diffed.
+        self.assertEqual(profiler.stats['svn.diff'][0], 5)
+
+    def test_added_files_count_alone_and_together(self):
+        project = self.ingest('revdiff')
+        counts = getCounts(project)
+        #lines are counted as countLines counts them, with or without the revision diff.
+        self.assertEqual((counts[(4, u'/trunk/c.c')], counts[(5, u'/trunk/d.c')]), (('R', 3, 0), ('R', 3, 0)))
+        self.assertEqual(counts[(5, u'/trunk/e.c')], ('R', 1, 0))
+        self.assertEqual((counts[(6, u'/trunk/c.c')], counts[(6, u'/trunk/d.c')]), (('R', 0, 3), ('R', 0, 3)))
+        self.assertEqual(counts[(7, u'/trunk/e.c')], ('R', 0, 1))
+        dumped = createProject('dump', repository=self.url)
+        self.assertTrue(dumped.importDump(self.dump(), u''))
+        self.assertEqual(getCounts(dumped), counts)
+
+class NodeCacheTest(TestCase):
+    def test_values_hold_until_the_path_changes(self):
+        nodekinds = NodeKindCache()
+        nodekinds.set(u'/trunk/x', 'F', 2)
+        self.assertEqual((nodekinds.get(u'/trunk/x', 2), nodekinds.get(u'/trunk/', 5)), ('F', 'D'))
+        self.assertEqual(nodekinds.get(u'/trunk/x', 1), None)
+        #replaced by a directory in revision 4
+        nodekinds.change(u'/trunk/x', 4)
+        self.assertEqual((nodekinds.get(u'/trunk/x', 3), nodekinds.get(u'/trunk/x', 4)), ('F', None))
+        nodekinds.set(u'/trunk/x/', 'D', 4)
+        self.assertEqual((nodekinds.get(u'/trunk/x', 3), nodekinds.get(u'/trunk/x', 9)), ('F', 'D'))
+        #replacing a parent directory changes everything below it.
+        nodekinds.set(u'/lib/a/b.c', 'F', 1)
+        nodekinds.change(u'/lib', 6)
+        self.assertEqual((nodekinds.get(u'/lib/a/b.c', 5), nodekinds.get(u'/lib/a/b.c', 6)), ('F', None))
+
+        binaryfiles = BinaryFileCache()
+        binaryfiles.set(u'/trunk/d.dat', False, 1)
+        #svn:mime-type set in revision 3, properties of the parent changed in revision 4
+        binaryfiles.change(u'/trunk/d.dat', 3, False)
+        binaryfiles.change(u'/trunk', 4, False)
+        self.assertEqual((binaryfiles.get(u'/trunk/d.dat', 2), binaryfiles.get(u'/trunk/d.dat', 3)), (False, None))
+        binaryfiles.set(u'/trunk/d.dat', True, 3)
+        self.assertEqual(binaryfiles.get(u'/trunk/d.dat', 5), True)
+
+class HistoryTest(RepositoryTestCase):
+    '''
+    a file replaced by a directory and a file which becomes binary.
+    '''
+    def getRevisions(self, start):
+        day = datetime.timedelta(days=1)
+        return([
+            [dumpRevision(1, 'bob', start, 'add'),
+             dumpNode('trunk', 'dir', 'add', props={}),
+             dumpNode('trunk/x', 'file', 'add', text='a\n', props={}),
+             dumpNode('trunk/d.dat', 'file', 'add', text='a\nb\n', props={})],
+            [dumpRevision(2, 'bob', start + day, 'x becomes a directory'),
+             dumpNode('trunk/x', 'dir', 'replace', props={}),
+             dumpNode('trunk/x/y.c', 'file', 'add', text='y\n', props={})],
+            [dumpRevision(3, 'bob', start + day*2, 'd.dat becomes binary'),
+             dumpNode('trunk/x/y.c', 'file', 'change', text='y\nz\n'),
+             dumpNode('trunk/d.dat', 'file', 'change', props={'svn:mime-type':'application/octet-stream'})],
+            [dumpRevision(4, 'bob', start + day*3, 'copy the old file'),
+             dumpNode('trunk/d.dat', 'file', 'delete'),
+             dumpNode('trunk/old', 'file', 'add', copyfrom=('trunk/x', 1))],
+            [dumpRevision(5, 'bob', start + day*4, 'change the copy'),
+             dumpNode('trunk/old', 'file', 'change', text='a\nb\n')],
+        ])
+
+    def getKinds(self, project):
+        details = SVNLogDetail.objects.filter(svnlog__project=project)
+        return(dict([(row[:2], row[2]) for row in details.values_list('svnlog__revno', 'changedpath__path', 'pathtype')]))
+
+    def test_kind_and_mime_type_changes(self):
+        project = self.ingest('history')
+        kinds = self.getKinds(project)
+        self.assertEqual(kinds[(1, u'/trunk/x')], 'F')
+        self.assertEqual(kinds[(2, u'/trunk/x/')], 'D')
+        self.assertEqual(kinds[(4, u'/trunk/old')], 'F')
+        self.assertEqual(kinds[(5, u'/trunk/old')], 'F')
+        counts = getCounts(project)
+        self.assertEqual(counts[(3, u'/trunk/x/y.c')], ('R', 1, 0))
+        self.assertEqual(counts[(5, u'/trunk/old')], ('R', 1, 0))
+        self.assertEqual(counts[(1, u'/trunk/d.dat')], ('R', 3, 0))
+        #deleted after svn:mime-type made it binary
+        self.assertEqual(counts[(4, u'/trunk/d.dat')], ('R', 0, 0))
+
+    def test_stored_kinds(self):
+        project = self.ingest('history', until=3)
+        self.assertEqual(project.getStoredKind(u'/trunk/x', 1), (1, 'F'))
+        self.assertEqual(project.getStoredKind(u'/trunk/x', 5), (2, 'D'))
+        self.assertEqual(project.getStoredKind(u'/trunk/x/y.c', 5), (3, 'F'))
+        self.assertEqual(project.getStoredKind(u'/trunk/old', 5), None)
+
+class BinaryTest(RepositoryTestCase):
+    '''
+    a binary file without binary extension, changed with a text file and alone.
+    '''
+    def getRevisions(self, start):
+        day = datetime.timedelta(days=1)
+        return([
+            [dumpRevision(1, 'bob', start, 'add'),
+             dumpNode('trunk', 'dir', 'add', props={}),
+             dumpNode('trunk/a.c', 'file', 'add', text='a\n', props={}),
+             dumpNode('trunk/blob', 'file', 'add', text='x\ny\n', props={'svn:mime-type':'application/octet-stream'})],
+            [dumpRevision(2, 'bob', start + day, 'change both'),
+             dumpNode('trunk/a.c', 'file', 'change', text='a\nb\n'),
+             dumpNode('trunk/blob', 'file', 'change', text='x\nz\n')],
+            [dumpRevision(3, 'bob', start + day*2, 'change the blob'),
+             dumpNode('trunk/blob', 'file', 'change', text='z\n')],
+        ])
+
+    def test_binary_files_from_the_diffs(self):
+        profiler = Profiler()
+        svnclient = SVNLogClient(self.url, BINARYFILEXT, profiler=profiler)
+        project = createProject('binary', repository=self.url)
+        project.ConvertRevs(svnclient, 1, 3, workers=0)
+        counts = getCounts(project)
+        self.assertEqual([counts[(revno, u'/trunk/blob')] for revno in (1, 2, 3)], [('R', 0, 0)]*3)
+        self.assertEqual((counts[(1, u'/trunk/a.c')], counts[(2, u'/trunk/a.c')]), (('R', 2, 0), ('R', 1, 0)))
+        #svn marks the binary files in the revision and file diffs, no 'proplist' call is needed.
+        self.assertEqual(svnclient.binaryfiles.get(u'/trunk/blob', 3), True)
+        self.assertEqual(svnclient.binaryfiles.fallbacks, 0)
+        self.assertFalse('svn.proplist' in profiler.stats)
+
+class DumpTest(RepositoryTestCase):
+    '''
+    the dump of the repository is ingested as the repository itself.
+    '''
+    def getRevisions(self, start):
+        day = datetime.timedelta(days=1)
+        return([
+            [dumpRevision(1, 'bob', start, 'add'),
+             dumpNode('trunk', 'dir', 'add', props={}),
+             dumpNode('trunk/a.c', 'file', 'add', text='a\nb\nc\n', props={}),
+             dumpNode('trunk/b.c', 'file', 'add', text='b\n', props={}),
+             dumpNode('trunk/\xc3\xa9.c', 'file', 'add', text='e\n', props={}),
+             dumpNode('trunk/c.png', 'file', 'add', text='\x89PNG', props={})],
+            [dumpRevision(2, 'eve', start + day, 'change'),
+             dumpNode('trunk/a.c', 'file', 'change', text='a\nB\nc\nd\n'),
+             dumpNode('trunk/b.c', 'file', 'change', text='b\n\xe9t\xe9\n'),
+             dumpNode('trunk/\xc3\xa9.c', 'file', 'change', text='e\nf\n')],
+            [dumpRevision(3, 'bob', start + day*2, 'copy and delete'),
+             dumpNode('trunk/copy.c', 'file', 'add', copyfrom=('trunk/a.c', 2)),
+             dumpNode('trunk/b.c', 'file', 'delete')],
+            [dumpRevision(4, 'eve', start + day*3, 'change the copy'),
+             dumpNode('trunk/copy.c', 'file', 'change', text='a\nc\nd\n')],
+        ])
+
+    def getLogs(self, project):
+        svnlogs = SVNLog.objects.filter(project=project).order_by('revno')
+        return(list(svnlogs.values_list('revno', 'author', 'commitdate', 'addedfiles', 'changedfiles', 'deletedfiles')))
+
+    def test_same_rows_as_the_repository(self):
+        expected = self.ingest('log')
+        self.assertEqual(getCounts(expected)[(2, u'/trunk/a.c')], ('R', 2, 1))
+        #counted from the revision diff, which has a line that is not utf-8
+        self.assertEqual(getCounts(expected)[(2, u'/trunk/\xe9.c')], ('R', 1, 0))
+        for options in ((), ('--deltas',)):
+            project = createProject('dump' + ''.join(options), repository=self.url)
+            self.assertTrue(project.importDump(self.dump(*options), u''))
+            self.assertEqual(self.getLogs(project), self.getLogs(expected))
+            self.assertEqual(getCounts(project), getCounts(expected))
+            self.assertEqual(Project.objects.get(pk=project.pk).lastrev, 4)
+
+    def test_revisions_upto_the_watermark(self):
+        expected = self.ingest('log')
+        project = self.ingest('dump', until=2)
+        self.assertTrue(project.importDump(self.dump('--deltas'), u''))
+        self.assertEqual(self.getLogs(project), self.getLogs(expected))
+        self.assertEqual(getCounts(project), getCounts(expected))
@@ -1,47 +1,93 @@
 # Create your views here.
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.template import RequestContext
-from django.shortcuts import render_to_response, redirect
-from django.db.models import Sum, Count
+from django.template.loader import render_to_string
+from django.shortcuts import render_to_response, get_object_or_404
 import datetime
 
-from models import Project, SVNLog, SVNLogDetail
-from dbviews import AuthorContrib
+from models import Project, SVNLog, ProjectSummary
+from leaderboard import getLeaderboards, lastDays, DEFAULT_WINDOWS
+from rollups import getSummary
+from api import getDates, CHURN_DAYS
+import churn
+import dashboard
+
+def homeData(today):
+    '''
+    query results of the home page.
+    '''
+    projects = list(Project.objects.values('id', 'name', 'desc'))
+    summaries = dict(ProjectSummary.objects.values_list('project', 'contributors'))
+    for project in projects:
+        project['author_count'] = summaries.get(project['id'], 0)
+
+    #the windows end with yesterday, the revisions of today are not counted.
+    boards = getLeaderboards([lastDays(7, today), lastDays(30, today)])
+
+    commits = SVNLog.objects.values('author', 'msg', 'commitdate', 'project__name').order_by('-commitdate')[:6]
+    return {
+                'projects': projects,
+                'coders_week': boards[7],
+                'coders_month': boards[30],
+                'commits': list(commits),
+            }
 
 def home(request):
-    projects = Project.objects.values('name', 'desc')
-    projects = projects.annotate(author_count=Count('svnlog__author', distinct=True))
+    #the page is cached per data version and day, the windows move at midnight.
+    version = dashboard.getVersion()
+    today = datetime.date.today()
+    def render():
+        data = dashboard.getCached(dashboard.cacheKey('homedata', version, today), lambda: homeData(today))
+        return render_to_string('home.html', data, context_instance = RequestContext(request))
+    return HttpResponse(dashboard.getCached(dashboard.cacheKey('home', version, today), render))
+
+def projectData(project, today):
+    '''
+    query results of the project page.
+    '''
+    windows = [lastDays(days, today) for days in DEFAULT_WINDOWS]
+    boards = getLeaderboards(windows, project)
+    commits = SVNLog.objects.filter(project=project).values('author', 'msg', 'commitdate').order_by('-commitdate')[:10]
+    return {
+                'project': project,
+                'summary': getSummary(project),
+                'leaderboards': [(window, boards[window.name]) for window in windows],
+                'commits': list(commits),
+            }
 
-    #calculate day of one week ago
+def project(request, projectid):
+    project = get_object_or_404(Project, pk=projectid)
+    version = dashboard.getVersion()
     today = datetime.date.today()
-    lastweekday = today - datetime.timedelta(days=7)
-    lastmonthday = today - datetime.timedelta(days=30)
-    print 'stats week range: %s - %s' % (lastweekday.isoformat(), today.isoformat())
-    print 'stats month range: %s - %s' % (lastmonthday.isoformat(), today.isoformat())
-   
-    coders = AuthorContrib.objects.filter(commitdate__range=(lastmonthday, today))
-    coders = coders.values('author', 'display').annotate(linesadded=Sum('linesadded'))
-    coders = coders.annotate(linesdeleted=Sum('linesdeleted'))
-    coders = coders.order_by('-linesadded','-linesdeleted')[:10]
-
-    for coder in coders:
-        coder['percent'] = coder['linesadded']*100/coders[0]['linesadded'] 
-
-    coders_w = AuthorContrib.objects.filter(commitdate__range=(lastweekday, today))
-    coders_w = coders_w.values('author', 'display').annotate(linesadded=Sum('linesadded'))
-    coders_w = coders_w.annotate(linesdeleted=Sum('linesdeleted'))
-    coders_w = coders_w.order_by('-linesadded', '-linesdeleted')[:10]
-
-    for coder in coders_w:
-        coder['percent'] = coder['linesadded']*100/coders_w[0]['linesadded'] 
+    def render():
+        data = dashboard.getCached(dashboard.cacheKey('projectdata', version, project.pk, today),
+                                   lambda: projectData(project, today))
+        return render_to_string('project.html', data, context_instance = RequestContext(request))
+    return HttpResponse(dashboard.getCached(dashboard.cacheKey('project', version, project.pk, today), render))
 
-    commits = SVNLog.objects.values('author', 'msg', 'commitdate', 'project__name').order_by('-commitdate')[:6]
-    return render_to_response('home.html',
+def projectChurn(request, projectid):
+    '''
+    churn of a directory of the project and of its subdirectories, ?path=/trunk&start=..&end=..
+    '''
+    project = get_object_or_404(Project, pk=projectid)
+    try:
+        start, end = getDates(request, CHURN_DAYS)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+    total, children = churn.getChurn(project, request.GET.get('path'), start, end)
+    parents = []
+    parent = churn.getParent(total['path'])
+    while parent is not None:
+        parents.insert(0, parent)
+        parent = churn.getParent(parent)
+    return render_to_response('churn.html',
                     {
-                        'projects': projects,
-                        'coders_week': coders_w,
-                        'coders_month': coders,
-                        'commits': commits,
+                        'project': project,
+                        'total': total,
+                        'children': children,
+                        'parents': parents,
+                        'start': start,
+                        'end': end,
                     },
                     context_instance = RequestContext(request)
                     )
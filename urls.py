@@ -7,6 +7,11 @@ admin.autodiscover()
 urlpatterns = patterns('',
     # Examples:
     url(r'^$', 'svnstats.views.home', name='home'),
+    url(r'^project/(?P<projectid>\d+)/$', 'svnstats.views.project', name='project'),
+    url(r'^project/(?P<projectid>\d+)/churn/$', 'svnstats.views.projectChurn', name='project-churn'),
+    url(r'^api/projects/(?P<projectid>\d+)/series/$', 'svnstats.api.projectSeries', name='api-project-series'),
+    url(r'^api/authors/(?P<author>[^/]+)/series/$', 'svnstats.api.authorSeries', name='api-author-series'),
+    url(r'^api/projects/(?P<projectid>\d+)/churn/$', 'svnstats.api.projectChurn', name='api-project-churn'),
     # url(r'^stats/', include('stats.foo.urls')),
 
     # Uncomment the admin/doc line below to enable admin documentation: